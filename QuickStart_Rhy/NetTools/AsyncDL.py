@@ -0,0 +1,397 @@
+# coding=utf-8
+"""
+基于asyncio的下载引擎：单线程内维持成百上千个并发请求，优先使用aiohttp，未安装时使用标准库实现的HTTP/1.1客户端
+
+Asyncio download engine: hundreds of concurrent requests in one thread, uses aiohttp when installed and falls
+back to an HTTP/1.1 client built on the standard library
+"""
+import os
+import ssl
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse, urljoin
+from .NormalDL import Downloader, RemoteFileChanged, chunkSize
+from .. import user_lang, qs_default_console, qs_error_string, qs_warning_string, qs_info_string
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+def supports_proxy(proxy: str) -> bool:
+    """
+    asyncio引擎能否使用该代理：标准库客户端不支持代理，未安装aiohttp时提示调用者改用线程引擎
+
+    Whether the asyncio engine can use the proxy: the standard library client has no proxy support, so without
+    aiohttp the caller is told to fall back to the thread engine
+
+    :param proxy: 代理，如 ip:port
+    :return: bool
+    """
+    if proxy and not aiohttp:
+        qs_default_console.print(qs_warning_string, 'Proxy with the asyncio engine requires aiohttp, use the thread '
+                                 'engine' if user_lang != 'zh' else '异步引擎使用代理需要安装aiohttp，改用线程引擎')
+        return False
+    return True
+
+
+class _Response:
+    def __init__(self, status: int, headers: dict):
+        """
+        统一的响应对象（headers中键均为小写）
+
+        Unified response object (header keys are lower case)
+
+        :param status: 状态码
+        :param headers: 头部信息
+        """
+        self.status = status
+        self.headers = headers
+
+    async def read(self) -> bytes:
+        """
+        读取完整响应体（按块读取的iter_chunks由子类实现）
+
+        Read the whole body (subclasses implement iter_chunks, which reads it in chunks)
+
+        :return: bytes
+        """
+        return b''.join([chunk async for chunk in self.iter_chunks(chunkSize)])
+
+
+class _AiohttpResponse(_Response):
+    def __init__(self, resp):
+        super().__init__(resp.status, {k.lower(): v for k, v in resp.headers.items()})
+        self.resp = resp
+
+    async def iter_chunks(self, size: int):
+        async for chunk in self.resp.content.iter_chunked(size):
+            yield chunk
+
+
+class _StdlibResponse(_Response):
+    def __init__(self, status: int, headers: dict, reader):
+        super().__init__(status, headers)
+        self.reader = reader
+        self.done = False
+
+    async def iter_chunks(self, size: int):
+        if self.headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                length = int((await self.reader.readline()).split(b';')[0].strip() or b'0', 16)
+                if not length:
+                    while (await self.reader.readline()).strip():
+                        pass
+                    break
+                while length:
+                    chunk = await self.reader.read(min(size, length))
+                    if not chunk:
+                        raise ConnectionError('Connection closed')
+                    length -= len(chunk)
+                    yield chunk
+                await self.reader.readline()
+        elif 'content-length' in self.headers:
+            length = int(self.headers['content-length'])
+            while length:
+                chunk = await self.reader.read(min(size, length))
+                if not chunk:
+                    raise ConnectionError('Connection closed')
+                length -= len(chunk)
+                yield chunk
+        else:
+            while True:
+                chunk = await self.reader.read(size)
+                if not chunk:
+                    break
+                yield chunk
+        self.done = True
+
+
+class AsyncClient:
+    def __init__(self, limit: int, proxy: str = '', verify: bool = True):
+        """
+        异步HTTP客户端：优先使用aiohttp，否则使用标准库实现的HTTP/1.1长连接客户端（不支持代理）
+
+        Async HTTP client: aiohttp when available, otherwise a keep-alive HTTP/1.1 client on the standard library
+        (no proxy support)
+
+        :param limit: 最大连接数
+        :param proxy: 代理，如 ip:port
+        :param verify: 是否校验证书
+        """
+        self.limit = limit
+        self.proxy = 'http://' + proxy if proxy else None
+        self.ssl = None if verify else False
+        self.session = None
+        self.idle = {}
+        if not aiohttp:
+            if proxy:
+                raise ValueError('Proxy requires aiohttp' if user_lang != 'zh' else '使用代理需要安装aiohttp')
+            self.ssl = ssl.create_default_context()
+            if not verify:
+                self.ssl.check_hostname = False
+                self.ssl.verify_mode = ssl.CERT_NONE
+
+    async def __aenter__(self):
+        if aiohttp:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.limit, ssl=self.ssl))
+        return self
+
+    async def __aexit__(self, *args):
+        if self.session:
+            await self.session.close()
+        for conns in self.idle.values():
+            for reader, writer in conns:
+                writer.close()
+        self.idle.clear()
+
+    @asynccontextmanager
+    async def get(self, url: str, headers: dict):
+        """
+        发起GET请求（跟随重定向）
+
+        Send a GET request (redirects are followed)
+
+        :param url: url
+        :param headers: 请求头
+        :return: _Response 的异步上下文管理器 | async context manager of _Response
+        """
+        if self.session:
+            async with self.session.get(url, headers=headers, proxy=self.proxy) as resp:
+                yield _AiohttpResponse(resp)
+            return
+        for _ in range(5):
+            key, conn, resp = await self._request(url, headers)
+            if resp.status in (301, 302, 303, 307, 308) and 'location' in resp.headers:
+                await resp.read()
+                self._release(key, conn, resp)
+                url = urljoin(url, resp.headers['location'])
+                continue
+            try:
+                yield resp
+            finally:
+                self._release(key, conn, resp)
+            return
+        raise ConnectionError('Too many redirects')
+
+    async def _request(self, url: str, headers: dict):
+        info = urlparse(url)
+        https = info.scheme == 'https'
+        port = info.port or (443 if https else 80)
+        key = (info.hostname, port, https)
+        path = (info.path or '/') + ('?' + info.query if info.query else '')
+        request = 'GET %s HTTP/1.1\r\nHost: %s\r\nConnection: keep-alive\r\n' % (path, info.netloc) + \
+                  ''.join('%s: %s\r\n' % (k, v) for k, v in headers.items()) + '\r\n'
+        conn = None
+        while True:
+            fresh = not self.idle.get(key)
+            conn = await asyncio.open_connection(info.hostname, port, ssl=self.ssl if https else None) \
+                if fresh else self.idle[key].pop()
+            reader, writer = conn
+            try:
+                writer.write(request.encode('latin-1'))
+                await writer.drain()
+                status_line = await reader.readline()
+                if not status_line:
+                    raise ConnectionError('Connection closed')
+                break
+            except (ConnectionError, OSError):
+                writer.close()
+                if fresh:
+                    raise
+        status = int(status_line.split()[1])
+        resp_headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            k, v = line.split(':', 1)
+            resp_headers[k.strip().lower()] = v.strip()
+        if status_line.startswith(b'HTTP/1.0') and resp_headers.get('connection', '').lower() != 'keep-alive':
+            resp_headers['connection'] = 'close'  # * HTTP/1.0 默认不保持连接
+        return key, conn, _StdlibResponse(status, resp_headers, reader)
+
+    def _release(self, key, conn, resp: _StdlibResponse):
+        if resp.done and resp.headers.get('connection', '').lower() != 'close':
+            self.idle.setdefault(key, []).append(conn)
+        else:
+            conn[1].close()
+
+
+class AsyncDownloader(Downloader):
+    def run(self):
+        """
+        以asyncio引擎规划下载任务并开始下载：每个文件块一个Range请求，最多self.num个同时进行
+
+        Plan and run the download with the asyncio engine: one Range request per block, at most self.num at once
+
+        :return: None
+        """
+        if self.size <= 0:
+            return super().run()
+        if not self.shared:
+            self.main_progress.start()
+        self.main_progress.start_task(self.dl_id)
+        if not self.ckpt.count():
+            with open(self.name, "wb") as fp:
+                fp.truncate(self.size)
+        todo, done = [], 0
+        for i in range(self.ckpt.blocks):
+            if self.ckpt.is_done(i):
+                done += min(self.fileBlock, self.size - i * self.fileBlock)
+            else:
+                todo.append(i)
+        self._advance(done)
+        asyncio.run(self._run_async(todo))
+        self._close_output()
+        self.ckpt.close(remove=True)
+        try:
+            self._check_changed()
+            self._verify()
+        finally:
+            if self.shared:
+                self.main_progress.remove_task(self.dl_id)
+            else:
+                self.main_progress.stop()
+        qs_default_console.print(qs_info_string, self.name, 'download done!' if user_lang != 'zh' else '下载完成!')
+
+    async def _run_async(self, todo: list):
+        sem = asyncio.Semaphore(self.num)
+        async with AsyncClient(self.num, self.proxies.get('http', '')[len('http://'):]) as client:
+            await asyncio.gather(*[self._dl_block(client, sem, i) for i in todo])
+
+    async def _dl_block(self, client: AsyncClient, sem: asyncio.Semaphore, index: int):
+        """
+        下载一个文件块，失败后0.5秒重试直至成功，远程文件已变化时放弃
+
+        Download one block, retrying after 0.5 sec until it succeeds, giving up once the remote file has changed
+
+        :param client: AsyncClient
+        :param sem: 并发数限制
+        :param index: 块号
+        :return: None
+        """
+        start = index * self.fileBlock
+        end = min(start + self.fileBlock, self.size)
+        _headers = self.headers.copy()
+        _headers['Range'] = 'bytes={}-{}'.format(start, end - 1)
+        while not self.changed:
+            await sem.acquire()
+            mirror = self._pick_mirror()
+            tm = time.time()
+            try:
+                async with client.get(mirror.url, dict(_headers, **{'If-Range': mirror.validator})
+                                      if mirror.validator else _headers) as resp:
+                    if resp.status == 200 and mirror.validator:
+                        self.changed = True
+                        raise RemoteFileChanged(mirror.url)
+                    if resp.status != 206:
+                        raise ConnectionError('HTTP %d' % resp.status)
+                    pos, buf = start, bytearray()
+                    async for chunk in resp.iter_chunks(chunkSize):
+                        if self.limiter:
+                            await asyncio.sleep(self.limiter.delay(mirror.url, len(chunk)))
+                        chunk = chunk[:end - pos]
+                        if self.fd is not None:
+                            os.pwrite(self.fd, chunk, pos)
+                            if self.hasher:
+                                self.hasher.feed(pos, chunk)
+                        else:
+                            buf += chunk
+                        pos += len(chunk)
+                    if pos != end:
+                        raise ConnectionError('Incomplete block')
+                    if self.fd is None:  # * 写入队列满时new_job会阻塞，交给线程执行以免卡住事件循环
+                        await asyncio.get_running_loop().run_in_executor(None, self.writers.new_job, bytes(buf),
+                                                                         start)
+            except Exception as e:
+                sem.release()
+                self._release_mirror(mirror, None)
+                if self.changed:
+                    return
+                if self.output_error:
+                    qs_default_console.print(qs_error_string, repr(e))
+                self.retry_cnt += 1
+                if self.retry_cnt > 2:
+                    qs_default_console.print(qs_warning_string, 'Exists File Block Lost, Retrying after 0.5 sec'
+                                             if user_lang != 'zh' else '存在文件块丢失，0.5秒后重试')
+                await asyncio.sleep(0.5)
+                continue
+            sem.release()
+            self._release_mirror(mirror, (end - start) / max(time.time() - tm, 1e-3))
+            self._advance(end - start)
+            with self.schedLock:
+                self.ckpt.mark(index)
+                while self.prefix < self.ckpt.blocks and self.ckpt.is_done(self.prefix):
+                    self.prefix += 1
+            if self.hasher and self.fd is not None:  # * 补算摘要需要读文件
+                await asyncio.get_running_loop().run_in_executor(None, self.hasher.catch_up, self._prefix_size)
+            return
+
+
+async def m3u8_dl_async(m3u8: 'M3U8DL', jobs: list, concurrency: int):
+    """
+    以asyncio引擎下载M3U8的全部分片：最多concurrency个请求同时进行，在途分片数受m3u8.window_size限制
+
+    Download all M3U8 segments with the asyncio engine: at most concurrency requests at once, and the number of
+    segments in flight is bounded by m3u8.window_size
+
+    :param m3u8: QuickStart_Rhy.NetTools.M3u8DL.M3U8DL
+    :param jobs: 分片任务列表
+    :param concurrency: 最大并发请求数
+    :return: None
+    """
+    sem = asyncio.Semaphore(concurrency)
+    window = asyncio.Semaphore(m3u8.window_size)
+    proxy = m3u8.proxies.get('http', '')[len('http://'):]
+    tasks = set()
+
+    async def _fetch(client, job):
+        decryptor, content = m3u8.decryptor(job), []
+        async with client.get(job[0], m3u8.job_headers(job)) as resp:
+            if resp.status != (206 if job[3] else 200):
+                raise ConnectionError('HTTP %d' % resp.status)
+            async for chunk in resp.iter_chunks(chunkSize):
+                if m3u8.limiter:
+                    await asyncio.sleep(m3u8.limiter.delay(job[0], len(chunk)))
+                content.append(decryptor.update(chunk) if decryptor else chunk)
+        if decryptor:
+            content.append(decryptor.finalize())
+        return b''.join(content)
+
+    async def _one(client, job):
+        content, released = None, 1
+        try:
+            for attempt in range(m3u8.retries):
+                if m3u8.aborted:
+                    break
+                try:
+                    async with sem:
+                        content = await _fetch(client, job)
+                    break
+                except Exception as e:
+                    if attempt + 1 == m3u8.retries:
+                        m3u8.fail(job, e)
+                    else:
+                        await asyncio.sleep(m3u8.backoff(attempt))
+            if content is not None and not m3u8.aborted:
+                released = m3u8.save(job, content)
+                m3u8.main_progress.advance(m3u8.dl_id, 1)
+        except Exception as e:
+            m3u8.aborted, m3u8.error = True, m3u8.error or e
+        finally:
+            for _ in range(released):
+                window.release()
+
+    async with AsyncClient(concurrency, proxy, verify=False) as _client:
+        for _job in jobs:
+            await window.acquire()
+            if m3u8.aborted:
+                window.release()
+                break
+            task = asyncio.ensure_future(_one(_client, _job))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(list(tasks))
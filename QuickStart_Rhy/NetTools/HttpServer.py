@@ -4,17 +4,1078 @@ qs的http服务
 
 HTTP service of QS
 """
-from socketserver import ThreadingMixIn
+import io
+import os
+import re
+import html
+import json
+import time
+import shutil
+import socket
+import hmac
+import queue
+import email.utils
+import urllib.parse
+from threading import Lock, Thread, Event
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
 from http.server import SimpleHTTPRequestHandler
 from http.server import HTTPServer
-from .. import qs_default_console, qs_info_string
+from .. import qs_default_console, qs_info_string, user_root
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+compressible_types = ('application/json', 'application/javascript', 'application/xml', 'application/x-ndjson',
+                      'image/svg+xml', 'application/wasm')
+encoding_suffix = {'br': '.br', 'zstd': '.zst', 'gzip': '.gz'}  # * 按服务端偏好排序
+
+
+def compress_file(src: str, dst: str, encoding: str):
+    """
+    流式压缩文件
+
+    Compress a file in a streaming fashion
+
+    :param src: 源文件
+    :param dst: 目标文件
+    :param encoding: 'gzip' | 'br' | 'zstd'
+    :return: None
+    """
+    import gzip
+    with open(src, 'rb') as fi, open(dst, 'wb') as fo:
+        if encoding == 'gzip':
+            with gzip.GzipFile(fileobj=fo, mode='wb', compresslevel=6, mtime=0) as gz:
+                shutil.copyfileobj(fi, gz, 1 << 20)
+        elif encoding == 'br':
+            compressor = brotli.Compressor(quality=5)
+            for chunk in iter(lambda: fi.read(1 << 20), b''):
+                fo.write(compressor.process(chunk))
+            fo.write(compressor.finish())
+        else:
+            zstandard.ZstdCompressor(level=3).copy_stream(fi, fo)
+
+
+class CompressionCache:
+    def __init__(self, root: str = user_root + '.qs_http_cache', max_size: int = 256 << 20,
+                 max_total: int = 1 << 30):
+        """
+        压缩结果的磁盘缓存，以源文件路径、mtime与大小为键，源文件变化后自动重新压缩并删除旧版本；
+        缓存总大小超过max_total时按最近最少使用删除
+
+        On-disk cache of compressed variants keyed by source path, mtime and size; a changed source is compressed
+        again and its old variant is removed, and the least recently used variants are removed once the cache
+        grows beyond max_total
+
+        :param root: 缓存目录
+        :param max_size: 超过此大小的文件不做即时压缩
+        :param max_total: 缓存目录的最大总大小
+        """
+        self.root = root
+        self.max_size = max_size
+        self.max_total = max_total
+        self.lock = Lock()
+        self.key_locks = {}
+        self.entries = OrderedDict()  # * 缓存文件名 -> 大小，按最近使用排序
+        self.latest = {}  # * (源文件路径摘要, 编码后缀) -> 当前的缓存文件名
+        self.total = 0
+        self.encoders = ['gzip'] + (['br'] if brotli else []) + (['zstd'] if zstandard else [])
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        files = []
+        for entry in os.scandir(self.root):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            if entry.name.endswith('.tmp'):  # * 中断的压缩留下的临时文件（一小时内的可能属于其他qs http进程）
+                if time.time() - st.st_mtime > 3600:
+                    self._unlink(entry.name)
+                continue
+            files.append((st.st_mtime, entry.name, st.st_size))
+        for _, name, size in sorted(files):
+            self._add(name, size)
+        self._evict()
+
+    def _unlink(self, name: str):
+        try:
+            os.remove(os.path.join(self.root, name))
+        except OSError:
+            pass
+
+    def _add(self, name: str, size: int):
+        key = (name.split('-', 1)[0], os.path.splitext(name)[1])
+        old = self.latest.get(key)
+        if old and old != name:
+            self._remove(old)
+        self.latest[key] = name
+        self.total += size - self.entries.get(name, 0)
+        self.entries[name] = size
+        self.entries.move_to_end(name)
+
+    def _remove(self, name: str):
+        self.total -= self.entries.pop(name, 0)
+        key = (name.split('-', 1)[0], os.path.splitext(name)[1])
+        if self.latest.get(key) == name:
+            del self.latest[key]
+        self._unlink(name)
+
+    def _evict(self):
+        while self.total > self.max_total and len(self.entries) > 1:  # * 最近使用的一个总是保留
+            self._remove(next(iter(self.entries)))
+
+    def get(self, path: str, st: os.stat_result, encoding: str) -> str:
+        """
+        获取压缩后的文件，不存在时压缩生成
+
+        Get the compressed file, compressing it first when missing
+
+        :param path: 源文件
+        :param st: 源文件的stat
+        :param encoding: 编码
+        :return: 缓存文件路径
+        """
+        import hashlib
+        prefix = hashlib.sha1(os.path.abspath(path).encode('utf-8', 'surrogateescape')).hexdigest()
+        name = '%s-%x-%x%s' % (prefix, st.st_mtime_ns, st.st_size, encoding_suffix[encoding])
+        cached = os.path.join(self.root, name)
+        with self.lock:
+            hit = name in self.entries
+            if hit:
+                self.entries.move_to_end(name)
+        if hit and os.path.exists(cached):
+            return cached
+        with self.lock:
+            key_lock = self.key_locks.setdefault(name, Lock())
+        with key_lock:
+            if not os.path.exists(cached):
+                tmp = cached + '.%d.tmp' % id(key_lock)
+                compress_file(path, tmp, encoding)
+                os.replace(tmp, cached)
+            with self.lock:
+                self._add(name, os.path.getsize(cached))
+                self._evict()
+        with self.lock:
+            self.key_locks.pop(name, None)
+        return cached
+
+
+class DirectoryListingCache:
+    def __init__(self, max_dirs: int = 64):
+        """
+        目录列表缓存：按目录mtime失效，只缓存排好序的(名称, 是否目录)，大小与修改时间在分页时按需stat
+
+        Directory listing cache invalidated by the directory mtime; only the sorted (name, is_dir) pairs are cached,
+        sizes and modification times are stat-ed per page on demand
+
+        :param max_dirs: 最多缓存的目录数
+        """
+        self.max_dirs = max_dirs
+        self.lock = Lock()
+        self.entries = OrderedDict()
+
+    def get(self, path: str) -> list:
+        """
+        获取目录列表
+
+        Get the directory listing
+
+        :param path: 目录路径
+        :return: [(名称, 是否目录)]
+        """
+        st = os.stat(path)
+        with self.lock:
+            hit = self.entries.get(path)
+            if hit and hit[0] == st.st_mtime_ns:
+                self.entries.move_to_end(path)
+                return hit[1]
+        listing = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    listing.append((entry.name, entry.is_dir()))
+                except OSError:
+                    continue
+        listing.sort(key=lambda a: a[0].lower())
+        # * mtime精度可能只有1秒，刚刚修改过的目录不缓存，避免同一秒内的后续修改被漏掉
+        if time.time() - st.st_mtime > 1:
+            with self.lock:
+                self.entries[path] = (st.st_mtime_ns, listing)
+                self.entries.move_to_end(path)
+                while len(self.entries) > self.max_dirs:
+                    self.entries.popitem(last=False)
+        return listing
+
+
+def merge_ranges(ranges: list, start: int, end: int) -> list:
+    """
+    将[start, end)并入有序且不相交的区间列表
+
+    Merge [start, end) into a sorted list of disjoint spans
+
+    :param ranges: [[start, end]]
+    :param start: 起始位置
+    :param end: 结束位置（不含）
+    :return: 合并后的区间列表
+    """
+    res = []
+    for s, e in sorted(ranges + [[start, end]]):
+        if res and s <= res[-1][1]:
+            res[-1][1] = max(res[-1][1], e)
+        else:
+            res.append([s, e])
+    return res
+
+
+class UploadStore:
+    def __init__(self):
+        """
+        分块上传的状态：数据直接写入预分配的 <文件>.qs_upload，已接收区间记录在 <文件>.qs_upload.json 中以便断点续传，
+        全部区间到齐后原子替换为目标文件
+
+        State of chunked uploads: data goes straight into the preallocated <file>.qs_upload, received spans are
+        recorded in <file>.qs_upload.json for resuming, and the file is atomically renamed once every span arrived
+        """
+        self.lock = Lock()
+        self.states = {}
+
+    def _load(self, path: str):
+        if path not in self.states:
+            try:
+                with open(path + '.qs_upload.json') as f:
+                    self.states[path] = json.load(f)
+            except (OSError, ValueError):
+                return None
+        return self.states[path]
+
+    def _save(self, path: str):
+        tmp = path + '.qs_upload.json.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.states[path], f)
+        os.replace(tmp, path + '.qs_upload.json')
+
+    def status(self, path: str) -> dict:
+        """
+        查询上传状态
+
+        Query the upload state
+
+        :param path: 目标文件
+        :return: {'size': 总大小, 'received': 已接收区间, 'complete': 是否完成}
+        """
+        with self.lock:
+            state = self._load(path)
+            if state:
+                return {'size': state['size'], 'received': state['ranges'], 'complete': False}
+        if os.path.isfile(path):
+            size = os.path.getsize(path)
+            return {'size': size, 'received': [[0, size]] if size else [], 'complete': True}
+        return {'size': -1, 'received': [], 'complete': False}
+
+    def begin(self, path: str, size: int) -> str:
+        """
+        开始（或继续）一次分块上传，首次调用时预分配文件
+
+        Begin (or continue) a chunked upload, preallocating the file on the first call
+
+        :param path: 目标文件
+        :param size: 文件总大小
+        :return: 数据文件路径
+        """
+        with self.lock:
+            state = self._load(path)
+            if state and state['size'] != size:
+                raise ValueError('size mismatch: %d != %d' % (state['size'], size))
+            if not state:
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                with open(path + '.qs_upload', 'wb') as f:
+                    f.truncate(size)
+                self.states[path] = {'size': size, 'ranges': []}
+                self._save(path)
+        return path + '.qs_upload'
+
+    def commit(self, path: str, start: int, end: int) -> dict:
+        """
+        记录已写入的区间，全部到齐时完成上传
+
+        Record a written span and finish the upload once everything arrived
+
+        :param path: 目标文件
+        :param start: 起始位置
+        :param end: 结束位置（不含）
+        :return: 上传状态
+        """
+        with self.lock:
+            state = self._load(path)
+            if not state:
+                raise ValueError('upload not found')
+            state['ranges'] = merge_ranges(state['ranges'], start, end)
+            if state['ranges'] == [[0, state['size']]] or state['size'] == 0:
+                os.replace(path + '.qs_upload', path)
+                os.remove(path + '.qs_upload.json')
+                self.states.pop(path)
+                return {'size': state['size'], 'received': state['ranges'], 'complete': True}
+            self._save(path)
+            return {'size': state['size'], 'received': state['ranges'], 'complete': False}
+
+
+class AccessLog:
+    def __init__(self, path: str, flush_interval: float = 1.0, max_pending: int = 65536):
+        """
+        JSON lines格式的访问日志，由后台线程批量写入，请求线程只做非阻塞入队（队列满时丢弃并计数）
+
+        Access log in JSON lines, written in batches by a background thread; request threads only enqueue without
+        blocking (records are dropped and counted when the queue is full)
+
+        :param path: 日志文件
+        :param flush_interval: 最长刷新间隔（秒）
+        :param max_pending: 最多排队的记录数
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(max_pending)
+        self.lock = Lock()
+        self.dropped = 0
+        self.file = open(path, 'a', encoding='utf-8', buffering=1 << 16)
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, record: dict):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.lock:  # * 多个请求线程同时丢弃时计数不能丢失
+                self.dropped += 1
+
+    def _run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self.file.flush()
+                continue
+            while record is not None:
+                self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if record is None:
+                break
+        self.file.close()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join(5)
+
+
+class Metrics:
+    max_labels = 512  # * 每类标签最多记录的取值数，超出的归入 __other__，避免路径过多撑爆内存
+
+    def __init__(self):
+        """
+        请求计数器：按方法/状态码、路径与客户端统计请求数、收发字节数与耗时
+
+        Request counters: requests, bytes sent/received and latency by method/status, path and client
+        """
+        self.lock = Lock()
+        self.started = time.time()
+        self.inflight = 0
+        self.requests = {}  # * (method, code) -> count
+        self.paths = {}  # * path -> [requests, sent, seconds]
+        self.clients = {}  # * client -> [requests, sent, received]
+        self.sent = 0
+        self.received = 0
+
+    def _slot(self, table: dict, key: str, size: int) -> list:
+        if key not in table and len(table) >= self.max_labels:
+            key = '__other__'
+        return table.setdefault(key, [0] * size)
+
+    def begin(self):
+        with self.lock:
+            self.inflight += 1
+
+    def record(self, method: str, code: int, path: str, client: str, sent: int, received: int, seconds: float):
+        """
+        记录一次完成的请求
+
+        Record a finished request
+
+        :param method: 请求方法
+        :param code: 状态码
+        :param path: 请求路径
+        :param client: 客户端ip
+        :param sent: 发送的响应体字节数
+        :param received: 接收的请求体字节数
+        :param seconds: 耗时
+        :return: None
+        """
+        with self.lock:
+            self.inflight -= 1
+            self.requests[(method, code)] = self.requests.get((method, code), 0) + 1
+            slot = self._slot(self.paths, path, 3)
+            slot[0], slot[1], slot[2] = slot[0] + 1, slot[1] + sent, slot[2] + seconds
+            slot = self._slot(self.clients, client, 3)
+            slot[0], slot[1], slot[2] = slot[0] + 1, slot[1] + sent, slot[2] + received
+            self.sent += sent
+            self.received += received
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {'time': time.time(), 'inflight': self.inflight, 'sent': self.sent, 'received': self.received,
+                    'requests': dict(self.requests), 'paths': {k: list(v) for k, v in self.paths.items()},
+                    'clients': {k: list(v) for k, v in self.clients.items()}}
+
+    def prometheus(self, dropped: int = 0) -> str:
+        """
+        导出Prometheus文本格式
+
+        Export in the Prometheus text format
+
+        :param dropped: 访问日志丢弃的记录数
+        :return: 指标文本
+        """
+        def label(value) -> str:
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        snap = self.snapshot()
+        lines = ['# TYPE qs_http_uptime_seconds gauge', 'qs_http_uptime_seconds %.3f' % (snap['time'] - self.started),
+                 '# TYPE qs_http_inflight_requests gauge', 'qs_http_inflight_requests %d' % snap['inflight'],
+                 '# TYPE qs_http_sent_bytes_total counter', 'qs_http_sent_bytes_total %d' % snap['sent'],
+                 '# TYPE qs_http_received_bytes_total counter', 'qs_http_received_bytes_total %d' % snap['received'],
+                 '# TYPE qs_http_access_log_dropped_total counter', 'qs_http_access_log_dropped_total %d' % dropped,
+                 '# TYPE qs_http_requests_total counter']
+        lines += ['qs_http_requests_total{method="%s",code="%s"} %d' % (label(method), code, count)
+                  for (method, code), count in sorted(snap['requests'].items(), key=str)]
+        for name, index, kind in (('requests_total', 0, 'counter'), ('sent_bytes_total', 1, 'counter'),
+                                  ('duration_seconds_sum', 2, 'counter')):
+            lines.append('# TYPE qs_http_path_%s %s' % (name, kind))
+            lines += ['qs_http_path_%s{path="%s"} %s' % (name, label(path), round(value[index], 6))
+                      for path, value in sorted(snap['paths'].items())]
+        for name, index in (('requests_total', 0), ('sent_bytes_total', 1), ('received_bytes_total', 2)):
+            lines.append('# TYPE qs_http_client_%s counter' % name)
+            lines += ['qs_http_client_%s{client="%s"} %d' % (name, label(client), value[index])
+                      for client, value in sorted(snap['clients'].items())]
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsPanel:
+    def __init__(self, metrics: Metrics, interval: float = 1.0, top: int = 8):
+        """
+        终端实时面板：展示总吞吐与占用带宽最多的客户端和路径
+
+        Live terminal panel showing the total throughput and the clients and paths using the most bandwidth
+
+        :param metrics: Metrics
+        :param interval: 刷新间隔（秒）
+        :param top: 每个表格展示的条目数
+        """
+        self.metrics = metrics
+        self.interval = interval
+        self.top = top
+        self.stopped = Event()
+        self.thread = None
+
+    def _render(self, prev: dict, cur: dict):
+        from rich.table import Table
+        from . import size_format
+        span = max(cur['time'] - prev['time'], 1e-6)
+
+        def table(title: str, key: str, columns: tuple):
+            res = Table(title=title, expand=True)
+            for column in columns:
+                res.add_column(column, justify='left' if column == columns[0] else 'right', overflow='fold')
+            rates = sorted(((name, (value[1] - prev[key].get(name, [0, 0, 0])[1]) / span, value)
+                            for name, value in cur[key].items()), key=lambda i: (-i[1], -i[2][1]))[:self.top]
+            for name, rate, value in rates:
+                res.add_row(name, size_format(rate) + '/s', str(value[0]), size_format(value[1]),
+                            size_format(value[2]) if key == 'clients' else '%.1f ms' % (value[2] / value[0] * 1000))
+            return res
+
+        grid = Table.grid(expand=True)
+        grid.add_row('[bold]%s[/]  out %s/s  in %s/s  in-flight %d  sent %s' % (
+            'QS HTTP', size_format((cur['sent'] - prev['sent']) / span),
+            size_format((cur['received'] - prev['received']) / span), cur['inflight'], size_format(cur['sent'])))
+        grid.add_row(table('Clients', 'clients', ('client', 'out/s', 'requests', 'sent', 'received')))
+        grid.add_row(table('Paths', 'paths', ('path', 'out/s', 'requests', 'sent', 'avg latency')))
+        return grid
+
+    def _run(self):
+        from rich.live import Live
+        prev = self.metrics.snapshot()
+        with Live(self._render(prev, prev), console=qs_default_console, refresh_per_second=4) as live:
+            while not self.stopped.wait(self.interval):
+                cur = self.metrics.snapshot()
+                live.update(self._render(prev, cur))
+                prev = cur
+
+    def start(self):
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join(2)
+
+
+class QSHTTPRequestHandler(SimpleHTTPRequestHandler):
+    """
+    静态文件请求处理：HTTP/1.1长连接，文件内容通过os.sendfile发送，支持Range/If-Range/If-None-Match与ETag
+
+    Static file handler: HTTP/1.1 keep-alive, file bodies are sent with os.sendfile, supports
+    Range/If-Range/If-None-Match and ETags
+    """
+    protocol_version = 'HTTP/1.1'
+    timeout = 30  # * 空闲的长连接在30秒后关闭，线程池已满且有连接排队时立即关闭，归还工作线程
+    extensions_map = dict(SimpleHTTPRequestHandler.extensions_map, **{
+        '.log': 'text/plain', '.jsonl': 'application/x-ndjson', '.ndjson': 'application/x-ndjson'
+    })
+    compression = None  # * CompressionCache，为None时不做即时压缩
+    listings = DirectoryListingCache()
+    upload_token = ''  # * 非空时开启PUT/POST上传，请求需携带 Authorization: Bearer <token>
+    uploads = UploadStore()
+    metrics = Metrics()
+    access_log = None  # * AccessLog，为None时不写访问日志
+    quiet = False  # * 关闭默认的stderr日志（实时面板开启时）
+    page_size = 1000  # * 目录列表每页的默认条目数
+
+    def send_head(self):
+        """
+        发送响应头，返回待发送的文件对象（self.range记录待发送的区间）
+
+        Send the response headers and return the file object to send (self.range records the span to send)
+
+        :return: 文件对象或None
+        """
+        self.range = None
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            if not urllib.parse.urlsplit(self.path).path.endswith('/'):
+                return super().send_head()
+            for index in 'index.html', 'index.htm':
+                if os.path.isfile(os.path.join(path, index)):
+                    path = os.path.join(path, index)
+                    break
+            else:
+                return super().send_head()
+        if path.endswith('/'):
+            self.send_error(HTTPStatus.NOT_FOUND, 'File not found')
+            return None
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, 'File not found')
+            return None
+        try:
+            st = os.fstat(f.fileno())
+            ctype = self.guess_type(path)
+            f, size, encoding, vary = self._negotiate(path, f, st, ctype)
+            etag = '"%x-%x%s"' % (st.st_mtime_ns, st.st_size, '-' + encoding if encoding else '')
+            last_modified = self.date_time_string(int(st.st_mtime))
+            if self._not_modified(etag, st.st_mtime):
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', last_modified)
+                self.end_headers()
+                f.close()
+                return None
+            start, end, code = 0, size, HTTPStatus.OK
+            if 'Range' in self.headers and self._if_range(etag, last_modified):
+                span = self._parse_range(self.headers['Range'], size)
+                if span == ():
+                    self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                    self.send_header('Content-Range', 'bytes */%d' % size)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    f.close()
+                    return None
+                if span:
+                    start, end, code = span[0], span[1], HTTPStatus.PARTIAL_CONTENT
+            self.send_response(code)
+            self.send_header('Content-Type', ctype)
+            self.send_header('Content-Length', str(end - start))
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            if vary:
+                self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Last-Modified', last_modified)
+            self.send_header('ETag', etag)
+            self.send_header('Accept-Ranges', 'bytes')
+            if code == HTTPStatus.PARTIAL_CONTENT:
+                self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end - 1, size))
+            self.end_headers()
+            self.range = (start, end - start)
+            return f
+        except Exception:
+            f.close()
+            raise
+
+    def list_directory(self, path: str):
+        """
+        分页的目录列表，?page=<n>&size=<m> 翻页，?format=json 或 Accept: application/json 时返回JSON
+
+        Paginated directory listing: ?page=<n>&size=<m> selects the page, ?format=json or Accept: application/json
+        returns JSON
+
+        :param path: 目录路径
+        :return: 文件对象或None
+        """
+        try:
+            listing = self.listings.get(path)
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, 'No permission to list directory')
+            return None
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        try:
+            size = max(1, int(query.get('size', [self.page_size])[0]))
+            page = max(1, int(query.get('page', [1])[0]))
+        except ValueError:
+            self.send_error(HTTPStatus.BAD_REQUEST, 'Invalid page')
+            return None
+        pages = max(1, (len(listing) + size - 1) // size)
+        items = []
+        for name, is_dir in listing[(page - 1) * size: page * size]:
+            try:
+                st = os.stat(os.path.join(path, name))
+                items.append({'name': name, 'dir': is_dir, 'size': 0 if is_dir else st.st_size,
+                              'mtime': int(st.st_mtime)})
+            except OSError:
+                items.append({'name': name, 'dir': is_dir, 'size': 0, 'mtime': 0})
+        try:
+            display_path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path, errors='surrogatepass')
+        except UnicodeDecodeError:
+            display_path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        if query.get('format', [''])[0] == 'json' or 'application/json' in self.headers.get('Accept', ''):
+            ctype = 'application/json'
+            body = json.dumps({'path': display_path, 'page': page, 'pages': pages, 'size': size,
+                               'total': len(listing), 'entries': items}, ensure_ascii=False)
+        else:
+            ctype = 'text/html'
+            title = 'Directory listing for %s' % html.escape(display_path, quote=False)
+            lines = ['<!DOCTYPE HTML>', '<html>', '<head>', '<meta charset="utf-8">', '<title>%s</title>' % title,
+                     '</head>', '<body>', '<h1>%s</h1>' % title, '<hr>', '<ul>']
+            for item in items:
+                name = item['name'] + ('/' if item['dir'] else '')
+                lines.append('<li><a href="%s">%s</a></li>' % (
+                    urllib.parse.quote(name, errors='surrogatepass'), html.escape(name, quote=False)))
+            lines.append('</ul>')
+            if pages > 1:
+                nav = ['<a href="?page=%d&size=%d">%s</a>' % (i, size, text)
+                       for i, text in ((page - 1, '&laquo;'), (page + 1, '&raquo;')) if 1 <= i <= pages]
+                lines.append('<p>%s %d / %d %s</p>' % (nav[0] if page > 1 else '', page, pages,
+                                                        nav[-1] if page < pages else ''))
+            lines += ['<hr>', '</body>', '</html>']
+            body = '\n'.join(lines)
+        encoded = body.encode('utf-8', 'surrogateescape')
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', '%s; charset=utf-8' % ctype)
+        self.send_header('Content-Length', str(len(encoded)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        return io.BytesIO(encoded)
+
+    def _negotiate(self, path: str, f, st: os.stat_result, ctype: str):
+        """
+        内容编码协商：仅对可压缩类型生效，优先使用已存在且不旧于源文件的 .br/.zst/.gz 兄弟文件，其次使用压缩缓存
+
+        Content-Encoding negotiation, only for compressible types: an existing .br/.zst/.gz sibling not older than
+        the source comes first, then the compression cache
+
+        :param path: 文件路径
+        :param f: 已打开的源文件
+        :param st: 源文件的stat
+        :param ctype: Content-Type
+        :return: (待发送的文件, 大小, 编码 | '', 是否需要 Vary: Accept-Encoding)
+        """
+        if not (ctype.startswith('text/') or ctype in compressible_types):  # * 已压缩的格式(如.tar.gz)原样发送
+            return f, st.st_size, '', False
+        compressible = self.compression is not None and st.st_size >= 1024
+        accepted = {}
+        for item in self.headers.get('Accept-Encoding', '').split(','):
+            name, _, params = item.partition(';')
+            q = re.search(r'q\s*=\s*([\d.]+)', params)
+            accepted[name.strip().lower()] = float(q.group(1)) if q else 1.0
+        candidates = sorted([i for i in encoding_suffix if accepted.get(i, accepted.get('*', 0)) > 0],
+                            key=lambda i: -accepted.get(i, accepted.get('*', 0)))
+        vary = compressible
+        for encoding in candidates:
+            try:
+                sibling = os.stat(path + encoding_suffix[encoding])
+            except OSError:
+                continue
+            vary = True
+            if sibling.st_mtime >= st.st_mtime:
+                f.close()
+                return open(path + encoding_suffix[encoding], 'rb'), sibling.st_size, encoding, True
+        if compressible and st.st_size <= self.compression.max_size:
+            for encoding in candidates:
+                if encoding in self.compression.encoders:
+                    cached = self.compression.get(path, st, encoding)
+                    f.close()
+                    f = open(cached, 'rb')
+                    return f, os.fstat(f.fileno()).st_size, encoding, True
+        return f, st.st_size, '', vary
+
+    def _not_modified(self, etag: str, mtime: float) -> bool:
+        if 'If-None-Match' in self.headers:
+            tags = [i.strip() for i in self.headers['If-None-Match'].split(',')]
+            return '*' in tags or etag in tags or 'W/' + etag in tags
+        if 'If-Modified-Since' in self.headers:
+            try:
+                since = email.utils.parsedate_to_datetime(self.headers['If-Modified-Since'])
+            except (TypeError, IndexError, OverflowError, ValueError):
+                return False
+            return since is not None and int(mtime) <= since.timestamp()
+        return False
+
+    def _if_range(self, etag: str, last_modified: str) -> bool:
+        if 'If-Range' not in self.headers:
+            return True
+        value = self.headers['If-Range'].strip()
+        return value == etag or value == last_modified
+
+    @staticmethod
+    def _parse_range(value: str, size: int):
+        """
+        解析单区间Range头
+
+        Parse a single-range Range header
+
+        :param value: Range头
+        :param size: 文件大小
+        :return: (start, end) | None (忽略Range，返回整个文件) | () (无法满足)
+        """
+        match = re.fullmatch(r'\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*', value)
+        if not match or not any(match.groups()):  # * 多区间或非法格式时返回整个文件
+            return None
+        first, last = match.groups()
+        if not first:
+            length = int(last)
+            return (max(0, size - length), size) if length and size else ()
+        first = int(first)
+        if first >= size:
+            return ()
+        last = min(int(last), size - 1) if last else size - 1
+        return (first, last + 1) if last >= first else None
+
+    def copyfile(self, source, outputfile):
+        """
+        发送响应体：文件使用os.sendfile零拷贝发送（不支持的平台上socket.sendfile会回退到send）
+
+        Send the body: files go through zero-copy os.sendfile (socket.sendfile falls back to send on platforms
+        without it)
+
+        :param source: 文件对象
+        :param outputfile: 输出流
+        :return: None
+        """
+        if not getattr(self, 'range', None):
+            start = source.tell()
+            shutil.copyfileobj(source, outputfile)
+            self.sent += source.tell() - start
+            return
+        try:
+            self.sent += self.connection.sendfile(source, *self.range)  # * 带超时的socket上会等待可写后继续os.sendfile
+        except (BrokenPipeError, ConnectionResetError, socket.timeout):
+            self.close_connection = True
+
+    def parse_request(self) -> bool:
+        if not super().parse_request():
+            return False
+        self.begin = time.perf_counter()  # * 从请求行解析完成开始计时，长连接上的空闲等待不计入
+        self.metrics.begin()
+        return True
+
+    def handle(self):
+        """
+        处理长连接上的全部请求，请求之间的空闲等待见 _wait_request
+
+        Serve every request of a keep-alive connection, see _wait_request for the idle wait between requests
+
+        :return: None
+        """
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self._wait_request():
+            self.handle_one_request()
+
+    def _wait_request(self) -> bool:
+        """
+        等待长连接上的下一个请求：每0.5秒检查一次线程池，有连接在排队时关闭这个空闲连接，让出工作线程
+
+        Wait for the next request on a keep-alive connection: the pool is checked every 0.5 sec and this idle
+        connection is closed to free its worker while other connections are queued
+
+        :return: 是否有下一个请求
+        """
+        import select
+        self.connection.settimeout(0)
+        try:
+            if self.rfile.peek(1):  # * 已缓冲的流水线请求不会让select返回
+                return True
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            remain = deadline - time.monotonic()
+            if remain <= 0:
+                return False
+            if select.select([self.connection], [], [], min(remain, 0.5))[0]:
+                return True
+            if getattr(self.server, 'queued', 0):
+                return False
+
+    def handle_one_request(self):
+        """
+        处理一个请求并记录指标与访问日志
+
+        Handle one request and record its metrics and access log entry
+
+        :return: None
+        """
+        self.begin, self.status, self.sent, self.received = None, None, 0, 0
+        try:
+            super().handle_one_request()
+        finally:
+            if self.begin is not None:
+                seconds = time.perf_counter() - self.begin
+                path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+                self.metrics.record(self.command, self.status or 0, path, self.client_address[0], self.sent,
+                                    self.received, seconds)
+                if self.access_log:
+                    self.access_log.write({
+                        'time': round(time.time(), 3), 'client': self.client_address[0], 'method': self.command,
+                        'path': self.path, 'status': self.status, 'sent': self.sent, 'received': self.received,
+                        'ms': round(seconds * 1000, 3), 'agent': self.headers.get('User-Agent', '')
+                    })
+
+    def log_request(self, code='-', size='-'):
+        if isinstance(code, int):
+            self.status = int(code)
+        super().log_request(code, size)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        if urllib.parse.urlsplit(self.path).path == '/__qs_metrics':
+            body = self.metrics.prometheus(self.access_log.dropped if self.access_log else 0).encode()
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            self.wfile.write(body)
+            self.sent += len(body)
+            return
+        if self.upload_token and 'upload' in urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query,
+                                                                   keep_blank_values=True):
+            if self._authorized():
+                self._send_json(HTTPStatus.OK, self.uploads.status(self.translate_path(self.path)))
+            return
+        super().do_GET()
+
+    def do_PUT(self):
+        """
+        上传文件：带 Content-Range: bytes <start>-<end>/<size> 时写入对应区间（可并行、可续传），否则写入整个文件；
+        请求体可以是Content-Length或chunked编码
+
+        Upload a file: with Content-Range: bytes <start>-<end>/<size> the span is written in place (parallel and
+        resumable), otherwise the whole file is replaced; bodies may use Content-Length or chunked encoding
+
+        :return: None
+        """
+        if not self.upload_token:
+            self.close_connection = True
+            self.send_error(HTTPStatus.METHOD_NOT_ALLOWED, 'Upload is disabled')
+            return
+        if not self._authorized():
+            return
+        path = self.translate_path(self.path)
+        if path.endswith('/') or os.path.isdir(path) or path.endswith(('.qs_upload', '.qs_upload.json')):
+            self.close_connection = True
+            self.send_error(HTTPStatus.FORBIDDEN, 'Invalid upload path')
+            return
+        span = re.match(r'bytes\s+(\d+)-(\d+)/(\d+)$', self.headers.get('Content-Range', '').strip())
+        try:
+            if span:
+                start, end, size = int(span.group(1)), int(span.group(2)) + 1, int(span.group(3))
+                if end > size or start >= end:
+                    raise ValueError('invalid Content-Range')
+                data_path = self.uploads.begin(path, size)
+                self.received = self._receive(data_path, start)
+                if self.received != end - start:
+                    raise ValueError('body length does not match Content-Range')
+                state = self.uploads.commit(path, start, end)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                data_path = '%s.qs_upload.%x' % (path, id(self))
+                try:
+                    with open(data_path, 'wb'):
+                        pass
+                    size = self.received = self._receive(data_path, 0)
+                    os.replace(data_path, path)
+                finally:
+                    if os.path.exists(data_path):
+                        os.remove(data_path)
+                state = {'size': size, 'received': [[0, size]] if size else [], 'complete': True}
+        except ValueError as e:
+            self.close_connection = True
+            self.send_error(HTTPStatus.CONFLICT if 'mismatch' in str(e) else HTTPStatus.BAD_REQUEST, str(e))
+            return
+        except OSError as e:
+            self.close_connection = True
+            self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR, str(e))
+            return
+        self._send_json(HTTPStatus.CREATED if state['complete'] else HTTPStatus.ACCEPTED, state)
+
+    do_POST = do_PUT
+
+    def _authorized(self) -> bool:
+        scheme, _, token = self.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(token.strip().encode(), self.upload_token.encode()):
+            return True
+        self.close_connection = True
+        self.send_response(HTTPStatus.UNAUTHORIZED)
+        self.send_header('WWW-Authenticate', 'Bearer')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        return False
+
+    def _receive(self, path: str, offset: int) -> int:
+        """
+        将请求体写入文件的offset处
+
+        Write the request body into the file at offset
+
+        :param path: 文件路径
+        :param offset: 写入位置
+        :return: 写入的字节数
+        """
+        fd = os.open(path, os.O_WRONLY | getattr(os, 'O_BINARY', 0))
+        written = 0
+        try:
+            for chunk in self._body():
+                if hasattr(os, 'pwrite'):
+                    view = memoryview(chunk)
+                    while view:
+                        n = os.pwrite(fd, view, offset + written)
+                        view, written = view[n:], written + n
+                else:
+                    os.lseek(fd, offset + written, os.SEEK_SET)
+                    os.write(fd, chunk)
+                    written += len(chunk)
+        finally:
+            os.close(fd)
+        return written
+
+    def _body(self):
+        """
+        逐块读取请求体（Content-Length或Transfer-Encoding: chunked）
+
+        Read the request body piece by piece (Content-Length or Transfer-Encoding: chunked)
+
+        :return: bytes生成器
+        """
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            while True:
+                line = self.rfile.readline(65537)
+                try:
+                    left = int(line.split(b';')[0].strip(), 16)
+                except ValueError:
+                    raise ValueError('invalid chunk size')
+                if not left:
+                    while self.rfile.readline(65537) not in (b'\r\n', b'\n', b''):  # * 忽略trailer
+                        pass
+                    return
+                while left:
+                    chunk = self.rfile.read(min(left, 1 << 20))
+                    if not chunk:
+                        raise ValueError('incomplete chunk')
+                    left -= len(chunk)
+                    yield chunk
+                self.rfile.readline(3)
+        left = int(self.headers.get('Content-Length', 0))
+        while left:
+            chunk = self.rfile.read(min(left, 1 << 20))
+            if not chunk:
+                raise ValueError('incomplete body')
+            left -= len(chunk)
+            yield chunk
+
+    def _send_json(self, code: int, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.sent += len(body)
+
+
+class PooledHTTPServer(HTTPServer):
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler, workers: int = 64):
+        """
+        使用固定大小线程池处理连接的HTTP服务器
+
+        HTTP server handling connections with a fixed size thread pool
+
+        :param server_address: (ip, port)
+        :param handler: 请求处理类
+        :param workers: 工作线程数
+        """
+        super().__init__(server_address, handler)
+        self.pool = ThreadPoolExecutor(workers)
+        self.lock = Lock()
+        self.queued = 0  # * 等待工作线程的连接数，大于0时空闲的长连接让出线程
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.queued += 1
+        self.pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        with self.lock:
+            self.queued -= 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def handle_error(self, request, client_address):
+        import sys
+        if isinstance(sys.exc_info()[1], (ConnectionError, socket.timeout)):  # * 客户端断开长连接属于正常情况
+            return
+        super().handle_error(request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
 
 
 class HttpServers:
     import qrcode_terminal
     import signal
 
-    def __init__(self, ip='localhost', port=8000, url=''):
+    def __init__(self, ip='localhost', port=8000, url='', workers: int = 64, compress: bool = True,
+                 upload_token: str = '', access_log: str = '', panel: bool = False):
         """
         http服务类初始化
 
@@ -23,14 +1084,23 @@ class HttpServers:
         :param ip: 绑定的ip
         :param port: 端口
         :param url: 对外显示的访问url
+        :param workers: 工作线程数（同时服务的连接数）
+        :param compress: 是否按Accept-Encoding即时压缩文本类文件（gzip，安装brotli/zstandard后支持br/zstd）
+        :param upload_token: 非空时开启PUT/POST上传接口，使用此令牌鉴权
+        :param access_log: JSON lines访问日志文件，为空时不记录
+        :param panel: 是否在终端展示实时吞吐面板（指标始终可以通过 /__qs_metrics 获取）
         """
         self.web_address = ip
         self.web_port = port
         self.httpd = None
         self.bind_url = url
+        self.workers = workers
+        self.compress = compress
+        self.upload_token = upload_token
+        self.access_log = access_log
+        self.panel = MetricsPanel(QSHTTPRequestHandler.metrics) if panel else None
 
-    class Server(ThreadingMixIn, HTTPServer):
-        pass
+    Server = PooledHTTPServer
 
     def start(self):
         """
@@ -41,11 +1111,17 @@ class HttpServers:
         :return: None
         """
         HttpServers.signal.signal(HttpServers.signal.SIGINT, self.shutdown)
-        self.httpd = HttpServers.Server((self.web_address, self.web_port), SimpleHTTPRequestHandler)
+        QSHTTPRequestHandler.compression = CompressionCache() if self.compress else None
+        QSHTTPRequestHandler.upload_token = self.upload_token
+        QSHTTPRequestHandler.access_log = AccessLog(self.access_log) if self.access_log else None
+        QSHTTPRequestHandler.quiet = bool(self.panel)
+        self.httpd = HttpServers.Server((self.web_address, self.web_port), QSHTTPRequestHandler, self.workers)
         if not self.bind_url:
             self.bind_url = 'http://' + self.web_address + ':' + str(self.web_port)
         qs_default_console.print(qs_info_string, self.bind_url)  # * 展示待访问的url
         HttpServers.qrcode_terminal.draw(self.bind_url)  # * 为待访问的url绘制二维码
+        if self.panel:
+            self.panel.start()
         try:
             self.httpd.serve_forever()
         except TypeError:
@@ -56,7 +1132,69 @@ class HttpServers:
         Ctrl C
         :return: None
         """
-        import os
         self.httpd.shutdown()
+        if self.panel:
+            self.panel.stop()
+        if QSHTTPRequestHandler.access_log:
+            QSHTTPRequestHandler.access_log.close()  # * 写出仍在队列中的访问日志
         qs_default_console.print(qs_info_string, 'HTTP Server: Closed.')
         os._exit(0)
+
+
+def _benchmark(sizes: tuple = (1000, 10000, 100000), rounds: int = 5):
+    """
+    测试目录列表延迟与目录大小的关系（对比标准库实现）
+
+    Benchmark the listing latency against the directory size (compared with the stdlib implementation)
+
+    :param sizes: 目录中的文件数
+    :param rounds: 每项测量次数
+    :return: [(文件数, 标准库耗时, 首次耗时, 缓存命中耗时)]，单位为毫秒
+    """
+    import tempfile
+    import functools
+    import http.client
+    from threading import Thread
+
+    class Quiet(QSHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    class QuietStd(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    def fetch(port: int, path: str) -> float:
+        begin = time.perf_counter()
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        conn.request('GET', path)
+        conn.getresponse().read()
+        conn.close()
+        return (time.perf_counter() - begin) * 1000
+
+    res = []
+    with tempfile.TemporaryDirectory() as root:
+        servers = [PooledHTTPServer(('127.0.0.1', 0), functools.partial(handler, directory=root), 4)
+                   for handler in (QuietStd, Quiet)]
+        for server in servers:
+            Thread(target=server.serve_forever, daemon=True).start()
+        for n in sizes:
+            folder = os.path.join(root, str(n))
+            os.mkdir(folder)
+            for i in range(n):
+                open(os.path.join(folder, 'file_%06d.txt' % i), 'w').close()
+            os.utime(folder, (time.time() - 10, time.time() - 10))
+            std = min(fetch(servers[0].server_port, '/%d/' % n) for _ in range(rounds))
+            cold = fetch(servers[1].server_port, '/%d/' % n)
+            warm = min(fetch(servers[1].server_port, '/%d/' % n) for _ in range(rounds))
+            res.append((n, std, cold, warm))
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+    return res
+
+
+if __name__ == '__main__':
+    print('%8s %12s %12s %12s' % ('files', 'stdlib(ms)', 'cold(ms)', 'cached(ms)'))
+    for _n, _std, _cold, _warm in _benchmark():
+        print('%8d %12.1f %12.1f %12.1f' % (_n, _std, _cold, _warm))
@@ -6,30 +6,362 @@ The downloader of m3u8 file
 """
 import urllib3
 from concurrent.futures import ThreadPoolExecutor, wait
-import requests
 import os
-import queue
-from .. import dir_char, remove, headers, user_lang, qs_default_console, qs_error_string, qs_info_string
+import re
+import time
+import random
+from threading import Lock, BoundedSemaphore
+from urllib.parse import urljoin
+from . import get_session
+from .. import headers, user_lang, qs_default_console, qs_error_string, qs_warning_string, qs_info_string
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    Cipher = None
+try:
+    from Cryptodome.Cipher import AES
+except ImportError:
+    AES = None
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+chunkSize = 1 << 16
 
 
-def merge_file(path, ts_ls, name):
+def parse_attributes(line: str) -> dict:
     """
-    将全部ts文件合并
+    解析m3u8标签的属性列表
 
-    Merge all TS files
+    Parse the attribute list of an m3u8 tag
 
-    :param path: 文件夹路径
-    :param ts_ls: ts文件路径列表
-    :param name: 合并后的ts文件名
-    :return:
+    :param line: 如 #EXT-X-KEY:METHOD=AES-128,URI="key.bin",IV=0x0
+    :return: {属性名: 值}
     """
-    if not path.endswith(dir_char):
-        path += dir_char
-    with open(name + '.ts', 'wb') as f:
-        for ts in ts_ls:
-            with open(path + ts, 'rb') as ff:
-                f.write(ff.read())
+    return {k: v.strip('"') for k, v in re.findall(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)', line.split(':', 1)[-1])}
+
+
+def select_variant(content: str, url: str, variant='highest') -> str:
+    """
+    从主播放列表中选择码率
+
+    Select a variant from a master playlist
+
+    :param content: 主播放列表内容
+    :param url: 主播放列表url
+    :param variant: 'highest' | 'lowest' | 目标码率 (bit/s，如 '2M'，选择最接近的)
+    :return: 媒体播放列表url
+    """
+    variants, lines = [], [line.strip() for line in content.splitlines()]
+    for index, line in enumerate(lines):
+        if line.startswith('#EXT-X-STREAM-INF'):
+            attrs = parse_attributes(line)
+            uri = next((i for i in lines[index + 1:] if i and not i.startswith('#')), '')
+            width, _, height = attrs.get('RESOLUTION', '0x0').partition('x')
+            variants.append((int(attrs.get('BANDWIDTH', 0)), int(width) * int(height or 0), urljoin(url, uri)))
+    if variant == 'highest':
+        return max(variants)[2]
+    elif variant == 'lowest':
+        return min(variants)[2]
+    from .RateLimit import parse_rate
+    target = parse_rate(variant)
+    return min(variants, key=lambda i: (abs(i[0] - target), -i[1]))[2]
+
+
+def parse_media_playlist(content: str, url: str) -> (list, float, bool):
+    """
+    解析媒体播放列表
+
+    Parse a media playlist
+
+    :param content: 媒体播放列表内容
+    :param url: 媒体播放列表url
+    :return: ([(分片url, 媒体序列号, (密钥url, IV) | None, (偏移, 长度) | None), ...], 目标时长, 是否结束)
+    """
+    segments, key, sequence, duration, endlist = [], None, 0, 10.0, False
+    byterange, last_end = None, {}
+    lines = [line.strip() for line in content.splitlines()]
+    for line in lines:
+        if line.startswith('#EXT-X-MEDIA-SEQUENCE'):
+            sequence = int(line.split(':')[1])
+        elif line.startswith('#EXT-X-TARGETDURATION'):
+            duration = float(line.split(':')[1])
+        elif line.startswith('#EXT-X-ENDLIST'):
+            endlist = True
+        elif line.startswith('#EXT-X-KEY'):
+            attrs = parse_attributes(line)
+            if attrs.get('METHOD', 'NONE') == 'NONE':
+                key = None
+            elif attrs['METHOD'] == 'AES-128':
+                key = (urljoin(url, attrs['URI']), bytes.fromhex(attrs['IV'][2:].rjust(32, '0'))
+                       if 'IV' in attrs else None)
+            else:
+                raise ValueError('Unsupported encryption: ' + attrs['METHOD'] if user_lang != 'zh'
+                                 else '不支持的加密方式: ' + attrs['METHOD'])
+        elif line.startswith('#EXT-X-BYTERANGE'):
+            length, _, offset = line.split(':')[1].partition('@')
+            byterange = (int(offset) if offset else None, int(length))
+        elif line and not line.startswith('#'):
+            seg_url = urljoin(url, line)
+            if byterange:
+                offset = last_end.get(seg_url, 0) if byterange[0] is None else byterange[0]
+                byterange = (offset, byterange[1])
+                last_end[seg_url] = offset + byterange[1]
+            # * 未指定IV时使用分片的媒体序列号作为IV
+            iv = key and (key[1] or sequence.to_bytes(16, 'big'))
+            segments.append((seg_url, sequence, key and (key[0], iv), byterange))
+            sequence += 1
+            byterange = None
+    return segments, duration, endlist
+
+
+class AES128Decryptor:
+    def __init__(self, key: bytes, iv: bytes):
+        """
+        AES-128-CBC流式解密器：数据按块送入，保留最后一个分组直到结束时去除PKCS7填充（需要cryptography或pycryptodomex）
+
+        Streaming AES-128-CBC decryptor: data is fed piece by piece and the last block is held back until the PKCS7
+        padding is removed at the end (requires cryptography or pycryptodomex)
+
+        :param key: 16字节密钥
+        :param iv: 16字节初始向量
+        """
+        if Cipher:
+            self.cipher = Cipher(algorithms.AES(key), modes.CBC(iv)).decryptor().update
+        elif AES:
+            self.cipher = AES.new(key, AES.MODE_CBC, iv).decrypt
+        else:
+            raise ImportError('Decrypting HLS requires cryptography: pip3 install cryptography' if user_lang != 'zh'
+                              else '解密HLS需要安装cryptography: pip3 install cryptography')
+        self.rest = b''
+        self.tail = b''
+
+    def update(self, data: bytes) -> bytes:
+        """
+        解密一段数据
+
+        Decrypt a piece of data
+
+        :param data: 密文
+        :return: 已确定的明文
+        """
+        data = self.rest + data
+        cut = len(data) - len(data) % 16
+        self.rest = data[cut:]
+        if not cut:
+            return b''
+        plain = self.tail + self.cipher(data[:cut])
+        self.tail = plain[-16:]
+        return plain[:-16]
+
+    def finalize(self) -> bytes:
+        """
+        结束解密并去除填充
+
+        Finish decrypting and strip the padding
+
+        :return: 剩余的明文
+        """
+        if self.rest or not self.tail or not 1 <= self.tail[-1] <= 16:
+            raise ValueError('Bad AES-128 segment' if user_lang != 'zh' else 'AES-128分片数据错误')
+        return self.tail[:-self.tail[-1]]
+
+
+class M3U8Checkpoint:
+    def __init__(self, path: str):
+        """
+        M3U8断点清单：JSON Lines文件，首行记录媒体播放列表url，之后每写入一个分片追加一行 (序号, 媒体序列号, 长度, sha1)
+
+        M3U8 checkpoint manifest: a JSON Lines file, the first line records the media playlist url and one line
+        (index, media sequence, length, sha1) is appended for every segment written
+
+        :param path: 清单文件路径
+        """
+        self.path = path
+        self.fp = None
+
+    def load(self, target: str, output: str) -> list:
+        """
+        读取与target匹配的清单并校验输出文件，随后将输出文件截断到清单记录的长度（丢弃未记录的半个分片）
+
+        Load the manifest of target and check the output file, then truncate the output to the length recorded in
+        the manifest (dropping any half written segment)
+
+        :param target: 媒体播放列表url
+        :param output: 输出文件
+        :return: 已完成的分片记录列表，无法续传时为空
+        """
+        import json
+        import hashlib
+        records = []
+        try:
+            with open(self.path, 'r') as f:
+                lines = f.read().splitlines()
+            if json.loads(lines[0]).get('target') != target:
+                return []
+            for line in lines[1:]:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:  # * 写入中断的最后一行
+                    break
+        except (OSError, ValueError, IndexError):
+            return []
+        total = sum(i['len'] for i in records)
+        if not records or not os.path.exists(output) or os.path.getsize(output) < total:
+            return []
+        with open(output, 'r+b') as f:
+            f.seek(total - records[-1]['len'])
+            if hashlib.sha1(f.read(records[-1]['len'])).hexdigest() != records[-1]['sha1']:
+                return []
+            f.truncate(total)
+        return records
+
+    def open(self, target: str, resume: bool):
+        """
+        打开清单准备追加记录
+
+        Open the manifest for appending records
+
+        :param target: 媒体播放列表url
+        :param resume: 是否续传（否则重写清单）
+        :return: None
+        """
+        import json
+        self.fp = open(self.path, 'a' if resume else 'w')
+        if not resume:
+            self.fp.write(json.dumps({'target': target}) + '\n')
+            self.fp.flush()
+
+    def record(self, index: int, sequence: int, length: int, digest: str):
+        """
+        记录一个已写入输出文件的分片
+
+        Record a segment that has been written to the output file
+
+        :param index: 分片序号
+        :param sequence: 媒体序列号
+        :param length: 长度
+        :param digest: sha1
+        :return: None
+        """
+        import json
+        self.fp.write(json.dumps({'i': index, 'seq': sequence, 'len': length, 'sha1': digest}) + '\n')
+        self.fp.flush()
+
+    def close(self, remove: bool = False):
+        """
+        关闭清单
+
+        Close the manifest
+
+        :param remove: 是否删除清单文件（下载完成）
+        :return: None
+        """
+        if self.fp:
+            self.fp.close()
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class OrderedWriter:
+    def __init__(self, filename: str, max_buffer: int = 64 << 20, start: int = 0, checkpoint: M3U8Checkpoint = None):
+        """
+        按序写入器：分片可以乱序到达，按序号顺序直接追加到输出文件；尚未轮到的分片暂存在内存中，
+        超过max_buffer后转存到临时文件，轮到时用copy_file_range/sendfile拷贝，不存在二次读写整个视频的合并过程
+
+        Ordered writer: segments may arrive out of order and are appended to the output file in index order;
+        segments whose turn has not come are kept in memory, spilled to a temporary file beyond max_buffer and copied
+        with copy_file_range/sendfile when their turn comes, so there is no second pass merging the whole video
+
+        :param filename: 输出文件名
+        :param max_buffer: 内存中暂存的最大字节数
+        :param start: 第一个待写入的分片序号（续传时追加到已有文件之后）
+        :param checkpoint: 每写入一个分片，先刷新输出文件再追加清单记录，清单中的分片一定已完整写入
+                           every written segment is flushed to the output before its manifest record is appended, so
+                           recorded segments are always complete
+        """
+        # * 续传时不能用'ab'打开：O_APPEND的文件描述符不能作为copy_file_range的目标
+        self.fp = open(filename, 'r+b' if start and os.path.exists(filename) else 'wb')
+        self.fp.seek(0, os.SEEK_END)
+        self.lock = Lock()
+        self.next = start
+        self.checkpoint = checkpoint
+        self.pending = {}
+        self.buffered = 0
+        self.max_buffer = max_buffer
+        self.spool = None
+
+    def put(self, index: int, data: bytes, sequence: int = -1):
+        """
+        提交第index个分片
+
+        Submit segment number index
+
+        :param index: 分片序号
+        :param data: 分片内容
+        :param sequence: 媒体序列号（写入清单）
+        :return: 本次按序写入的分片数
+        """
+        import hashlib
+        meta = (sequence, len(data), hashlib.sha1(data).hexdigest()) if self.checkpoint else None
+        with self.lock:
+            if index != self.next:
+                if self.buffered + len(data) > self.max_buffer:
+                    if self.spool is None:
+                        import tempfile
+                        self.spool = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(self.fp.name)))
+                    self.spool.seek(0, os.SEEK_END)
+                    self.pending[index] = ((self.spool.tell(), len(data)), meta)
+                    self.spool.write(data)
+                else:
+                    self.pending[index] = (data, meta)
+                    self.buffered += len(data)
+                return 0
+            self._write(data, meta)
+            flushed = 1
+            while self.next in self.pending:
+                item, meta = self.pending.pop(self.next)
+                if isinstance(item, tuple):
+                    self._copy_spooled(*item)
+                    self._write(b'', meta)
+                else:
+                    self._write(item, meta)
+                    self.buffered -= len(item)
+                flushed += 1
+            return flushed
+
+    def _write(self, data: bytes, meta: tuple):
+        self.fp.write(data)
+        if self.checkpoint:
+            self.fp.flush()
+            self.checkpoint.record(self.next, *meta)
+        self.next += 1
+
+    def _copy_spooled(self, offset: int, length: int):
+        self.spool.flush()
+        self.fp.flush()
+        src, dst = self.spool.fileno(), self.fp.fileno()
+        while length:
+            if hasattr(os, 'copy_file_range'):
+                n = os.copy_file_range(src, dst, length, offset)
+            elif hasattr(os, 'sendfile'):
+                n = os.sendfile(dst, src, offset, length)
+            else:
+                n = os.write(dst, os.pread(src, min(length, 1 << 20), offset))
+            if not n:
+                raise IOError('Short copy from spool file')
+            offset += n
+            length -= n
+        self.fp.seek(0, os.SEEK_END)
+
+    def close(self):
+        """
+        关闭输出文件
+
+        Close the output file
+
+        :return: None
+        """
+        self.fp.close()
+        if self.spool is not None:
+            self.spool.close()
 
 
 class M3U8DL:
@@ -37,7 +369,8 @@ class M3U8DL:
 
     proxies = {}
 
-    def __init__(self, target, name, proxy: str = ''):
+    def __init__(self, target, name, proxy: str = '', engine: str = 'thread', concurrency: int = 16, limiter=None,
+                 variant='highest', live: bool = False, retries: int = 5):
         """
         初始化M3U8下载引擎
 
@@ -45,13 +378,39 @@ class M3U8DL:
 
         :param target: 目标url
         :param name: 文件名
+        :param engine: 'thread' (线程池) | 'async' (asyncio，适合大量小分片)
+        :param concurrency: 最大并发请求数；同时在途（下载中或等待按序写入）的分片最多为其2倍，内存占用与播放列表长度无关
+                            max concurrent requests; at most twice as many segments are in flight (downloading or
+                            waiting for the ordered writer), so memory does not grow with the playlist length
+        :param limiter: 限速器 QuickStart_Rhy.NetTools.RateLimit.RateLimiter
+        :param variant: 主播放列表的码率选择: 'highest' | 'lowest' | 目标码率 (bit/s)
+        :param live: 直播模式：持续轮询媒体播放列表，只下载新增的分片，直到出现 EXT-X-ENDLIST 或按下 Ctrl+C
+        :param retries: 每个分片的最大尝试次数，失败后按带抖动的指数退避重试，全部失败则中止下载（再次运行可续传）
         """
-        self.path = ''
+        self.writer = None
+        self.variant = variant
+        self.live = live
         self._cur = 0
         self._all = 0
         self.target = target
         self.name = name
-        self.job_queue = queue.Queue()
+        if engine == 'async':
+            from .AsyncDL import supports_proxy
+            if not supports_proxy(proxy):
+                engine, concurrency = 'thread', min(concurrency, 16)
+        self.engine = engine
+        self.concurrency = concurrency
+        self.window_size = concurrency * 2
+        self.window = BoundedSemaphore(self.window_size)
+        self.retries = retries
+        self.failed = 0
+        self.aborted = False  # * 有分片失败或写入出错，不再提交新分片
+        self.error = None  # * 写入出错时的异常
+        self.limiter = limiter
+        self.keys = {}
+        self.keyLock = Lock()
+        self.headers = headers
+        self.session = get_session(concurrency)
         if proxy:
             M3U8DL.proxies = {
                 'http': 'http://'+proxy,
@@ -67,28 +426,172 @@ class M3U8DL:
         )
         self.dl_id = self.main_progress.add_task("Download", taskName='Downloading' if user_lang != 'zh' else '下载中')
 
+    def save(self, job, content: bytes):
+        """
+        将一个ts分片交给按序写入器
+
+        Hand a TS segment to the ordered writer
+
+        :param job: 任务信息 (url, 分片序号, 密钥, 字节范围, 媒体序列号)
+        :param content: 文件内容
+        :return: 本次按序写入的分片数，调用者据此归还在途窗口
+        """
+        return self.writer.put(job[1], content, job[4])
+
+    def backoff(self, attempt: int) -> float:
+        """
+        第attempt次失败后的重试等待时间：带抖动的指数退避，上限30秒
+
+        Wait before retrying after failure number attempt: exponential backoff with jitter, capped at 30 sec
+
+        :param attempt: 已失败次数 - 1
+        :return: 秒数
+        """
+        delay = min(30.0, 0.5 * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def fail(self, job, e: Exception):
+        """
+        记录一个多次重试后仍失败的分片并中止下载：该分片及其后的分片都不写入，续传时重新下载
+
+        Record a segment that still fails after all attempts and abort the download: neither it nor the segments
+        after it are written, a resumed download fetches them again
+
+        :param job: 任务信息
+        :param e: 最后一次的异常
+        :return: None
+        """
+        with self.keyLock:
+            self.failed += 1
+            self.aborted = True
+        qs_default_console.print(qs_error_string, 'Segment failed after %d attempts:' % self.retries
+                                 if user_lang != 'zh' else '分片%d次尝试均失败:' % self.retries, job[0], repr(e))
+
+    def get_key(self, uri: str) -> bytes:
+        """
+        获取密钥，同一个uri只请求一次
+
+        Get a key, each uri is only requested once
+
+        :param uri: 密钥url
+        :return: 16字节密钥
+        """
+        with self.keyLock:
+            if uri not in self.keys:
+                res = self.session.get(uri, verify=False, headers=self.headers, proxies=M3U8DL.proxies)
+                res.raise_for_status()
+                if len(res.content) != 16:
+                    raise ValueError('Bad AES-128 key: ' + uri)
+                self.keys[uri] = res.content
+            return self.keys[uri]
+
+    def decryptor(self, job):
+        """
+        为分片创建解密器
+
+        Create the decryptor of a segment
+
+        :param job: 任务信息
+        :return: AES128Decryptor，未加密时为None
+        """
+        return AES128Decryptor(self.get_key(job[2][0]), job[2][1]) if job[2] else None
+
+    def job_headers(self, job) -> dict:
+        """
+        分片请求头，EXT-X-BYTERANGE分片附带Range
+
+        Request headers of a segment, with Range for EXT-X-BYTERANGE segments
+
+        :param job: 任务信息
+        :return: dict
+        """
+        if not job[3]:
+            return self.headers
+        return dict(self.headers, Range='bytes=%d-%d' % (job[3][0], job[3][0] + job[3][1] - 1))
+
+    def _fetch(self, job) -> bytes:
+        """
+        下载并解密一个ts分片（一次尝试）
+
+        Download and decrypt a TS segment (one attempt)
+
+        :param job: 任务信息
+        :return: 分片内容
+        """
+        decryptor = self.decryptor(job)
+        content = []
+        with self.session.get(job[0], verify=False, headers=self.job_headers(job), proxies=M3U8DL.proxies,
+                              stream=True) as res:
+            res.raise_for_status()
+            if job[3] and res.status_code != 206:
+                raise ConnectionError('Server ignored Range of EXT-X-BYTERANGE segment')
+            for chunk in res.iter_content(chunkSize):
+                if self.limiter:
+                    self.limiter.throttle(job[0], len(chunk))
+                content.append(decryptor.update(chunk) if decryptor else chunk)
+        if decryptor:
+            content.append(decryptor.finalize())
+        return b''.join(content)
+
     def _dl_one(self, job):
         """
-        下载一个ts文件
+        下载一个ts文件；下载中止后不再写入，写入出错时记录异常并中止，无论如何都归还在途窗口
 
-        Download a TS file
+        Download a TS file; nothing is written once the download is aborted, a write error is recorded and aborts
+        the download, and the in-flight window is returned in any case
 
         :param job: 任务信息
         :return: None
         """
+        content, released = None, 1
         try:
-            if job[-1]:
-                pd_url = job[0]
-                c_fule_name = job[1]
-                if not os.path.exists(os.path.join(self.path, c_fule_name)):
-                    res = requests.get(pd_url, verify=False, proxies=M3U8DL.proxies)
-                    with open(os.path.join(self.path, c_fule_name), 'ab') as f:
-                        f.write(res.content)
-                        f.flush()
-            self.main_progress.advance(self.dl_id, 1)
+            for attempt in range(self.retries):
+                if self.aborted:
+                    break
+                try:
+                    content = self._fetch(job)
+                    break
+                except Exception as e:
+                    if attempt + 1 == self.retries:
+                        self.fail(job, e)
+                    else:
+                        time.sleep(self.backoff(attempt))
+            if content is not None and not self.aborted:
+                released = self.save(job, content)
+                self.main_progress.advance(self.dl_id, 1)
         except Exception as e:
-            qs_default_console.log(qs_error_string, repr(e))
-            self.job_queue.put(job)
+            self.aborted, self.error = True, self.error or e
+        finally:
+            for _ in range(released):
+                self.window.release()
+
+    def _get_playlist(self, url: str) -> str:
+        return self.session.get(url, verify=False, headers=self.headers, proxies=M3U8DL.proxies).text
+
+    def _run_jobs(self, jobs: list):
+        """
+        下载一批分片
+
+        Download a batch of segments
+
+        :param jobs: 任务列表
+        :return: None
+        """
+        for uri in {job[2][0] for job in jobs if job[2]}:
+            self.get_key(uri)
+        if self.engine == 'async':
+            import asyncio
+            from .AsyncDL import m3u8_dl_async
+            asyncio.run(m3u8_dl_async(self, jobs, self.concurrency))
+        else:
+            futures = []
+            for job in jobs:
+                self.window.acquire()
+                if self.aborted:  # * 失败分片之后的分片永远轮不到写入，不再提交
+                    self.window.release()
+                    break
+                futures.append(self.pool.submit(self._dl_one, job))
+            wait(futures)  # * 未中止时本批分片此时已全部按序写入
 
     def download(self):
         """
@@ -97,49 +600,69 @@ class M3U8DL:
         :return: None
         """
         target = self.target
-        download_path = os.getcwd() + dir_char + self.name
-        self.path = download_path
-        if not os.path.exists(download_path):
-            os.mkdir(download_path)
         try:
-            all_content = requests.get(target, verify=False, headers=headers, proxies=M3U8DL.proxies).text
+            all_content = self._get_playlist(target)
         except Exception as e:
             qs_default_console.log(qs_error_string, repr(e))
             return
         if "#EXTM3U" not in all_content:
             raise BaseException("Not M3U8 Link" if user_lang != 'zh' else "非M3U8的链接")
         if "EXT-X-STREAM-INF" in all_content:
-            file_line = all_content.split("\n")
-            for line in file_line:
-                if '.m3u8' in line:
-                    target = target.rsplit("/", 1)[0] + "/" + line
-                    all_content = requests.get(target, verify=False, headers=headers, proxies=M3U8DL.proxies).text
-        file_line = all_content.split("\n")
-        _rt = target.rsplit("/", 1)[0] + "/"
-        tmp = []
-        for index, line in enumerate(file_line):
-            if "#EXT-X-KEY" in line:
-                tmp.append((_rt, line, 0))
-            if "EXTINF" in line:
-                tmp.append((_rt + file_line[index + 1], file_line[index + 1].rsplit("/", 1)[-1], 1))
-        file_line = tmp[::-1]
-        self._all = len(file_line)
-        tmp = [jb[1] for jb in file_line]
-
-        self.main_progress.update(self.dl_id, total=len(file_line))
-        for i in file_line:
-            self.job_queue.put(i)
-        pool = ThreadPoolExecutor(16)
+            target = select_variant(all_content, target, self.variant)
+            qs_default_console.print(qs_info_string, 'Variant:' if user_lang != 'zh' else '选择码率:', target)
+            all_content = self._get_playlist(target)
+        checkpoint = M3U8Checkpoint(self.name + '.ts.qs_m3u8')
+        records = checkpoint.load(target, self.name + '.ts')
+        checkpoint.open(target, bool(records))
+        self.writer = OrderedWriter(self.name + '.ts', start=len(records), checkpoint=checkpoint)
+        self.pool = ThreadPoolExecutor(self.concurrency)
+        self._all = len(records)
+        last = records[-1]['seq'] if records else -1
+        if records:
+            qs_default_console.print(qs_info_string, 'Resume from segment' if user_lang != 'zh' else '从分片续传:',
+                                     self._all)
         self.main_progress.start()
         self.main_progress.start_task(self.dl_id)
-        while not self.job_queue.empty():
-            cur_work = []
-            while not self.job_queue.empty():
-                cur_work.append(pool.submit(self._dl_one, self.job_queue.get()))
-            wait(cur_work)
-        self.main_progress.stop()
-
-        qs_default_console.print(qs_info_string, "Download completed! Start merge.."
-                                 if user_lang != 'zh' else '下载完成! 开始合并..')
-        merge_file(download_path, tmp, self.name)
-        remove(download_path)
+        self.main_progress.update(self.dl_id, total=self._all, completed=self._all)
+        completed = False
+        try:
+            while True:
+                tm = time.time()
+                segments, duration, endlist = parse_media_playlist(all_content, target)
+                jobs = []
+                for url, sequence, key, byterange in segments:
+                    if sequence <= last:
+                        continue
+                    if 0 <= last < sequence - 1:
+                        qs_default_console.print(qs_warning_string, 'Segments expired before download:'
+                                                 if user_lang != 'zh' else '分片在下载前已过期:', sequence - last - 1)
+                    jobs.append((url, self._all, key, byterange, sequence))
+                    self._all += 1
+                    last = sequence
+                self.main_progress.update(self.dl_id, total=self._all)
+                self._run_jobs(jobs)
+                if self.error:
+                    raise self.error
+                if self.aborted or endlist or not self.live:
+                    break
+                time.sleep(max(0.0, (duration if jobs else duration / 2) - (time.time() - tm)))
+                all_content = self._get_playlist(target)
+            completed = not self.aborted
+        except KeyboardInterrupt:
+            if self.live:
+                qs_default_console.print(qs_warning_string, 'Live recording stopped' if user_lang != 'zh'
+                                         else '停止录制')
+            else:
+                qs_default_console.print(qs_warning_string, 'Interrupted, run again to resume' if user_lang != 'zh'
+                                         else '下载中断，再次运行即可续传')
+        finally:
+            self.pool.shutdown()
+            self.main_progress.stop()
+            self.writer.close()
+            checkpoint.close(remove=completed)
+        if self.failed:
+            raise ConnectionError('%d segments failed, run again to resume' % self.failed
+                                  if user_lang != 'zh' else '%d个分片下载失败，再次运行即可续传' % self.failed)
+        if completed:
+            qs_default_console.print(qs_info_string, self.name + '.ts', "download done!"
+                                     if user_lang != 'zh' else '下载完成!')
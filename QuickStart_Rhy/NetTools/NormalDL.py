@@ -7,21 +7,25 @@ and supports setting proxy, nice command line interaction, and it can download f
 
 Author: RhythmLian (https://rhythmlian.cn)
 """
-from . import size_format, get_fileinfo
+from . import size_format, get_fileinfo, get_session
 from concurrent.futures import ThreadPoolExecutor, wait
-from ..ThreadTools import FileWriters
+from ..ThreadTools import get_file_writers
 from .. import user_lang, qs_default_console, qs_error_string, qs_info_string, qs_warning_string, headers
-from threading import Lock
-from requests import get
+from threading import Lock, BoundedSemaphore, current_thread, main_thread
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from requests.exceptions import RequestException
 import psutil
 import signal
-import queue
+import struct
+import mmap
 import time
 import os
 
 core_num = psutil.cpu_count()
 maxBlockSize = int(1.5e6)
 minBlockSize = int(5e5)
+chunkSize = 1 << 16
 
 
 def GetBlockSize(sz):
@@ -41,6 +45,284 @@ def GetBlockSize(sz):
         return max(sz >> 9, minBlockSize)
 
 
+class BlockCheckpoint:
+    magic = b'QSDL'
+    header = struct.Struct('<4sIQQHH')
+
+    def __init__(self, path: str, size: int, block: int, etag: str = '', last_modified: str = ''):
+        """
+        位图断点文件：每个文件块占一位，头部记录文件大小、块大小、ETag与Last-Modified，并通过mmap读写
+
+        Bitmap breakpoint file: one bit per block, the header stores the file size, block size, ETag and
+        Last-Modified, and the file is accessed through mmap
+
+        已有的断点文件与远程文件信息不一致时将被丢弃重建（self.stale为True）；旧版按行记录偏移量的断点文件会被转换
+
+        An existing breakpoint file that does not match the remote file is discarded and rebuilt (self.stale is
+        True); the legacy format with one offset per line is converted
+
+        :param path: 断点文件路径
+        :param size: 文件大小
+        :param block: 块大小
+        :param etag: 远程文件ETag
+        :param last_modified: 远程文件Last-Modified
+        """
+        self.path = path
+        self.blocks = (size + block - 1) // block
+        self.stale = False
+        etag, last_modified = etag.encode(), last_modified.encode()
+        head = BlockCheckpoint.header.pack(BlockCheckpoint.magic, 1, size, block, len(etag), len(last_modified)) \
+            + etag + last_modified
+        legacy = []
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                content = f.read(len(head))
+            if content == head:
+                self.offset = len(head)
+                self.fp = open(path, 'r+b')
+                self._map()
+                return
+            if content.startswith(BlockCheckpoint.magic):
+                self.stale = True
+            else:
+                with open(path, 'r', errors='ignore') as f:
+                    legacy = [int(i) for i in f.read().split() if i.isdigit()]
+        with open(path, 'wb') as f:
+            f.write(head)
+            f.write(bytes((self.blocks + 7) >> 3))
+        self.offset = len(head)
+        self.fp = open(path, 'r+b')
+        self._map()
+        for i in legacy:
+            if i % block == 0 and i < size:
+                self.mark(i // block)
+
+    def _map(self):
+        self.mm = mmap.mmap(self.fp.fileno(), 0)
+
+    def is_done(self, index: int) -> bool:
+        """
+        文件块是否已下载
+
+        Whether the block is downloaded
+
+        :param index: 块号
+        :return: bool
+        """
+        return bool(self.mm[self.offset + (index >> 3)] & (1 << (index & 7)))
+
+    def mark(self, index: int):
+        """
+        标记文件块已下载（直接写入映射内存，无需系统调用；同一字节的并发修改需由调用者串行化）
+
+        Mark the block as downloaded (a store into the mapping, no syscall; concurrent updates of the same
+        byte must be serialised by the caller)
+
+        :param index: 块号
+        :return: None
+        """
+        self.mm[self.offset + (index >> 3)] |= 1 << (index & 7)
+
+    def count(self) -> int:
+        """
+        已下载的文件块数量
+
+        Number of downloaded blocks
+
+        :return: int
+        """
+        return sum(bin(i).count('1') for i in self.mm[self.offset:])
+
+    def close(self, remove: bool = False):
+        """
+        关闭断点文件
+
+        Close the breakpoint file
+
+        :param remove: 是否删除断点文件（下载完成时）
+        :return: None
+        """
+        self.mm.flush()
+        self.mm.close()
+        self.fp.close()
+        if remove:
+            os.remove(self.path)
+
+
+class ConnectionBudget:
+    def __init__(self, total: int, per_host: int):
+        """
+        多个下载任务共享的连接数预算：全局上限与单主机上限
+
+        Connection budget shared by several downloads: a global cap and a per-host cap
+
+        :param total: 全局最大并发连接数
+        :param per_host: 单个主机最大并发连接数
+        """
+        self.total = BoundedSemaphore(total)
+        self.per_host = per_host
+        self.hosts = {}
+        self.lock = Lock()
+
+    @contextmanager
+    def slot(self, url: str):
+        """
+        占用一个连接名额，名额不足时阻塞
+
+        Hold one connection slot, blocks while the budget is exhausted
+
+        :param url: 请求的url
+        :return: 上下文管理器 | context manager
+        """
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = BoundedSemaphore(self.per_host)
+            host_sem = self.hosts[host]
+        with host_sem, self.total:
+            yield
+
+
+class _PrefixHasher:
+    def __init__(self, algorithm: str, path: str):
+        """
+        边下载边校验：对文件已连续完成的前缀增量计算哈希
+
+        Verify while downloading: incrementally hash the contiguous completed prefix of the file
+
+        写入前缀末尾的数据直接在内存中计算；前缀因其他线程完成的块而延伸时，这些块从刚写入的文件（页缓存）中读取
+
+        Data written right at the end of the prefix is hashed from memory; when the prefix grows over blocks
+        finished by other workers, those are read back from the freshly written file (page cache)
+
+        :param algorithm: 算法名 [md5, sha1, sha256, sha512]
+        :param path: 文件路径
+        """
+        import hashlib
+        self.hash = hashlib.new(algorithm)
+        self.path = path
+        self.pos = 0
+        self.lock = Lock()
+
+    def feed(self, pos: int, data):
+        """
+        提交刚写入的数据，仅当其覆盖前缀末尾时被使用（拿不到锁时直接跳过，稍后由catch_up读取）
+
+        Offer freshly written data, it is used only when it covers the end of the prefix (skipped when the
+        lock is busy, catch_up will read it later)
+
+        :param pos: 数据在文件中的偏移
+        :param data: 数据
+        :return: None
+        """
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            if pos <= self.pos < pos + len(data):
+                self.hash.update(data[self.pos - pos:])
+                self.pos = pos + len(data)
+        finally:
+            self.lock.release()
+
+    def catch_up(self, limit, blocking: bool = False):
+        """
+        从文件读取并计算到前缀末尾
+
+        Read and hash from the file up to the end of the prefix
+
+        :param limit: 返回当前已完成前缀长度的函数
+        :param blocking: 是否等待其他线程的catch_up结束
+        :return: None
+        """
+        if not self.lock.acquire(blocking=blocking):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                while self.pos < limit():
+                    f.seek(self.pos)
+                    data = f.read(min(chunkSize << 4, limit() - self.pos))
+                    if not data:
+                        break
+                    self.hash.update(data)
+                    self.pos += len(data)
+        finally:
+            self.lock.release()
+
+    def hexdigest(self) -> str:
+        return self.hash.hexdigest()
+
+
+class DownloadError(Exception):
+    """
+    下载失败（连接失败、校验失败或远程文件已变化），命令行只输出错误信息
+
+    Download failure (connection error, checksum mismatch or changed remote file); the CLI prints only the message
+    """
+
+
+class RemoteFileChanged(Exception):
+    """
+    If-Range未命中：服务端返回了完整的新文件而不是请求的区间
+
+    If-Range did not match: the server answered with the whole new file instead of the requested range
+    """
+
+
+def _validator(r) -> str:
+    """
+    If-Range使用的校验值：强ETag，没有时为Last-Modified（弱ETag在If-Range中永远不匹配，RFC 7233）
+
+    Validator for If-Range: the strong ETag, else Last-Modified (a weak ETag never matches in If-Range, RFC 7233)
+
+    :param r: FileInfo
+    :return: 校验值，没有时为''
+    """
+    etag = r.headers.get('etag', '')
+    return etag if etag and not etag.startswith('W/') else r.headers.get('last-modified', '')
+
+
+class _Mirror:
+    def __init__(self, url: str, validator: str = ''):
+        """
+        同一文件的一个下载源
+
+        One source (mirror) of the file
+
+        :param url: 下载源url
+        :param validator: 该源的ETag（没有时为Last-Modified），作为Range请求的If-Range
+        """
+        self.url = url
+        self.validator = validator
+        self.speed = 0.0
+        self.active = 0
+        self.fails = 0
+        self.dead = False
+
+
+class _Segment:
+    def __init__(self, start: int, end: int):
+        """
+        一段连续的文件块 [start, end)，由一个下载线程独占
+
+        A run of contiguous file blocks [start, end) owned by one download worker
+
+        :param start: 起始块号
+        :param end: 结束块号（不含）
+        """
+        self.cur = start
+        self.end = end
+
+    def remain(self) -> int:
+        """
+        剩余块数
+
+        Number of blocks left
+
+        :return: 剩余块数
+        """
+        return self.end - self.cur
+
+
 class Downloader:
     from rich.progress import (
         BarColumn,
@@ -51,19 +333,39 @@ class Downloader:
         Progress,
     )
 
-    def __init__(self, url: str, num: int, name: str = '', proxy: str = '',
-                 referer: str = '', output_error: bool = False):
+    total_lock = Lock()
+
+    def __init__(self, url, num: int, name: str = '', proxy: str = '',
+                 referer: str = '', output_error: bool = False, stream: bool = True,
+                 progress=None, total_id=None, budget: ConnectionBudget = None,
+                 checksum: tuple = None, checksum_file: str = '', limiter=None):
         """
         qs普通文件下载引擎
 
         Qs general file download engine
 
-        :param url: 文件url
+        :param url: 文件url，或同一文件的多个镜像url列表（第一个为主url）
+                    url of the file, or a list of mirror urls of the same file (the first one is the primary)
         :param num: 线程数量
+        :param stream: 流式写入：响应按chunkSize读取并直接pwrite到预分配文件中，内存占用与线程数无关（需要os.pwrite）
+                       Streaming mode: responses are read in chunkSize pieces and pwrite straight into the
+                       preallocated file, so memory does not grow with the thread count (requires os.pwrite)
+        :param progress: 共享的进度条（批量下载时使用，由调用者负责启动和停止）
+        :param total_id: 共享进度条中汇总任务的id
+        :param budget: 共享的连接数预算
+        :param checksum: 期望的摘要 (算法名, 十六进制摘要)，下载过程中增量校验
+                         expected digest (algorithm, hex digest), verified incrementally while downloading
+        :param checksum_file: 校验和文件，按文件名查找期望的摘要
+        :param limiter: 共享的限速器 QuickStart_Rhy.NetTools.RateLimit.RateLimiter
         """
-        signal.signal(signal.SIGINT, self._kill_self)
+        if current_thread() is main_thread():
+            signal.signal(signal.SIGINT, self._kill_self)
         info_flag = True
-        self.url, self.num, self.fileLock, self.output_error, self.proxies = url, num, Lock(), output_error, {}
+        urls = [url] if isinstance(url, str) else list(url)
+        url = urls[0]
+        self.url, self.num, self.output_error, self.proxies = url, num, output_error, {}
+        self.shared, self.total_id, self.budget, self.limiter = progress is not None, total_id, budget, limiter
+        self.session = get_session(num)
         self.url, self.name, r = get_fileinfo(url, proxy, referer)
         if not (self.url and self.name and r):
             info_flag = False
@@ -73,23 +375,37 @@ class Downloader:
             self.name = self.name = os.path.basename(url)
         if name:
             self.name = name
+        self.refresh = bool(r) and os.path.exists(self.name + '.qs_dl')
+        if self.refresh:  # * 续传时必须用最新的ETag/Last-Modified校验断点文件，不能使用缓存的文件信息
+            self.url, error, r = get_fileinfo(url, proxy, referer, refresh=True)
+            if not r:
+                info_flag, self.name = False, error
+        self.source, self.changed = (url, proxy, referer), False
         if proxy:
             self.proxies = {
                 'http': 'http://'+proxy,
                 'https': 'https://'+proxy
             }
-        self.headers = headers
-        if referer:
-            self.headers['Referer'] = referer
+        self.headers = dict(headers, Referer=referer) if referer else dict(headers)
+        self.headers['Accept-Encoding'] = 'identity'  # * 分段下载按原始字节计算Range
         if not self.url:
             qs_default_console.print(qs_error_string, self.name)
-            raise Exception('Connection Error!' if user_lang != 'zh' else '连接失败!')
+            raise DownloadError('Connection Error!' if user_lang != 'zh' else '连接失败!')
+        if checksum_file:
+            from ..SystemTools.FileHash import read_checksum_file
+            checksum = read_checksum_file(checksum_file).get(self.name)
+            if not checksum:
+                qs_default_console.print(qs_warning_string, 'No checksum found for' if user_lang != 'zh' else
+                                         '校验和文件中没有', self.name)
+        self.checksum = (checksum[0], checksum[1].lower()) if checksum else None
+        self.hasher = _PrefixHasher(self.checksum[0], self.name) if self.checksum else None
+        self.prefix = 0
 
         try:
             if not info_flag:
                 raise KeyError
             self.size = int(r.headers['content-length'])
-            self.main_progress = Downloader.Progress(
+            self.main_progress = progress if self.shared else Downloader.Progress(
                 Downloader.TextColumn("[bold blue]{task.fields[filename]}", justify="right"),
                 Downloader.BarColumn(bar_width=None),
                 "[progress.percentage]{task.percentage:>3.1f}%",
@@ -103,15 +419,24 @@ class Downloader:
             )
             self.dl_id = self.main_progress.add_task('Download', filename=self.name, start=False)
             self.main_progress.update(self.dl_id, total=self.size)
-            if self.size < 5e6:
-                qs_default_console.print(qs_info_string, 'FILE SIZE' if user_lang != 'zh' else '文件大小'
-                                         , size_format(self.size))
+            if self.total_id is not None:
+                with Downloader.total_lock:
+                    task = next(i for i in self.main_progress.tasks if i.id == total_id)
+                    self.main_progress.update(total_id, total=task.total + self.size)
+            if self.size >= 5e6 and r.headers.get('accept-ranges') == 'none':
+                qs_default_console.print(qs_warning_string, 'Server does not support Range, download in a single thread'
+                                         if user_lang != 'zh' else '服务器不支持Range请求，使用单线程下载')
+                self.size = -self.size
+            elif self.size < 5e6:
+                if not self.shared:
+                    qs_default_console.print(qs_info_string, 'FILE SIZE' if user_lang != 'zh' else '文件大小'
+                                             , size_format(self.size))
                 self.size = -self.size
             else:
                 self.fileBlock = GetBlockSize(self.size)
         except KeyError:
             self.size = -1
-            self.main_progress = Downloader.Progress(
+            self.main_progress = progress if self.shared else Downloader.Progress(
                 Downloader.TextColumn(
                     "[bold blue]{task.fields[filename]} [red]" +
                     ('Unknow size' if user_lang != 'zh' else '未知大小'),
@@ -124,19 +449,115 @@ class Downloader:
             self.dl_id = self.main_progress.add_task('Download', filename=self.name, start=False)
         if self.size > 0:
             self.pool = ThreadPoolExecutor(max_workers=self.num)
-            self.futures = []
-            self.job_queue = queue.Queue()
-            if os.path.exists(self.name + '.qs_dl'):
-                self.ctn_file = open(self.name + '.qs_dl', 'r+')
-                self.ctn = [int(i) for i in self.ctn_file.read().strip().split()]
+            self.schedLock = Lock()
+            self.pending = []
+            self.active = {}
+            self.speed = [0.0] * self.num
+            self.retry_cnt = 0
+            self.mirrors = [_Mirror(self.url, _validator(r))]
+            for mirror in urls[1:]:
+                self._add_mirror(mirror, r, proxy, referer)
+            self.ckpt = BlockCheckpoint(self.name + '.qs_dl', self.size, self.fileBlock,
+                                        r.headers.get('etag', ''), r.headers.get('last-modified', ''))
+            if self.ckpt.stale:
+                qs_default_console.print(qs_warning_string, 'Remote file changed, restart download'
+                                         if user_lang != 'zh' else '远程文件已变化，重新下载')
+            if stream and hasattr(os, 'pwrite'):
+                self.fd = os.open(self.name, os.O_RDWR | os.O_CREAT)
+                self.writers = None
             else:
-                self.ctn_file = open(self.name + '.qs_dl', 'w')
-                self.ctn = []
-            self.writers = FileWriters(self.name, max(2, int(core_num / 2)), "rb+" if self.ctn else "wb")
-            qs_default_console.print(qs_info_string, 'FILE SIZE' if user_lang != 'zh' else '文件大小'
-                                     , size_format(self.size, align=True))
-            qs_default_console.print(qs_info_string, 'BLOCK SIZE' if user_lang != 'zh' else '块大小'
-                                     , size_format(self.fileBlock, align=True))
+                self.fd = None
+                self.writers = get_file_writers(self.name, max(2, int(core_num / 2)), "rb+" if self.ckpt.count() else "wb")
+            if not self.shared:
+                qs_default_console.print(qs_info_string, 'FILE SIZE' if user_lang != 'zh' else '文件大小'
+                                         , size_format(self.size, align=True))
+                qs_default_console.print(qs_info_string, 'BLOCK SIZE' if user_lang != 'zh' else '块大小'
+                                         , size_format(self.fileBlock, align=True))
+
+    def _add_mirror(self, url: str, r, proxy: str, referer: str):
+        """
+        校验镜像与主url的文件大小和ETag一致后加入下载源
+
+        Add a mirror after checking that its size and ETag match the primary url
+
+        :param url: 镜像url
+        :param r: 主url的文件信息
+        :param proxy: 代理
+        :param referer: referer
+        :return: None
+        """
+        m_url, _, m_r = get_fileinfo(url, proxy, referer, refresh=self.refresh)
+        if not m_r or m_r.headers.get('content-length') != r.headers['content-length']:
+            qs_default_console.print(qs_warning_string, 'Mirror size mismatch, skip:' if user_lang != 'zh' else
+                                     '镜像文件大小不一致，跳过:', url)
+        elif r.headers.get('etag') and m_r.headers.get('etag') and r.headers['etag'] != m_r.headers['etag']:
+            qs_default_console.print(qs_warning_string, 'Mirror ETag mismatch, skip:' if user_lang != 'zh' else
+                                     '镜像ETag不一致，跳过:', url)
+        else:
+            self.mirrors.append(_Mirror(m_url, _validator(m_r)))
+
+    def _pick_mirror(self) -> _Mirror:
+        """
+        选择下载源：按各源单连接吞吐量分配连接，未测速的源优先
+
+        Pick a source: connections are distributed by each source's per-connection throughput,
+        sources not measured yet go first
+
+        :return: _Mirror
+        """
+        with self.schedLock:
+            mirror = min([i for i in self.mirrors if not i.dead],
+                         key=lambda i: (1, (i.active + 1) / i.speed) if i.speed else (0, i.active))
+            mirror.active += 1
+            return mirror
+
+    def _release_mirror(self, mirror: _Mirror, speed):
+        """
+        归还下载源并更新其吞吐量；连续失败的源在仍有其他可用源时被降级停用
+
+        Return a source and update its throughput; a source failing repeatedly is demoted while other
+        sources are still available
+
+        :param mirror: 下载源
+        :param speed: 本次请求的吞吐量，失败时为None
+        :return: None
+        """
+        with self.schedLock:
+            mirror.active -= 1
+            if speed is not None:
+                mirror.fails = 0
+                mirror.speed = speed if not mirror.speed else mirror.speed * 0.7 + speed * 0.3
+                return
+            mirror.fails += 1
+            if mirror.fails >= 3 and not mirror.dead and sum(not i.dead for i in self.mirrors) > 1:
+                mirror.dead = True
+                qs_default_console.print(qs_warning_string, 'Mirror disabled:' if user_lang != 'zh' else
+                                         '停用下载源:', mirror.url)
+
+    def _slot(self, url: str):
+        """
+        占用共享连接预算中的一个名额（未设置预算时不限制）
+
+        Hold a slot of the shared connection budget (no limit without a budget)
+
+        :param url: 请求的url
+        :return: 上下文管理器 | context manager
+        """
+        from contextlib import nullcontext
+        return self.budget.slot(url) if self.budget else nullcontext()
+
+    def _advance(self, n: int):
+        """
+        推进进度条（批量下载时同时推进汇总任务）
+
+        Advance the progress bar (and the aggregate task in batch mode)
+
+        :param n: 字节数
+        :return: None
+        """
+        self.main_progress.advance(self.dl_id, n)
+        if self.total_id is not None:
+            self.main_progress.advance(self.total_id, n)
 
     def _kill_self(self, signum, frame):
         """
@@ -153,38 +574,255 @@ class Downloader:
             self.main_progress.stop()
             qs_default_console.print(qs_info_string,
                                      'Get Ctrl-C, exiting...' if user_lang != 'zh' else '捕获Ctrl-C, 正在退出...')
-            self.ctn_file.close()
             self.pool.shutdown(wait=False)
-            self.writers.wait()
+            self._close_output()
+            self.ckpt.close()
             qs_default_console.print(qs_info_string, 'Deal Done!' if user_lang != 'zh' else '处理完成!')
         os._exit(0)
 
-    def _dl(self, start):
+    def _next_segment(self, wid: int):
+        """
+        为空闲线程分配文件段：优先领取待下载段，否则按吞吐量拆分预计最晚完成的段的后半部分
+
+        Assign a segment to an idle worker: take a pending one first, otherwise steal the tail of the
+        segment expected to finish last, split in proportion to the measured throughput
+
+        :param wid: 线程编号
+        :return: _Segment 或 None（无可分配的段）
+        """
+        with self.schedLock:
+            if self.changed:
+                return None
+            if self.pending:
+                seg = max(self.pending, key=_Segment.remain)
+                self.pending.remove(seg)
+                self.active[wid] = seg
+                return seg
+            victim, victim_id, cost = None, -1, 0
+            for _id, seg in self.active.items():
+                if seg.remain() < 2:
+                    continue
+                _cost = seg.remain() / self.speed[_id] if self.speed[_id] else float('inf')
+                if victim is None or _cost > cost:
+                    victim, victim_id, cost = seg, _id, _cost
+            if victim is None:
+                return None
+            mine, theirs = self.speed[wid], self.speed[victim_id]
+            ratio = mine / (mine + theirs) if mine and theirs else 0.5
+            steal = min(max(int(victim.remain() * ratio), 1), victim.remain() - 1)
+            seg = _Segment(victim.end - steal, victim.end)
+            victim.end = seg.cur
+            self.active[wid] = seg
+            return seg
+
+    def _finish_block(self, seg: _Segment, wid: int) -> bool:
+        """
+        记录一个已完成的文件块并保存断点
+
+        Record a finished block and save the breakpoint
+
+        :param seg: 所属文件段
+        :param wid: 线程编号
+        :return: 该段是否已下载完毕
         """
-        执行文件块下载任务
+        with self.schedLock:
+            self.ckpt.mark(seg.cur)
+            seg.cur += 1
+            while self.prefix < self.ckpt.blocks and self.ckpt.is_done(self.prefix):
+                self.prefix += 1
+            finished = seg.cur >= seg.end
+            if finished:
+                self.active.pop(wid, None)
+        if self.hasher and self.fd is not None:
+            self.hasher.catch_up(self._prefix_size)
+        return finished
+
+    def _dl(self, seg: _Segment, wid: int):
+        """
+        选择下载源并下载文件段
 
-        Perform the file block download task
+        Pick a source and download the segment
 
-        :param start: 文件块起始偏移量
+        :param seg: 文件段
+        :param wid: 线程编号
         :return: None
         """
+        mirror = self._pick_mirror()
         try:
-            _sz = min(start + self.fileBlock, self.size - 1)
-            _headers = self.headers.copy()
-            _headers['Range'] = 'bytes={}-{}'.format(start, _sz)
-            r = get(self.url, headers=_headers, timeout=50, proxies=self.proxies)
-            self.writers.new_job(r.content, start)
-        except Exception as e:
-            msg = repr(e)
-            if self.output_error:
-                qs_default_console.print(qs_error_string, msg[:msg.index('(')])
-            self.job_queue.put(start)
+            self._fetch(seg, wid, mirror.url, mirror.validator)
+        except Exception:
+            self._release_mirror(mirror, None)
+            raise
+        self._release_mirror(mirror, self.speed[wid])
+
+    def _fetch(self, seg: _Segment, wid: int, url: str, validator: str = ''):
+        """
+        以一次Range请求流式下载整个文件段，段尾可能在下载过程中被空闲线程取走；
+        请求带If-Range，服务端返回200说明远程文件已变化
+
+        Stream a whole segment with one Range request; its tail may be stolen by an idle worker meanwhile;
+        the request carries If-Range, so a 200 answer means the remote file has changed
+
+        :param seg: 文件段
+        :param wid: 线程编号
+        :param url: 下载源url
+        :param validator: If-Range的值
+        :return: None
+        """
+        begin = seg.cur * self.fileBlock
+        _headers = self.headers.copy()
+        _headers['Range'] = 'bytes={}-{}'.format(begin, min(seg.end * self.fileBlock, self.size) - 1)
+        if validator:
+            _headers['If-Range'] = validator
+        tm, received, pos = time.time(), 0, begin
+        with self._slot(url), \
+                self.session.get(url, headers=_headers, timeout=50, proxies=self.proxies, stream=True) as r:
+            if r.status_code == 200 and validator:
+                raise RemoteFileChanged(url)
+            if r.status_code != 206:
+                raise RequestException('HTTP %d' % r.status_code)
+            buf = bytearray()
+            for chunk in r.iter_content(chunkSize):
+                if self.changed:
+                    raise RemoteFileChanged(url)
+                if self.limiter:
+                    self.limiter.throttle(url, len(chunk))
+                received += len(chunk)
+                self.speed[wid] = received / max(time.time() - tm, 1e-3)
+                view = memoryview(chunk)
+                while view:
+                    block_start = seg.cur * self.fileBlock
+                    block_end = min(block_start + self.fileBlock, self.size)
+                    n = min(len(view), block_end - pos)
+                    if self.fd is not None:
+                        os.pwrite(self.fd, view[:n], pos)
+                        if self.hasher:
+                            self.hasher.feed(pos, view[:n])
+                    else:
+                        buf += view[:n]
+                    pos += n
+                    view = view[n:]
+                    if pos == block_end:
+                        if self.fd is None:
+                            self.writers.new_job(bytes(buf), block_start)
+                            buf.clear()
+                        self._advance(block_end - block_start)
+                        if self._finish_block(seg, wid):
+                            return
+        raise RequestException('Incomplete segment')
+
+    def _prefix_size(self) -> int:
+        """
+        已连续完成的前缀长度
+
+        Length of the contiguous completed prefix
+
+        :return: 字节数
+        """
+        return min(self.prefix * self.fileBlock, self.size)
+
+    def _verify(self):
+        """
+        比对下载结果的摘要，不一致时报错
+
+        Compare the digest of the download, raise on mismatch
+
+        :return: None
+        """
+        if not self.hasher:
+            return
+        self.hasher.catch_up(lambda: abs(self.size) if self.size != -1 else os.path.getsize(self.name), True)
+        digest = self.hasher.hexdigest()
+        if digest != self.checksum[1]:
+            raise DownloadError(('Checksum mismatch!' if user_lang != 'zh' else '校验失败!') + ' %s %s %s != %s' % (
+                self.name, self.checksum[0], digest, self.checksum[1]))
+        qs_default_console.print(qs_info_string, self.name, self.checksum[0],
+                                 'verified' if user_lang != 'zh' else '校验通过')
+
+    def _close_output(self):
+        """
+        等待写入完成并关闭输出文件
+
+        Wait for pending writes and close the output file
+
+        :return: None
+        """
+        if self.fd is not None:
+            os.close(self.fd)
         else:
-            self.fileLock.acquire()
-            self.ctn.append(start)
-            self.ctn_file.write('%d\n' % start)
-            self.fileLock.release()
-            self.main_progress.advance(self.dl_id, _sz - start)
+            self.writers.close()
+
+    def _check_changed(self):
+        """
+        远程文件在下载过程中发生变化时（断点文件已删除）刷新文件信息缓存并报错，重新下载时从头开始
+
+        If the remote file changed during the download (the breakpoint file is already removed), refresh the
+        cached file information and raise, so that the next download starts over
+
+        :return: None
+        """
+        if not self.changed:
+            return
+        get_fileinfo(*self.source, refresh=True)
+        raise DownloadError('Remote file changed, please download again!' if user_lang != 'zh' else
+                            '远程文件已变化，请重新下载!')
+
+    def _split(self, segments: list) -> list:
+        """
+        将待下载段切分为至多self.num段，使每个线程在启动时都有活干
+
+        Split the pending segments into at most self.num pieces so every worker starts busy
+
+        :param segments: 文件段列表
+        :return: 切分后的文件段列表
+        """
+        total = sum(seg.remain() for seg in segments)
+        res = []
+        for seg in segments:
+            pieces = max(1, min(seg.remain(), round(self.num * seg.remain() / total)))
+            step, extra = divmod(seg.remain(), pieces)
+            cur = seg.cur
+            for i in range(pieces):
+                nxt = cur + step + (1 if i < extra else 0)
+                res.append(_Segment(cur, nxt))
+                cur = nxt
+        return res
+
+    def _worker(self, wid: int):
+        """
+        下载线程：不断领取文件段直至全部完成，失败的段放回待下载队列
+
+        Download worker: keep taking segments until all are done, failed segments go back to the pending list
+
+        :param wid: 线程编号
+        :return: None
+        """
+        while True:
+            seg = self._next_segment(wid)
+            if seg is None:
+                return
+            try:
+                self._dl(seg, wid)
+            except RemoteFileChanged:
+                with self.schedLock:
+                    self.changed = True
+                    self.active.pop(wid, None)
+                return
+            except Exception as e:
+                msg = repr(e)
+                if self.output_error:
+                    qs_default_console.print(qs_error_string, msg[:msg.index('(')] if '(' in msg else msg)
+                with self.schedLock:
+                    self.active.pop(wid, None)
+                    if seg.remain() > 0:
+                        self.pending.append(seg)
+                    self.speed[wid] = 0.0
+                    self.retry_cnt += 1
+                    retry_cnt = self.retry_cnt
+                if retry_cnt > 2:
+                    qs_default_console.print(qs_warning_string, 'Exists File Block Lost, Retrying after 0.5 sec'
+                                             if user_lang != 'zh' else '存在文件块丢失，0.5秒后重试')
+                time.sleep(0.5)
 
     def _single_dl(self):
         """
@@ -194,17 +832,22 @@ class Downloader:
 
         :return: None
         """
-        r = get(self.url, stream=True, proxies=self.proxies, headers=self.headers)
         flag = self.size != -1
-
         if flag:
             self.main_progress.start_task(self.dl_id)
         else:
             self.main_progress.update(self.dl_id, total=-1)
-        with open(self.name, 'wb') as f:
+        with self._slot(self.url), self.session.get(self.url, stream=True, proxies=self.proxies, headers=self.headers) as r, \
+                open(self.name, 'wb') as f:
+            pos = 0
             for chunk in r.iter_content(32768):
+                if self.limiter:
+                    self.limiter.throttle(self.url, len(chunk))
                 f.write(chunk)
-                self.main_progress.advance(self.dl_id, 32768)
+                if self.hasher:
+                    self.hasher.feed(pos, chunk)
+                pos += len(chunk)
+                self._advance(len(chunk))
 
     def run(self):
         """
@@ -218,54 +861,132 @@ class Downloader:
 
         :return: None
         """
-        self.main_progress.start()
+        if not self.shared:
+            self.main_progress.start()
         if self.size > 0:
             self.main_progress.start_task(self.dl_id)
-            if not self.ctn:
+            if not self.ckpt.count():
                 with open(self.name, "wb") as fp:
                     fp.truncate(self.size)
-            self.main_progress.advance(self.dl_id, self.fileBlock*len(self.ctn))
-            for i in range(0, self.size, self.fileBlock):
-                if self.ctn and i in self.ctn:
-                    continue
+                if self.fd is not None and hasattr(os, 'posix_fallocate'):
+                    try:
+                        os.posix_fallocate(self.fd, 0, self.size)
+                    except OSError:
+                        pass
+            blocks, start, done = self.ckpt.blocks, -1, 0
+            for i in range(blocks + 1):
+                if i < blocks and not self.ckpt.is_done(i):
+                    if start < 0:
+                        start = i
                 else:
-                    self.job_queue.put(i)
-            retry_cnt = 0
-            while not self.job_queue.empty():
-                self.futures.clear()
-                while not self.job_queue.empty():
-                    cur = self.job_queue.get()
-                    if cur not in self.ctn:
-                        self.futures.append(self.pool.submit(self._dl, cur))
-                wait(self.futures)
-                if not self.job_queue.empty() and retry_cnt > 2:
-                    qs_default_console.print(qs_warning_string, 'Exists File Block Lost, Retrying after 0.5 sec'
-                                             if user_lang != 'zh' else '存在文件块丢失，0.5秒后重试')
-                    time.sleep(0.5)
-                retry_cnt += 1
-            self.writers.wait()
-            self.ctn_file.close()
-            os.remove(self.name + '.qs_dl')
+                    if i < blocks:
+                        done += min(self.fileBlock, self.size - i * self.fileBlock)
+                    if start >= 0:
+                        self.pending.append(_Segment(start, i))
+                        start = -1
+            self._advance(done)
+            if len(self.pending) < self.num and self.pending:  # * 预先切分，让每个线程都能拿到初始文件段
+                self.pending = self._split(self.pending)
+            wait([self.pool.submit(self._worker, wid) for wid in range(self.num)])
+            self._close_output()
+            self.ckpt.close(remove=True)
         else:
             self._single_dl()
-        self.main_progress.stop()
+        try:
+            self._check_changed()
+            self._verify()
+        finally:
+            if self.shared:
+                self.main_progress.remove_task(self.dl_id)
+            else:
+                self.main_progress.stop()
         qs_default_console.print(qs_info_string, self.name, 'download done!' if user_lang != 'zh' else '下载完成!')
 
 
-def normal_dl(url, set_name: str = '', set_proxy: str = '', set_referer: str = '', output_error: bool = False):
+def normal_dl(url, set_name: str = '', set_proxy: str = '', set_referer: str = '', output_error: bool = False,
+              stream: bool = True, checksum: tuple = None, checksum_file: str = '', engine: str = 'thread',
+              limiter=None):
     """
     自动规划下载线程数量并开始并行下载
 
     Automatically schedule the number of download threads and begin parallel downloads
 
-    :param url: 文件url
+    :param url: 文件url，或同一文件的多个镜像url列表
     :param set_name: 设置文件名（默认采用url所指向的资源名）
     :param set_proxy: 设置代理（默认无代理）
     :param set_referer: 设置referer
     :param output_error: 输出报错信息
+    :param stream: 流式写入
+    :param checksum: 期望的摘要 (算法名, 十六进制摘要)
+    :param checksum_file: 校验和文件
+    :param engine: 'thread' (线程池) | 'async' (asyncio，最多256个并发请求)
+    :param limiter: 限速器 QuickStart_Rhy.NetTools.RateLimit.RateLimiter
     :return: None
     """
-    Downloader(url, min(16, core_num * 4), set_name, set_proxy, set_referer, output_error).run()
+    if engine == 'async':
+        from .AsyncDL import supports_proxy
+        engine = 'async' if supports_proxy(set_proxy) else 'thread'
+    if engine == 'async':
+        from .AsyncDL import AsyncDownloader
+        AsyncDownloader(url, 256, set_name, set_proxy, set_referer, output_error, stream,
+                        checksum=checksum, checksum_file=checksum_file, limiter=limiter).run()
+    else:
+        Downloader(url, min(16, core_num * 4), set_name, set_proxy, set_referer, output_error, stream,
+                   checksum=checksum, checksum_file=checksum_file, limiter=limiter).run()
+
+
+def batch_dl(urls: list, total_conn: int = 32, host_conn: int = 8, set_proxy: str = '', set_referer: str = '',
+             output_error: bool = False, checksum_file: str = '', limiter=None):
+    """
+    批量下载：全部文件共享一个连接数预算（全局与单主机上限）和一个汇总进度条，小文件与大文件重叠下载
+
+    Batch download: all files share one connection budget (global and per-host caps) and one aggregate
+    progress display, small files overlap with large ones
+
+    :param urls: 文件url列表
+    :param total_conn: 全局最大并发连接数
+    :param host_conn: 单个主机最大并发连接数
+    :param set_proxy: 设置代理（默认无代理）
+    :param set_referer: 设置referer
+    :param output_error: 输出报错信息
+    :param checksum_file: 校验和文件，按文件名查找期望的摘要
+    :param limiter: 全部文件共享的限速器 QuickStart_Rhy.NetTools.RateLimit.RateLimiter
+    :return: 下载失败的url列表
+    """
+    from concurrent.futures import as_completed
+    budget = ConnectionBudget(total_conn, host_conn)
+    progress = Downloader.Progress(
+        Downloader.TextColumn("[bold blue]{task.fields[filename]}", justify="right"),
+        Downloader.BarColumn(bar_width=None),
+        "[progress.percentage]{task.percentage:>3.1f}%",
+        "•",
+        Downloader.DownloadColumn(),
+        "•",
+        Downloader.TransferSpeedColumn(),
+        "•",
+        Downloader.TimeRemainingColumn(),
+        console=qs_default_console
+    )
+    total_id = progress.add_task('Total', filename='0/%d' % len(urls), total=0)
+    failed = []
+
+    def _dl_one(url):
+        Downloader(url, min(16, core_num * 4), proxy=set_proxy, referer=set_referer, output_error=output_error,
+                   progress=progress, total_id=total_id, budget=budget, checksum_file=checksum_file,
+                   limiter=limiter).run()
+
+    progress.start()
+    with ThreadPoolExecutor(max_workers=total_conn) as pool:
+        futures = {pool.submit(_dl_one, url): url for url in urls}
+        for index, future in enumerate(as_completed(futures)):
+            try:
+                future.result()
+            except Exception as e:
+                failed.append(futures[future])
+                qs_default_console.print(qs_error_string, futures[future], repr(e))
+            progress.update(total_id, filename='%d/%d' % (index + 1, len(urls)))
+    progress.stop()
+    return failed
 
 
 if __name__ == '__main__':
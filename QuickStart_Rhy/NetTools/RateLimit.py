@@ -0,0 +1,206 @@
+# coding=utf-8
+"""
+下载限速：全部下载线程共享的令牌桶（全局与单主机）
+
+Download throttling: token buckets shared by all download threads (global and per host)
+"""
+import re
+import time
+from threading import Lock
+from urllib.parse import urlparse
+
+
+def parse_rate(rate) -> float:
+    """
+    解析速率字符串
+
+    Parse a rate string
+
+    :param rate: 如 '500K', '1.5MB/s', '2G', '10KiB' (1024进制) 或字节数 (bytes per second)
+    :return: 字节每秒，0表示不限速
+    """
+    if not rate:
+        return 0
+    if isinstance(rate, (int, float)):
+        return float(rate)
+    match = re.fullmatch(r'(\d+(?:\.\d*)?|\.\d+)\s*([KMG]?)(I?)B?(?:/S)?', rate.strip().upper())
+    if not match or (match.group(3) and not match.group(2)):
+        raise ValueError('Invalid rate: %s' % rate)
+    number, prefix, binary = match.groups()
+    return float(number) * ((1024 if binary else 1000) ** ' KMG'.index(prefix or ' '))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float = 0):
+        """
+        令牌桶：允许透支，透支的调用者按欠额等待，长期速率精确等于rate
+
+        Token bucket: callers may overdraw and then wait for the debt, so the long-run rate is exactly rate
+
+        :param rate: 字节每秒
+        :param burst: 桶容量，默认为0.1秒的流量
+        """
+        self.rate = rate
+        self.capacity = burst or rate / 10
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.lock = Lock()
+
+    def reserve(self, n: int) -> float:
+        """
+        取走n个令牌
+
+        Take n tokens
+
+        :param n: 字节数
+        :return: 需要等待的秒数
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate) - n
+            self.stamp = now
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+
+class RateLimiter:
+    def __init__(self, rate: float = 0, host_rate: float = 0, host_rates: dict = None):
+        """
+        全局与单主机限速器，每读取一块数据后调用，连接保持持续的低速传输而不是时断时续
+
+        Global and per-host limiter, called after every chunk read so connections keep flowing at a lower
+        speed instead of bursting and idling
+
+        :param rate: 全局速率（字节每秒），0表示不限
+        :param host_rate: 每个主机的默认速率，0表示不限
+        :param host_rates: {主机: 速率}，覆盖host_rate
+        """
+        self.total = TokenBucket(rate) if rate else None
+        self.host_rate = host_rate
+        self.host_rates = host_rates or {}
+        self.hosts = {}
+        self.lock = Lock()
+
+    def delay(self, url: str, n: int) -> float:
+        """
+        记录传输的n字节，返回需要等待的秒数（供asyncio使用）
+
+        Account n transferred bytes and return the seconds to wait (for asyncio)
+
+        :param url: 请求的url
+        :param n: 字节数
+        :return: 秒数
+        """
+        wait = self.total.reserve(n) if self.total else 0
+        host = urlparse(url).hostname
+        rate = self.host_rates.get(host, self.host_rate)
+        if rate:
+            with self.lock:
+                if host not in self.hosts:
+                    self.hosts[host] = TokenBucket(rate)
+                bucket = self.hosts[host]
+            wait = max(wait, bucket.reserve(n))
+        return wait
+
+    def throttle(self, url: str, n: int):
+        """
+        记录传输的n字节，必要时阻塞等待
+
+        Account n transferred bytes and block if needed
+
+        :param url: 请求的url
+        :param n: 字节数
+        :return: None
+        """
+        wait = self.delay(url, n)
+        if wait:
+            time.sleep(wait)
+
+
+def get_rate_limiter(rate='', host_rate=''):
+    """
+    根据参数与 ~/.qsrc 中的 basic_settings.download_rate_limit / download_host_rate_limit 创建限速器
+
+    Create a limiter from the arguments and basic_settings.download_rate_limit / download_host_rate_limit in ~/.qsrc
+
+    download_host_rate_limit 可以是速率字符串（对每个主机生效）或 {主机: 速率}
+
+    download_host_rate_limit may be a rate string (applied to every host) or {host: rate}
+
+    :param rate: 全局速率，如 '10M'，为空时使用配置表
+    :param host_rate: 单主机速率，为空时使用配置表
+    :return: RateLimiter，不限速时为None
+    """
+    from .. import qs_config
+    rate = parse_rate(rate or qs_config['basic_settings'].get('download_rate_limit', ''))
+    host_rates = {}
+    if not host_rate:
+        host_rate = qs_config['basic_settings'].get('download_host_rate_limit', '')
+        if isinstance(host_rate, dict):
+            host_rates = {k: parse_rate(v) for k, v in host_rate.items()}
+            host_rate = ''
+    host_rate = parse_rate(host_rate)
+    if not (rate or host_rate or host_rates):
+        return None
+    return RateLimiter(rate, host_rate, host_rates)
+
+
+def _benchmark(rate: float = 5e6, seconds: float = 5, threads: int = 16):
+    """
+    在本地http服务上测试限速精度
+
+    Measure the throttle accuracy against a local http server
+
+    :param rate: 目标速率
+    :param seconds: 测试时长
+    :param threads: 下载线程数
+    :return: (实际速率, 相对误差)
+    """
+    import os
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from concurrent.futures import ThreadPoolExecutor
+    from threading import Thread
+    from . import get_session
+    payload = os.urandom(1 << 20)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(payload) * 64))
+            self.end_headers()
+            try:
+                for _ in range(64):
+                    self.wfile.write(payload)
+            except OSError:
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:%d/' % server.server_address[1]
+    limiter, session = RateLimiter(rate), get_session(threads)
+    received, lock, deadline = [0], Lock(), time.monotonic() + seconds
+
+    def _worker():
+        with session.get(url, stream=True) as r:
+            for chunk in r.iter_content(1 << 16):
+                limiter.throttle(url, len(chunk))
+                with lock:
+                    received[0] += len(chunk)
+                if time.monotonic() >= deadline:
+                    return
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(threads) as pool:
+        for _ in range(threads):
+            pool.submit(_worker)
+    speed = received[0] / (time.monotonic() - start)
+    server.shutdown()
+    return speed, abs(speed - rate) / rate
+
+
+if __name__ == '__main__':
+    import sys
+    _speed, _error = _benchmark(parse_rate(sys.argv[1]) if len(sys.argv) > 1 else 5e6)
+    print('%.0f B/s, error %.2f%%' % (_speed, _error * 100))
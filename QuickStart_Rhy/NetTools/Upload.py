@@ -0,0 +1,284 @@
+# coding=utf-8
+"""
+qs http上传接口的客户端：文件按块切分后并行上传，中断后从服务端记录的已接收区间继续
+
+Client of the qs http upload endpoint: the file is split into chunks uploaded in parallel, an interrupted
+upload continues from the spans the server has already received
+"""
+from . import size_format, get_session
+from .. import user_lang, qs_default_console, qs_error_string, qs_info_string, headers
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.exceptions import RequestException, ConnectionError, Timeout
+from threading import Thread
+import random
+import queue
+import time
+import io
+import os
+
+
+class Uploader:
+    from rich.progress import (
+        BarColumn,
+        DownloadColumn,
+        TextColumn,
+        TransferSpeedColumn,
+        TimeRemainingColumn,
+        Progress,
+    )
+
+    def __init__(self, path: str, url: str, token: str, num: int = 8, chunk_size: int = 8 << 20,
+                 retries: int = 5, limiter=None):
+        """
+        qs并行分块上传
+
+        Qs parallel chunked upload
+
+        :param path: 本地文件
+        :param url: 上传地址，以'/'结尾时追加本地文件名
+        :param token: 服务端的上传令牌
+        :param num: 并行连接数
+        :param chunk_size: 块大小
+        :param retries: 每块的最大重试次数
+        :param limiter: 限速器 QuickStart_Rhy.NetTools.RateLimit.RateLimiter
+        """
+        self.path = path
+        self.url = url + os.path.basename(path) if url.endswith('/') else url
+        self.num, self.chunk_size, self.retries, self.limiter = num, max(1, chunk_size), retries, limiter
+        self.size = os.path.getsize(path)
+        self.headers = dict(headers, Authorization='Bearer ' + token)
+        self.session = get_session(num)
+        self.progress = Uploader.Progress(
+            Uploader.TextColumn("[bold blue]{task.fields[filename]}", justify="right"),
+            Uploader.BarColumn(bar_width=None),
+            "[progress.percentage]{task.percentage:>3.1f}%",
+            "•",
+            Uploader.DownloadColumn(),
+            "•",
+            Uploader.TransferSpeedColumn(),
+            "•",
+            Uploader.TimeRemainingColumn(),
+            console=qs_default_console
+        )
+
+    def missing(self) -> list:
+        """
+        查询服务端已接收的区间，返回仍需上传的块
+
+        Query the spans the server already has and return the chunks still to upload
+
+        :return: [(start, end)]
+        """
+        r = self.session.get(self.url, params={'upload': ''}, headers=self.headers)
+        r.raise_for_status()
+        state = r.json()
+        received = state['received'] if state['size'] == self.size and not state['complete'] else []
+        res, pos = [], 0
+        for start, end in received + [[self.size, self.size]]:
+            for i in range(pos, start, self.chunk_size):
+                res.append((i, min(i + self.chunk_size, start)))
+            pos = max(pos, end)
+        return res
+
+    def _put(self, fd: int, start: int, end: int):
+        """
+        上传一块，失败时按指数退避重试
+
+        Upload one chunk, retrying with exponential backoff
+
+        :param fd: 文件描述符
+        :param start: 起始位置
+        :param end: 结束位置（不含）
+        :return: 服务端返回的上传状态
+        """
+        data = os.pread(fd, end - start, start) if hasattr(os, 'pread') else None
+        if data is None:
+            with open(self.path, 'rb') as f:
+                f.seek(start)
+                data = f.read(end - start)
+        if self.limiter:
+            self.limiter.throttle(self.url, len(data))
+        error = None
+        for retry in range(self.retries + 1):
+            if retry:
+                time.sleep(min(30.0, 0.5 * 2 ** retry) * random.uniform(0.5, 1.5))
+            try:
+                r = self.session.put(self.url, data=data, headers=dict(
+                    self.headers, **{'Content-Range': 'bytes %d-%d/%d' % (start, end - 1, self.size)}))
+            except (ConnectionError, Timeout) as e:
+                error = e
+                continue
+            if r.status_code >= 500 or r.status_code == 429:
+                error = RequestException('HTTP %d' % r.status_code, response=r)
+                continue
+            r.raise_for_status()
+            return r.json()
+        raise error
+
+    def run(self) -> bool:
+        """
+        开始上传
+
+        Start uploading
+
+        :return: 是否上传成功
+        """
+        name = os.path.basename(self.path)
+        try:
+            if not self.size:
+                r = self.session.put(self.url, data=b'', headers=self.headers)
+                r.raise_for_status()
+                qs_default_console.print(qs_info_string, self.url)
+                return True
+            chunks = self.missing()
+        except (RequestException, ValueError) as e:
+            qs_default_console.print(qs_error_string, repr(e))
+            return False
+        if not chunks:
+            qs_default_console.print(qs_info_string, 'Already uploaded' if user_lang != 'zh' else '已上传', self.url)
+            return True
+        todo = sum(end - start for start, end in chunks)
+        if todo != self.size:
+            qs_default_console.print(qs_info_string, 'Resume upload' if user_lang != 'zh' else '继续上传',
+                                     size_format(todo))
+        task = self.progress.add_task('Upload', filename=name, total=self.size, completed=self.size - todo)
+        fd = os.open(self.path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        state, ok = None, True
+        self.progress.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.num) as pool:
+                futures = {pool.submit(self._put, fd, start, end): (start, end) for start, end in chunks}
+                for future in as_completed(futures):
+                    try:
+                        res = future.result()
+                        state = res if res and res['complete'] else state
+                        self.progress.advance(task, futures[future][1] - futures[future][0])
+                    except Exception as e:
+                        ok = False
+                        qs_default_console.print(qs_error_string, futures[future], repr(e))
+        finally:
+            self.progress.stop()
+            os.close(fd)
+        if ok and state:
+            qs_default_console.print(qs_info_string, self.url)
+        elif ok:
+            qs_default_console.print(qs_error_string, 'Server did not finish the upload'
+                                     if user_lang != 'zh' else '服务端未完成上传')
+        return ok and bool(state)
+
+
+class UploadStream(io.RawIOBase):
+    def __init__(self, url: str, token: str, max_pending: int = 16):
+        """
+        可写的上传流：写入的数据经有界队列交给后台线程，以chunked编码的单个PUT请求上传，可直接作为Tar/Zip的输出
+
+        Writable upload stream: written data goes through a bounded queue to a background thread that sends it as
+        one chunked PUT request, usable directly as the output of Tar/Zip
+
+        :param url: 上传地址
+        :param token: 服务端的上传令牌
+        :param max_pending: 队列中最多等待发送的块数（限制内存占用）
+        """
+        super().__init__()
+        self.url = url
+        self.headers = dict(headers, Authorization='Bearer ' + token)
+        self.queue = queue.Queue(max_pending)
+        self.error, self.state, self.sent = None, None, 0
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _body(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                return
+            self.sent += len(chunk)
+            yield chunk
+
+    def _run(self):
+        try:
+            r = get_session().put(self.url, data=self._body(), headers=self.headers)
+            r.raise_for_status()
+            self.state = r.json()
+        except Exception as e:
+            self.error = e
+
+    def _put(self, item):
+        while True:
+            if not self.thread.is_alive():
+                raise IOError(repr(self.error) if self.error else 'upload stopped')
+            try:
+                return self.queue.put(item, timeout=1)
+            except queue.Full:
+                continue
+
+    def writable(self) -> bool:
+        return True
+
+    def __del__(self):
+        pass  # * 只有显式close才结束上传，出错后被回收时不再等待服务端
+
+    def write(self, data) -> int:
+        if data:
+            self._put(bytes(data))
+        return len(data)
+
+    def close(self):
+        """
+        结束上传并等待服务端确认
+
+        Finish the upload and wait for the server's response
+
+        :return: None
+        """
+        if self.closed:
+            return
+        try:
+            if self.thread.is_alive():
+                self._put(None)
+            self.thread.join()
+        finally:
+            super().close()
+        if self.error:
+            raise self.error
+        qs_default_console.print(qs_info_string, self.url, size_format(self.sent))
+
+
+def upload_stream(fileobj, url: str, token: str) -> bool:
+    """
+    将流（如标准输入）上传到qs http服务，不需要预先知道大小
+
+    Upload a stream (such as stdin) to a qs http server without knowing its size in advance
+
+    :param fileobj: 可读的二进制文件对象
+    :param url: 上传地址
+    :param token: 服务端的上传令牌
+    :return: 是否上传成功
+    """
+    from ..SystemTools.Compress import read_blocks
+    stream = UploadStream(url, token)
+    try:
+        for block in read_blocks(fileobj):
+            stream.write(block)
+        stream.close()
+    except Exception as e:
+        qs_default_console.print(qs_error_string, repr(e))
+        return False
+    return True
+
+
+def upload(path: str, url: str, token: str, num: int = 8, chunk_size: int = 8 << 20, limiter=None) -> bool:
+    """
+    将文件上传到qs http服务
+
+    Upload a file to a qs http server
+
+    :param path: 本地文件
+    :param url: 上传地址
+    :param token: 服务端的上传令牌
+    :param num: 并行连接数
+    :param chunk_size: 块大小
+    :param limiter: 限速器
+    :return: 是否上传成功
+    """
+    return Uploader(path, url, token, num, chunk_size, limiter=limiter).run()
@@ -5,10 +5,36 @@ qs的网络工具库
 The network tool library of QS
 """
 import socket
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
 from .. import headers
 
+_session = None
+_session_pool_size = 0
+_session_lock = threading.Lock()
+
+
+def get_session(pool_size: int = 16) -> requests.Session:
+    """
+    获取全部下载线程共享的会话，同一主机的连接保持长连接并被复用
+
+    Get the session shared by all download threads, connections to the same host are kept alive and reused
+
+    :param pool_size: 每个主机的连接池大小，通常为线程数；更大的值会扩大已有连接池
+    :return: requests.Session
+    """
+    global _session, _session_pool_size
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        if pool_size > _session_pool_size:
+            _session_pool_size = pool_size
+            for prefix in ['http://', 'https://']:
+                _session.mount(prefix, HTTPAdapter(pool_connections=16, pool_maxsize=pool_size))
+        return _session
+
 
 def is_ipv4(ip: str) -> bool:
     """
@@ -90,7 +116,7 @@ def check_one_page(url: str) -> bool:
     :return: True或False
     """
     try:
-        response = requests.head(url, headers=headers).status_code
+        response = get_session().head(url, headers=headers).status_code
         return response == requests.codes.ok
     except RequestException:
         return False
@@ -184,40 +210,157 @@ def get_ip_info() -> dict:
         return {}
 
 
-def get_fileinfo(url: str, proxy: str = '', referer: str = '') -> (str, str, requests.Response):
+class FileInfo:
+    def __init__(self, status_code: int, headers: dict):
+        """
+        文件探测结果
+
+        Result of probing a file
+
+        :param status_code: 状态码
+        :param headers: 头部信息 (键均为小写，accept-ranges 为 'bytes' 或 'none')
+        """
+        self.status_code = status_code
+        self.headers = headers
+
+
+_fileinfo_lock = threading.Lock()
+_fileinfo_keys = ['content-length', 'content-disposition', 'etag', 'last-modified', 'accept-ranges']
+_fileinfo_cache = None  # * 本进程的缓存，首次使用时读入，新增的记录在进程退出时一次性写回
+_fileinfo_dirty = {}
+
+
+def _fileinfo_cache_path() -> str:
+    from .. import user_root
+    return user_root + '.qs_fileinfo.json'
+
+
+def _load_fileinfo_cache(ttl: float) -> dict:
+    import json
+    import time
+    now = time.time()
+    try:
+        with open(_fileinfo_cache_path(), 'r', encoding='utf8') as f:
+            return {k: v for k, v in json.load(f).items() if now - v['time'] < ttl}  # * 读入时丢弃过期记录
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return {}
+
+
+def _get_fileinfo_cache(ttl: float) -> dict:
+    global _fileinfo_cache
+    with _fileinfo_lock:
+        if _fileinfo_cache is None:
+            import atexit
+            _fileinfo_cache = _load_fileinfo_cache(ttl)
+            atexit.register(_flush_fileinfo_cache, ttl)
+        return _fileinfo_cache
+
+
+def _save_fileinfo(key: str, url: str, filename: str, info: FileInfo, ttl: float):
+    import time
+    cache = _get_fileinfo_cache(ttl)
+    with _fileinfo_lock:
+        cache[key] = _fileinfo_dirty[key] = {'time': time.time(), 'url': url, 'filename': filename,
+                                             'headers': info.headers}
+
+
+def _flush_fileinfo_cache(ttl: float):
     """
-    获取待下载的文件信息
+    将本进程新增的记录合并进 ~/.qs_fileinfo.json（重新读取文件，保留其他进程期间写入的记录）
 
-    Gets information about the file to be downloaded
+    Merge the records added by this process into ~/.qs_fileinfo.json (the file is read again so records written
+    by other processes meanwhile are kept)
+
+    :param ttl: 有效期
+    :return: None
+    """
+    import os
+    import json
+    with _fileinfo_lock:
+        if not _fileinfo_dirty:
+            return
+        cache = _load_fileinfo_cache(ttl)
+        cache.update(_fileinfo_dirty)
+        _fileinfo_dirty.clear()
+    tmp = _fileinfo_cache_path() + '.%d' % os.getpid()
+    try:
+        with open(tmp, 'w', encoding='utf8') as f:
+            json.dump(cache, f)
+        os.replace(tmp, _fileinfo_cache_path())
+    except OSError:
+        pass
+
+
+def get_fileinfo(url: str, proxy: str = '', referer: str = '', use_cache: bool = True,
+                 refresh: bool = False) -> (str, str, FileInfo):
+    """
+    获取待下载的文件信息：一次HEAD请求解析全部重定向，服务器拒绝HEAD时改用 Range: bytes=0-0 的GET请求，
+    并探测是否支持Range；结果按源url缓存在 ~/.qs_fileinfo.json 中，有效期为配置表中的 fileinfo_cache_ttl 秒（默认600，0表示不缓存），
+    缓存文件只在进程启动后首次使用时读取、退出时写回一次
+
+    Gets information about the file to be downloaded: one HEAD request resolves the whole redirect chain, a
+    Range: bytes=0-0 GET is used when the server rejects HEAD, and Range support is detected up front; results are
+    cached per source url in ~/.qs_fileinfo.json for fileinfo_cache_ttl seconds in the config (default 600, 0 disables),
+    the cache file is read once on first use and written back once at exit
 
     :param url: 文件url
     :param proxy: 代理
     :param referer: 绕反爬
-    :return: 真实url，文件名，http头部信息 (headers中键值均为小写)
+    :param use_cache: 是否使用缓存
+    :param refresh: 不读取缓存中的记录而重新请求（结果仍写入缓存），续传时用于校验断点
+    :return: 真实url，文件名，FileInfo (headers中键值均为小写)
     """
     import re
     import os
+    import time
+    from urllib.parse import urlparse
+    from .. import qs_config
+    ttl = qs_config['basic_settings'].get('fileinfo_cache_ttl', 600)
+    key = url + ('|' + referer if referer else '')
+    if use_cache and ttl and not refresh:
+        cached = _get_fileinfo_cache(ttl).get(key)
+        if cached and time.time() - cached['time'] < ttl:
+            return cached['url'], cached['filename'], FileInfo(200, cached['headers'])
     proxies = {
         'http': 'http://'+proxy,
         'https': 'https://'+proxy
     } if proxy else {}
-    if referer:
-        headers['referer'] = referer
+    # * 声明identity，避免服务端返回压缩后的长度导致分段错位
+    _headers = dict(headers, referer=referer) if referer else dict(headers)
+    _headers['Accept-Encoding'] = 'identity'
+    session = get_session()
     try:
-        res = requests.head(url, headers=headers, proxies=proxies)
+        res = session.head(url, headers=_headers, proxies=proxies, allow_redirects=True)
+        info = {i[0]: i[1] for i in res.headers.lower_items()}
+        url = res.url
+        if res.status_code >= 400 or 'content-length' not in info or 'accept-ranges' not in info:
+            with session.get(url, headers=dict(_headers, Range='bytes=0-0'), proxies=proxies, stream=True) as res:
+                url = res.url
+                res.raise_for_status()
+                probe = {i[0]: i[1] for i in res.headers.lower_items()}
+                if res.status_code == 206:
+                    info.update(probe)
+                    total = probe.get('content-range', '').split('/')[-1]
+                    if total.isdigit():
+                        info['content-length'] = total
+                    else:
+                        info.pop('content-length', None)
+                    info['accept-ranges'] = 'bytes'
+                else:
+                    info = probe
+                    info['accept-ranges'] = 'none'
     except Exception as e:
         return '', repr(e), None
-    while res.status_code == 302 or res.status_code == 301:
-        url = {i[0]: i[1] for i in res.headers.lower_items()}['location']
-        res = requests.head(url, headers=headers, proxies=proxies)
-    res.headers = {i[0]: i[1] for i in res.headers.lower_items()}
+    if info.get('accept-ranges', '').lower() != 'bytes':
+        info['accept-ranges'] = 'none'
+    res = FileInfo(res.status_code, {k: v for k, v in info.items() if k in _fileinfo_keys})
+    filename = ''
     if 'content-disposition' in res.headers:
-        try:
-            filename = re.findall('filename=(.*?);', res.headers['content-disposition'])[0]
-        except IndexError:
-            from urllib.parse import urlparse
-            filename = os.path.basename(urlparse(url).path.strip('/'))
-    else:
-        from urllib.parse import urlparse
+        filename = re.findall('filename=(.*?)(?:;|$)', res.headers['content-disposition'])
+        filename = filename[0].strip() if filename else ''
+    if not filename:
         filename = os.path.basename(urlparse(url).path.strip('/'))
-    return url, re.sub(r"^\W+|\W+$", "", filename), res
+    filename = re.sub(r"^\W+|\W+$", "", filename)
+    if use_cache and ttl:
+        _save_fileinfo(key, url, filename, res, ttl)
+    return url, filename, res
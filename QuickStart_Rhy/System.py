@@ -42,26 +42,74 @@ def clear_mem():
 
 
 @_wrapper.mkCompressPackageWrap
-def _mktar(filePath: str = ''):
-    from .SystemTools.Compress import Tar
-    return Tar(filePath + '.tar.gz', 'w')
+def _mktar(filePath='', threads: int = 0, codec: str = 'gz', level: int = None, output=None):
+    from . import dir_char
+    from .SystemTools.Compress import Tar, tarCodecs
+    if not isinstance(filePath, str):
+        return Tar(filePath, 'w', threads, codec, level)
+    if output:
+        return Tar(output(filePath.split(dir_char)[-1] + tarCodecs[codec]), 'w', threads, codec, level)
+    return Tar(filePath + tarCodecs[codec], 'w', threads, codec, level)
 
 
 def mktar():
     """
-    创建tar包
+    创建tar包，--codec gz|zstd|xz|none 选择压缩编码，--level 指定压缩等级，-j/--threads 指定线程数；
+    qs mktar - <paths> 写到标准输出，--put <url> -token <token> 边压缩边上传到qs http
 
-    Create a tar packages
+    Create a tar packages, --codec gz|zstd|xz|none picks the codec, --level sets the compression level and
+    -j/--threads the number of threads; qs mktar - <paths> writes to stdout, --put <url> -token <token> streams the
+    archive into a qs http upload while compressing
 
     :return: None
     """
-    return _mktar()
+    import sys
+    from .SystemTools.Compress import tarCodecs
+    options = {}
+    for flag, key, cast in (('--codec', 'codec', str), ('--level', 'level', int)):
+        if flag in sys.argv:
+            index = sys.argv.index(flag)
+            options[key] = cast(sys.argv[index + 1])
+            sys.argv = sys.argv[:index] + sys.argv[index + 2:]
+    if options.get('codec', 'gz') not in tarCodecs:
+        from . import qs_default_console, qs_error_string
+        return qs_default_console.print(qs_error_string, '--codec: %s' % ' | '.join(tarCodecs))
+    uploads = []
+    if '--put' in sys.argv:
+        index = sys.argv.index('--put')
+        url, token = sys.argv[index + 1], ''
+        sys.argv = sys.argv[:index] + sys.argv[index + 2:]
+        if '-token' in sys.argv:
+            index = sys.argv.index('-token')
+            token = sys.argv[index + 1]
+            sys.argv = sys.argv[:index] + sys.argv[index + 2:]
+        from .NetTools.Upload import UploadStream
+
+        def output(name: str):
+            uploads.append(UploadStream(url + name if url.endswith('/') else url, token))
+            return uploads[-1]
+
+        options['output'] = output
+    try:
+        _mktar(**options)
+    except Exception:
+        for upload in uploads:
+            try:
+                upload.close()
+            except Exception:
+                pass
+        raise
+    for upload in uploads:
+        upload.close()
 
 
 @_wrapper.unCompressPackageWrap
-def _untar(filePath: str = ''):
+def _untar(filePath: str = '', threads: int = 0):
     from .SystemTools.Compress import Tar
-    return Tar(filePath)
+    if filePath == '-':
+        import sys
+        return Tar(sys.stdin.buffer, 'r', threads)
+    return Tar(filePath, 'r', threads)
 
 
 def untar():
@@ -76,9 +124,9 @@ def untar():
 
 
 @_wrapper.mkCompressPackageWrap
-def _mkzip(filePath: str = ''):
+def _mkzip(filePath='', threads: int = 0):
     from .SystemTools.Compress import Zip
-    return Zip(filePath + '.zip', 'w')
+    return Zip(filePath + '.zip' if isinstance(filePath, str) else filePath, 'w', threads)
 
 
 def mkzip():
@@ -93,9 +141,12 @@ def mkzip():
 
 
 @_wrapper.unCompressPackageWrap
-def _unzip(filePath: str = ''):
+def _unzip(filePath: str = '', threads: int = 0):
     from .SystemTools.Compress import Zip
-    return Zip(filePath, 'r')
+    if filePath == '-':
+        import sys
+        return Zip(sys.stdin.buffer, 'r', threads)  # * zip的目录在文件末尾，流式读取会报错提示
+    return Zip(filePath, 'r', threads)
 
 
 def unzip():
@@ -110,7 +161,7 @@ def unzip():
 
 
 @_wrapper.unCompressPackageWrap
-def _unrar(filePath: str = ''):
+def _unrar(filePath: str = '', threads: int = 0):
     from .SystemTools.Compress import Rar
     return Rar(filePath)
 
@@ -127,7 +178,7 @@ def unrar():
 
 
 @_wrapper.mkCompressPackageWrap
-def _mk7z(filePath: str = ''):
+def _mk7z(filePath: str = '', threads: int = 0):
     from .SystemTools.Compress import SevenZip
     return SevenZip(filePath + '.7z', 'w')
 
@@ -144,7 +195,7 @@ def mk7z():
 
 
 @_wrapper.unCompressPackageWrap
-def _un7z(filePath: str = ''):
+def _un7z(filePath: str = '', threads: int = 0):
     from .SystemTools.Compress import SevenZip
     return SevenZip(filePath)
 
@@ -7,11 +7,30 @@ Compress and decompress all kinds of files
 import io
 import os
 import sys
+import gzip
+import lzma
+import zlib
+import time
+import shutil
+import struct
 import tarfile
+import threading
 import zipfile
 import rarfile
 import py7zr
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from .. import dir_char, user_lang
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+blockSize = 1 << 20  # * 并行压缩的块大小
+dictSize = 1 << 15  # * 每块以前一块末尾32KB作为预置字典，压缩率接近单线程
+zstdMagic = b'\x28\xb5\x2f\xfd'
+tarCodecs = {'gz': '.tar.gz', 'zstd': '.tar.zst', 'xz': '.tar.xz', 'none': '.tar'}  # * 编码 -> 扩展名
+defaultLevels = {'gz': 6, 'zstd': 3, 'xz': 6, 'none': 0}
 
 
 def get_compress_package_name():
@@ -51,7 +70,7 @@ def checkIsProtocolFile(protocol, path):
     :return:
     """
     if os.path.exists(path):
-        if protocol == tarfile and not tarfile.is_tarfile(path):
+        if protocol == tarfile and not tarfile.is_tarfile(path) and not is_zstd_file(path):
             raise TypeError("%s " + ('Not recognized by tar protocol' if user_lang != 'zh' else '无法被tar协议识别'))
         elif protocol == zipfile and not zipfile.is_zipfile(path):
             raise TypeError("%s" + ('Not recognized by zip protocol' if user_lang != 'zh' else '无法被zip协议识别'))
@@ -63,40 +82,556 @@ def checkIsProtocolFile(protocol, path):
         raise FileNotFoundError
 
 
+def _deflate_block(data: bytes, zdict: bytes, level: int, final: bool) -> bytes:
+    """
+    将一块数据压缩为raw deflate片段，非最后一块以Z_SYNC_FLUSH结尾，使各片段可以直接拼接
+
+    Compress one block into a raw deflate fragment; all but the last end with Z_SYNC_FLUSH so the fragments can be
+    concatenated as is
+
+    :param data: 数据
+    :param zdict: 预置字典（前一块末尾的数据）
+    :param level: 压缩等级
+    :param final: 是否为最后一块
+    :return: 压缩后的数据
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=zdict) if zdict else \
+        zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class DeflatePipeline:
+    def __init__(self, fp, threads: int = 0, level: int = 6):
+        """
+        pigz式的并行deflate流水线：数据按块提交到线程池压缩（zlib压缩时释放GIL），结果与回调按提交顺序写入fp，
+        在途块数有上限以限制内存
+
+        pigz-style parallel deflate pipeline: blocks are compressed in a thread pool (zlib releases the GIL) and the
+        results and callbacks are written to fp in submission order, with a bounded number of blocks in flight
+
+        :param fp: 输出文件对象
+        :param threads: 线程数，0表示CPU核数
+        :param level: 压缩等级
+        """
+        self.fp = fp
+        self.threads = threads or os.cpu_count() or 4
+        self.level = level
+        self.window = self.threads * 4
+        self.pool = ThreadPoolExecutor(max_workers=self.threads)
+        self.pending = deque()
+
+    def call(self, func):
+        """
+        在此前提交的数据全部写出后调用func(fp)
+
+        Call func(fp) once everything submitted before has been written
+
+        :param func: 回调
+        :return: None
+        """
+        self.pending.append((False, func))
+        self._drain()
+
+    def deflate(self, blocks):
+        """
+        压缩一段完整的deflate流
+
+        Compress one complete deflate stream
+
+        :param blocks: 数据块的迭代器
+        :return: (crc32, 原始大小)
+        """
+        crc, size, prev, zdict = 0, 0, None, b''
+        for block in blocks:
+            if prev is not None:
+                self._submit(prev, zdict, False)
+                zdict = prev[-dictSize:]
+            crc, size, prev = zlib.crc32(block, crc), size + len(block), block
+        self._submit(prev or b'', zdict, True)
+        return crc, size
+
+    def _submit(self, data: bytes, zdict: bytes, final: bool):
+        self.pending.append((True, self.pool.submit(_deflate_block, data, zdict, self.level, final)))
+        self._drain()
+
+    def _drain(self, wait: bool = False):
+        while self.pending:
+            is_data, item = self.pending[0]
+            if is_data and not item.done() and not wait and len(self.pending) <= self.window:
+                break
+            self.pending.popleft()
+            if is_data:
+                self.fp.write(item.result())
+            else:
+                item(self.fp)
+
+    def flush(self):
+        self._drain(True)
+
+    def close(self):
+        self.flush()
+        self.pool.shutdown()
+
+
+def read_blocks(fp, size: int = blockSize):
+    """
+    按块读取文件
+
+    Read a file block by block
+
+    :param fp: 文件对象
+    :param size: 块大小
+    :return: 数据块生成器
+    """
+    while True:
+        block = fp.read(size)
+        if not block:
+            return
+        yield block
+
+
+class ParallelGzipFile(io.RawIOBase):
+    def __init__(self, fileobj, level: int = 6, threads: int = 0):
+        """
+        多线程压缩的只写gzip流（输出为单个标准gzip成员，可被gzip/tar直接解压）
+
+        Write-only gzip stream compressed by several threads (the output is one standard gzip member readable by
+        gzip/tar)
+
+        :param fileobj: 输出文件对象
+        :param level: 压缩等级
+        :param threads: 线程数，0表示CPU核数
+        """
+        super().__init__()
+        self.fileobj = fileobj
+        self.pipeline = DeflatePipeline(fileobj, threads, level)
+        self.buffer = bytearray()
+        self.offset = 0
+        fileobj.write(b'\x1f\x8b\x08\x00' + struct.pack('<L', int(time.time())) +
+                      (b'\x02' if level == 9 else b'\x04' if level == 1 else b'\x00') + b'\xff')
+        self.crc, self.size, self.zdict, self.prev = 0, 0, b'', None
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.offset
+
+    def __del__(self):
+        pass  # * 只有显式close才写出尾部，出错后被回收时不再补写
+
+    def write(self, data) -> int:
+        self.buffer += data
+        self.offset += len(data)
+        while len(self.buffer) >= blockSize:
+            self._push(bytes(self.buffer[:blockSize]))
+            del self.buffer[:blockSize]
+        return len(data)
+
+    def _push(self, block: bytes):
+        if self.prev is not None:
+            self.pipeline._submit(self.prev, self.zdict, False)
+            self.zdict = self.prev[-dictSize:]
+        self.crc, self.size, self.prev = zlib.crc32(block, self.crc), self.size + len(block), block
+
+    def close(self):
+        if self.closed:
+            return
+        if self.buffer:
+            self._push(bytes(self.buffer))
+            self.buffer = bytearray()
+        self.pipeline._submit(self.prev or b'', self.zdict, True)
+        self.pipeline.call(lambda fp: fp.write(struct.pack('<LL', self.crc, self.size & 0xffffffff)))
+        self.pipeline.close()
+        super().close()
+
+
+class ParallelZipWriter:
+    def __init__(self, path: str, level: int = 6, threads: int = 0):
+        """
+        多线程zip写入：文件按块并行deflate，多个成员同时在途，压缩结果按添加顺序追加到zip中
+
+        Multi-threaded zip writer: files are deflated block-parallel with several members in flight, the compressed
+        data is appended to the zip in the order the files were added
+
+        :param path: zip路径或可写的文件对象（不可seek时使用data descriptor，可写入管道）
+        :param level: 压缩等级
+        :param threads: 线程数，0表示CPU核数
+        """
+        self.zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        self.pipeline = DeflatePipeline(self.zip.fp, threads, level)
+
+    def write(self, path: str, arcname: str = None):
+        """
+        添加文件
+
+        Add a file
+
+        :param path: 文件路径
+        :param arcname: 压缩包中的名称
+        :return: None
+        """
+        zinfo = zipfile.ZipInfo.from_file(path, arcname)
+        if zinfo.is_dir():
+            self.pipeline.call(lambda fp: self.zip.write(path, arcname))
+            return
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zinfo.CRC = zinfo.compress_size = 0
+        zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+        state = {}
+
+        # * 以下两个回调复刻 ZipFile._open_to_write 与 _ZipWriteFile.close：先写占位头，数据写完后回填CRC与大小
+        # * （输出不可seek时改为在数据后追加data descriptor）
+        def begin(fp):
+            if not self.zip._seekable:
+                zinfo.flag_bits |= 0x08
+            zinfo.header_offset = fp.tell()
+            self.zip._writecheck(zinfo)
+            self.zip._didModify = True
+            fp.write(zinfo.FileHeader(zip64))
+            state['start'] = fp.tell()
+
+        def end(fp):
+            zinfo.CRC, zinfo.file_size = state['crc'], state['size']
+            zinfo.compress_size = fp.tell() - state['start']
+            if not zip64 and max(zinfo.file_size, zinfo.compress_size) > zipfile.ZIP64_LIMIT:
+                raise RuntimeError('File size changed while compressing: %s' % path)
+            if self.zip._seekable:
+                self.zip.start_dir = fp.tell()
+                fp.seek(zinfo.header_offset)
+                fp.write(zinfo.FileHeader(zip64))
+                fp.seek(self.zip.start_dir)
+            else:
+                fp.write(struct.pack('<LLQQ' if zip64 else '<LLLL', 0x08074b50, zinfo.CRC, zinfo.compress_size,
+                                     zinfo.file_size))
+                self.zip.start_dir = fp.tell()
+            self.zip.filelist.append(zinfo)
+            self.zip.NameToInfo[zinfo.filename] = zinfo
+
+        self.pipeline.call(begin)
+        with open(path, 'rb') as f:
+            state['crc'], state['size'] = self.pipeline.deflate(read_blocks(f))
+        self.pipeline.call(end)
+
+    def close(self):
+        self.pipeline.close()
+        self.zip.close()
+
+
+def is_zstd_file(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(4) == zstdMagic
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ModuleNotFoundError('zstd needs `pip install zstandard`' if user_lang != 'zh' else
+                                  'zstd需要先安装zstandard: pip install zstandard')
+
+
+def open_tar_reader(fileobj) -> tarfile.TarFile:
+    """
+    以流模式打开tar，自动识别gz/bz2/xz/zstd/未压缩
+
+    Open a tar in stream mode, auto-detecting gz/bz2/xz/zstd/uncompressed
+
+    :param fileobj: 可读的二进制文件对象（需支持peek或seek）
+    :return: tarfile.TarFile
+    """
+    if hasattr(fileobj, 'peek'):
+        head = fileobj.peek(4)[:4]
+    else:
+        pos = fileobj.tell()
+        head = fileobj.read(4)
+        fileobj.seek(pos)
+    if head == zstdMagic:
+        _require_zstandard()
+        fileobj = zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=False)
+        return tarfile.open(fileobj=fileobj, mode='r|')
+    return tarfile.open(fileobj=fileobj, mode='r|*')
+
+
+def open_tar_writer(fileobj, codec: str = 'gz', level: int = None, threads: int = 0):
+    """
+    以流模式创建tar
+
+    Create a tar in stream mode
+
+    :param fileobj: 可写的二进制文件对象
+    :param codec: 'gz' | 'zstd' | 'xz' | 'none'
+    :param level: 压缩等级，None表示该编码的默认等级 (gz 6, zstd 3, xz 6)
+    :param threads: 压缩线程数，0表示CPU核数，1表示单线程（gz与zstd支持多线程）
+    :return: (tarfile.TarFile, 需要在tar之后依次关闭的流)
+    """
+    if codec not in tarCodecs:
+        raise ValueError('Unknown codec: %s, choose from %s' % (codec, ', '.join(tarCodecs)))
+    level = defaultLevels[codec] if level is None else level
+    if codec == 'gz':
+        stream = gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=level) if threads == 1 else \
+            ParallelGzipFile(fileobj, level, threads)
+    elif codec == 'zstd':
+        _require_zstandard()
+        # * zstandard的threads: 0为单线程，-1为CPU核数
+        stream = zstandard.ZstdCompressor(level=level, threads={0: -1, 1: 0}.get(threads, threads)) \
+            .stream_writer(fileobj, closefd=False)
+    elif codec == 'xz':
+        stream = lzma.LZMAFile(fileobj, 'wb', preset=level)
+    else:
+        stream = None
+    return tarfile.open(fileobj=stream or fileobj, mode='w|'), [stream] if stream else []
+
+
+def _member_name(info: zipfile.ZipInfo) -> str:
+    """
+    修正未标记UTF-8的zip成员名（按cp437读入的utf-8或gbk名称）
+
+    Fix zip member names without the UTF-8 flag (utf-8 or gbk names read as cp437)
+
+    :param info: ZipInfo
+    :return: 修正后的名称
+    """
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        raw = info.filename.encode('cp437')
+    except UnicodeEncodeError:
+        return info.filename
+    for encoding in ('utf-8', 'gbk'):
+        try:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+    return info.filename
+
+
+def _safe_path(dest: str, name: str) -> str:
+    """
+    与zipfile相同地去掉成员名中的盘符、绝对路径与'..'，得到dest下的目标路径
+
+    Strip drive letters, absolute roots and '..' from a member name the way zipfile does and join it under dest
+
+    :param dest: 解压目录
+    :param name: 成员名
+    :return: 目标路径，成员名为空时返回''
+    """
+    name = os.path.splitdrive(name.replace('\\', '/'))[1]
+    parts = [i for i in name.split('/') if i not in ('', os.path.curdir, os.path.pardir)]
+    return os.path.join(dest, *parts) if parts else ''
+
+
+def _preallocate(fd: int, size: int):
+    if size >= blockSize and hasattr(os, 'posix_fallocate'):  # * 小文件预分配得不偿失
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError:
+            pass
+
+
+def extract_zip(path: str, dest: str = '.', threads: int = 0):
+    """
+    并行解压zip：目录一次性批量创建，成员分批交给线程池，每个线程使用独立的ZipFile（独立文件句柄）解压
+
+    Parallel zip extraction: directories are created in one batch up front and members are handed to a thread
+    pool in batches, each thread decoding with its own ZipFile (its own file handle)
+
+    :param path: zip路径
+    :param dest: 解压目录
+    :param threads: 线程数，0表示CPU核数
+    :return: None
+    """
+    with zipfile.ZipFile(path) as zf:
+        infos = zf.infolist()
+    dirs, batches, batch, batch_size = {dest}, [], [], 0
+    for info in infos:
+        target = _safe_path(dest, _member_name(info))
+        if not target:
+            continue
+        if info.is_dir():
+            dirs.add(target)
+            continue
+        dirs.add(os.path.dirname(target))
+        batch.append((info, target))
+        batch_size += info.compress_size
+        if len(batch) >= 64 or batch_size >= 8 * blockSize:
+            batches.append(batch)
+            batch, batch_size = [], 0
+    if batch:
+        batches.append(batch)
+    for folder in sorted(dirs):
+        os.makedirs(folder, exist_ok=True)
+
+    local, opened, lock = threading.local(), [], threading.Lock()
+
+    def run(items: list):
+        zf = getattr(local, 'zip', None)
+        if zf is None:
+            zf = local.zip = zipfile.ZipFile(path)
+            with lock:
+                opened.append(zf)
+        for info, target in items:
+            with zf.open(info) as src, open(target, 'wb') as dst:
+                _preallocate(dst.fileno(), info.file_size)
+                shutil.copyfileobj(src, dst, blockSize)
+
+    try:
+        with ThreadPoolExecutor(max_workers=threads or os.cpu_count() or 4) as pool:
+            for _ in pool.map(run, batches):
+                pass
+    finally:
+        for zf in opened:
+            zf.close()
+
+
+def extract_tar(path_or_fileobj, dest: str = '.', threads: int = 0):
+    """
+    流式解压tar（'r|*'，只顺序读一遍压缩流）：父目录按需创建且每个目录只创建一次，小文件的写入交给线程池，
+    大文件边解压边写入预分配的文件，目录属性在最后设置；同名成员与硬链接会先等待目标路径上未完成的写入
+
+    Streaming tar extraction ('r|*', the compressed stream is read once in order): parent directories are created
+    on demand and only once each, small files are written by a thread pool, large files are written while
+    decompressing into preallocated files, and directory attributes are applied last; duplicate members and hard
+    links first wait for the pending write of the path they touch
+
+    :param path_or_fileobj: tar路径、可读的文件对象（gz/bz2/xz/zstd/未压缩自动识别）或已打开的TarFile
+    :param dest: 解压目录
+    :param threads: 写入线程数，0表示CPU核数
+    :return: None
+    """
+    threads = threads or os.cpu_count() or 4
+    data_filter = getattr(tarfile, 'data_filter', None)
+    made, dirs, pending = set(), [], {}
+    window = threading.BoundedSemaphore(threads * 4)
+
+    def mkdir(folder: str):
+        if folder not in made:
+            os.makedirs(folder, exist_ok=True)
+            made.add(folder)
+
+    def wait(path: str):
+        future = pending.pop(path, None)
+        if future:
+            future.result()
+
+    def write(member: tarfile.TarInfo, target: str, data: bytes):
+        try:
+            with open(target, 'wb') as dst:
+                dst.write(data)
+            tar.chmod(member, target)
+            tar.utime(member, target)
+        finally:
+            window.release()
+
+    raw = open(path_or_fileobj, 'rb') if isinstance(path_or_fileobj, str) else None
+    tar = path_or_fileobj if isinstance(path_or_fileobj, tarfile.TarFile) else open_tar_reader(raw or path_or_fileobj)
+    with tar, ThreadPoolExecutor(max_workers=threads) as pool:
+        for member in tar:
+            if data_filter:
+                member = data_filter(member, os.path.abspath(dest))
+            elif os.path.isabs(member.name) or os.path.pardir in member.name.replace('\\', '/').split('/'):
+                continue
+            target = os.path.normpath(os.path.join(dest, member.name))
+            if member.isdir():
+                mkdir(target)
+                dirs.append((member, target))
+                continue
+            wait(target)  # * 同名成员以归档中靠后的为准
+            mkdir(os.path.dirname(target) or dest)
+            if member.isreg():
+                if member.size < blockSize:
+                    window.acquire()
+                    pending[target] = pool.submit(write, member, target, tar.extractfile(member).read())
+                    continue
+                with tar.extractfile(member) as src, open(target, 'wb') as dst:
+                    _preallocate(dst.fileno(), member.size)
+                    shutil.copyfileobj(src, dst, blockSize)
+                tar.chmod(member, target)
+                tar.utime(member, target)
+            elif member.islnk():
+                # * 流式读取无法回退到链接目标的数据，只能在目标写完后从已解压的文件创建
+                source = os.path.normpath(os.path.join(dest, member.linkname))
+                wait(source)
+                if os.path.lexists(target):
+                    os.unlink(target)
+                try:
+                    os.link(source, target)
+                except OSError:
+                    shutil.copy2(source, target)
+                tar.chmod(member, target)
+                tar.utime(member, target)
+            else:
+                tar.extract(member, dest, set_attrs=True, **({'filter': 'fully_trusted'} if data_filter else {}))
+        for future in pending.values():
+            future.result()
+        for member, target in reversed(dirs):
+            tar.chmod(member, target)
+            tar.utime(member, target)
+    if raw:
+        raw.close()
+
+
 class _NormalCompressedPackage:
     """
     通用压缩协议类，如果你不懂它是做什么的，请不要调用它
 
     General compression protocol class, if you do not understand what it does, please do not call it
     """
-    def __init__(self, _protocol, path: str, mode='r'):
+    def __init__(self, _protocol, path: str, mode='r', threads: int = 0, codec: str = 'gz', level: int = None):
         """
         通用压缩协议类初始化
 
         General compression protocol class initialization
 
         :param _protocol: 压缩协议包 | General compression protocol packages
-        :param path: 压缩包路径 | compression package path
+        :param path: 压缩包路径，tar与zip也可以是文件对象（如sys.stdin.buffer / sys.stdout.buffer，调用者负责关闭）
+                     | compression package path; tar and zip also take a file object (e.g. sys.stdin.buffer /
+                     sys.stdout.buffer, closed by the caller)
         :param mode: 读写模式 | 'r' or 'w', which 'r' means read and 'w' means write
+        :param threads: 压缩/解压线程数（tar与zip），0表示CPU核数，1表示单线程 | compression/extraction threads
+                        (tar and zip), 0 means the number of CPU cores, 1 means single-threaded
+        :param codec: 创建tar时的压缩编码 'gz' | 'zstd' | 'xz' | 'none'，读取时自动识别 | codec for new tars,
+                      detected automatically when reading
+        :param level: 压缩等级，None表示编码的默认等级 | compression level, None means the codec default
         """
         self._protocol = _protocol
         self.path = path
+        self.threads = threads
+        self._streams = []  # * 需要在save时按顺序关闭的底层流
         if mode not in ('r', 'w'):
             raise ValueError("Requires mode 'r', 'w'")
-        if mode == 'r':
+        if mode == 'r' and not isinstance(path, str):
+            if _protocol != tarfile:
+                raise io.UnsupportedOperation('Only tar can be read from a stream' if user_lang != 'zh' else
+                                              '只有tar支持从流中读取')
+            self.src = open_tar_reader(path)
+            self.mode = True
+        elif mode == 'r':
             checkIsProtocolFile(_protocol, path)
             if _protocol == zipfile:
                 self.src = zipfile.ZipFile(path, 'r')
             elif _protocol == py7zr:
                 self.src = py7zr.SevenZipFile(path, 'r')
+            elif _protocol == tarfile and is_zstd_file(path):
+                self._streams = [open(path, 'rb')]
+                self.src = open_tar_reader(self._streams[0])
             else:
                 self.src = _protocol.open(path, 'r')
             self.mode = True
         elif mode == 'w':
-            if _protocol == tarfile:
-                self.src = _protocol.open(path, 'x:gz')
+            if _protocol == tarfile and not isinstance(path, str):
+                self.src, self._streams = open_tar_writer(path, codec, level, threads)
+            elif _protocol == tarfile:
+                raw = open(path, 'xb')
+                try:
+                    self.src, self._streams = open_tar_writer(raw, codec, level, threads)
+                except Exception:
+                    raw.close()
+                    os.remove(path)
+                    raise
+                self._streams.append(raw)
+            elif _protocol == zipfile and threads == 1:
+                self.src = _protocol.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
             elif _protocol == zipfile:
-                self.src = _protocol.ZipFile(path, 'w')
+                self.src = ParallelZipWriter(path, threads=threads)
             elif _protocol == rarfile:
                 raise NotImplementedError('qs not support to create rar file because `RarFile`')
             elif _protocol == py7zr:
@@ -129,7 +664,15 @@ class _NormalCompressedPackage:
         :return: None
         """
         if self.mode:
-            if self._protocol in [tarfile, rarfile, py7zr]:
+            if self._protocol == zipfile and self.threads != 1:
+                self.save()
+                return extract_zip(self.path, threads=self.threads)
+            elif self._protocol == tarfile and not isinstance(self.path, str):
+                extract_tar(self.src, threads=self.threads)
+            elif self._protocol == tarfile and self.threads != 1:
+                self.save()
+                return extract_tar(self.path, threads=self.threads)
+            elif self._protocol in [tarfile, rarfile, py7zr]:
                 self.src.extractall()
             elif self._protocol in [zipfile]:
                 from pathlib import Path
@@ -152,10 +695,12 @@ class _NormalCompressedPackage:
         :return: None
         """
         self.src.close()
+        for stream in self._streams:
+            stream.close()
 
 
 class Tar(_NormalCompressedPackage):
-    def __init__(self, path, mode='r'):
+    def __init__(self, path, mode='r', threads: int = 0, codec: str = 'gz', level: int = None):
         """
         Tar协议初始化
 
@@ -163,8 +708,11 @@ class Tar(_NormalCompressedPackage):
 
         :param path: 压缩包路径 | The package path is compressed.
         :param mode: 工作模式 | Working mode ('read' or 'write')
+        :param threads: 压缩/解压线程数，0表示CPU核数 | Compression/extraction threads, 0 means the number of CPU cores
+        :param codec: 压缩编码 'gz' | 'zstd' | 'xz' | 'none'（读取时自动识别） | Codec (detected when reading)
+        :param level: 压缩等级，None表示编码的默认等级 | Compression level, None means the codec default
         """
-        super().__init__(tarfile, path, mode)
+        super().__init__(tarfile, path, mode, threads, codec, level)
 
     def add_file(self, path):
         """
@@ -193,7 +741,7 @@ class Tar(_NormalCompressedPackage):
 
 
 class Zip(_NormalCompressedPackage):
-    def __init__(self, path, mode='r'):
+    def __init__(self, path, mode='r', threads: int = 0):
         """
         Zip协议初始化
 
@@ -201,8 +749,9 @@ class Zip(_NormalCompressedPackage):
 
         :param path: 压缩包路径 | The package path is compressed.
         :param mode: 工作模式 | Working mode ('read' or 'write')
+        :param threads: 压缩/解压线程数，0表示CPU核数 | Compression/extraction threads, 0 means the number of CPU cores
         """
-        super().__init__(zipfile, path, mode)
+        super().__init__(zipfile, path, mode, threads)
 
     def add_file(self, path):
         """
@@ -53,3 +53,34 @@ def sha256():
 @hashWrapper('sha512')
 def sha512():
     return hashlib.sha512()
+
+
+digestLength = {32: 'md5', 40: 'sha1', 64: 'sha256', 128: 'sha512'}
+
+
+def read_checksum_file(filePath: str) -> dict:
+    """
+    读取校验和文件（支持 "<hex>  <file>"、"<hex> *<file>" 与 "SHA256 (<file>) = <hex>" 格式），算法由摘要长度推断
+
+    Read a checksum file ("<hex>  <file>", "<hex> *<file>" and "SHA256 (<file>) = <hex>" formats), the algorithm
+    is inferred from the digest length
+
+    :param filePath: 校验和文件路径
+    :return: {文件名: (算法名, 摘要)}
+    """
+    import re
+    res = {}
+    with open(filePath, 'r') as f:
+        for line in f:
+            line = line.strip()
+            bsd = re.match(r'^\w+ \((.+)\) = ([0-9a-fA-F]+)$', line)
+            gnu = re.match(r'^([0-9a-fA-F]+) [ *](.+)$', line)
+            if bsd:
+                name, digest = bsd.groups()
+            elif gnu:
+                digest, name = gnu.groups()
+            else:
+                continue
+            if len(digest) in digestLength:
+                res[os.path.basename(name)] = (digestLength[len(digest)], digest.lower())
+    return res
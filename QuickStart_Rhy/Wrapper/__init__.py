@@ -35,24 +35,38 @@ def set_timeout(num: int):
 
 def mkCompressPackageWrap(func):
     """
-    创建压缩文件的通用函数装饰器, 被装饰的函数将被传递压缩文件名, 你需要返回:
+    创建压缩文件的通用函数装饰器, 被装饰的函数将被传递压缩文件名与压缩线程数(-j, 0表示CPU核数), 你需要返回:
         QuickStart_Rhy.SystemTools.Compress._NormalCompressedPackage
     的子类对象, 并将读写状态设为 写 状态
 
     General function decorator for creating compressed files, the decorated function will be passed the compressed file
-    name, which you need to return:
+    name and the number of compression threads (-j, 0 means the number of CPU cores), which you need to return:
+    (with `qs mk* - <paths>` the file name is replaced by the binary stdout, 压缩包名会被替换为二进制标准输出)
         QuickStart_Rhy.SystemTools.Compress._NormalCompressedPackage
     's sub object, and set read-write mode as write
 
-    :param func: func(filePath: str = '') -> QuickStart_Rhy.SystemTools.Compress._NormalCompressedPackage
-    :return: 装饰器 | wrapper
+    :param func: func(filePath: str = '', threads: int = 0, **kwargs) ->
+                 QuickStart_Rhy.SystemTools.Compress._NormalCompressedPackage
+    :return: 装饰器 | wrapper (其余关键字参数会被转交给func | extra keyword arguments are passed on to func)
     """
-    def wrapper():
+    def wrapper(**kwargs):
         import os
+        import sys
         from .. import dir_char
         from ..SystemTools.Compress import get_compress_package_name
+        threads = 0
+        for flag in ('-j', '--threads'):
+            if flag in sys.argv:
+                index = sys.argv.index(flag)
+                threads = int(sys.argv[index + 1])
+                sys.argv = sys.argv[:index] + sys.argv[index + 2:]
+        stream = sys.argv[2:3] == ['-']
+        if stream:  # * qs mk* - <paths>: 压缩包写到标准输出，提示信息改写到stderr
+            sys.argv.pop(2)
+            target = sys.stdout.buffer
+            sys.stdout = sys.stderr
         packages_name, ls = get_compress_package_name()
-        packages = func(packages_name)
+        packages = func(target if stream else packages_name, threads, **kwargs)
 
         def dfs(cur_p):
             if os.path.isfile(cur_p):
@@ -67,27 +81,35 @@ def mkCompressPackageWrap(func):
         for i in ls:
             dfs(i)
         packages.save()
+        if stream:
+            target.flush()
     return wrapper
 
 
 def unCompressPackageWrap(func):
     """
-    解压缩文件的通用函数装饰器, 被装饰的函数将被传递压缩文件名, 你需要返回:
+    解压缩文件的通用函数装饰器, 被装饰的函数将被传递压缩文件名与解压线程数(-j, 0表示CPU核数), 你需要返回:
         QuickStart_Rhy.SystemTools.Compress._NormalCompressedPackage
     的子类对象, 并将读写状态设为 读 状态
 
     General function decorator for extracting compressed files, the decorated function will be passed the compressed file
-    name, which you need to return:
+    name and the number of extraction threads (-j, 0 means the number of CPU cores), which you need to return:
         QuickStart_Rhy.SystemTools.Compress._NormalCompressedPackage
     's sub object, and set read-write mode as read
 
-    :param func: func(filePath: str = '') -> QuickStart_Rhy.SystemTools.Compress._NormalCompressedPackage
+    :param func: func(filePath: str = '', threads: int = 0) -> QuickStart_Rhy.SystemTools.Compress._NormalCompressedPackage
     :return: 装饰器 | wrapper
     """
     def wrapper():
         import os
         import sys
 
+        threads = 0
+        for flag in ('-j', '--threads'):
+            if flag in sys.argv:
+                index = sys.argv.index(flag)
+                threads = int(sys.argv[index + 1])
+                sys.argv = sys.argv[:index] + sys.argv[index + 2:]
         file_names = sys.argv[2:]
         if not file_names:
             exit("No enough parameters")
@@ -98,9 +120,9 @@ def unCompressPackageWrap(func):
         job_q = []
 
         def run(path):
-            if os.path.exists(path):
+            if path == '-' or os.path.exists(path):  # * '-' 表示从标准输入读取
                 try:
-                    cur_tar = func(path)
+                    cur_tar = func(path, threads)
                     cur_tar.extract()
                 except Exception as e:
                     qs_default_console.log(qs_error_string, repr(e))
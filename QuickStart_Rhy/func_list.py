@@ -53,10 +53,12 @@ def system_menu():
     print(color_rep("""System Tools help:
     qs top                   :-> cpu and memory monitor
     qs clear                 :-> free memory
-    qs mktar <path...>       :-> create gzipped archive for path
-    qs untar <path...>       :-> extract *.tar.*
-    qs mkzip <path...>       :-> make a zip for path
-    qs unzip <path...>       :-> extract *.zip file
+    qs mktar <path...> [-j n]:-> create gzipped archive for path (n compression threads, default all cores)
+                                 --codec gz|zstd|xz|none, --level <n>, '-' as first path writes to stdout
+                                 --put <url> -token <token>: upload to qs http while compressing
+    qs untar <path...> [-j n]:-> extract *.tar.* (gz/bz2/xz/zstd detected, streaming, n writer threads, '-' = stdin)
+    qs mkzip <path...> [-j n]:-> make a zip for path (n compression threads, default all cores)
+    qs unzip <path...> [-j n]:-> extract *.zip file (n extraction threads)
     qs unrar <path...>       :-> extract *.rar file
     qs mk7z  <path...>       :-> make a 7z archive for path
     qs un7z  <path...>       :-> extract *.7z file
@@ -67,10 +69,12 @@ def system_menu():
         if user_lang != 'zh' else print(color_rep("""系统工具:
     qs top                   :-> CPU和内存监控器
     qs clear                 :-> 清理本机内存
-    qs mktar <path...>       :-> 使用多个文件或文件夹创建tar压缩包
-    qs untar <path...>       :-> 解压各种格式的tar包
-    qs mkzip <path...>       :-> 使用多个文件或文件夹创建zip压缩包
-    qs unzip <path...>       :-> 解压zip压缩包
+    qs mktar <path...> [-j n]:-> 使用多个文件或文件夹创建tar压缩包 (n个压缩线程，默认全部核心)
+                                 --codec gz|zstd|xz|none 压缩编码, --level <n> 压缩等级, 首个路径为'-'时写到标准输出
+                                 --put <url> -token <令牌>: 边压缩边上传到qs http
+    qs untar <path...> [-j n]:-> 流式解压各种格式的tar包 (自动识别gz/bz2/xz/zstd, n个写入线程, '-'为标准输入)
+    qs mkzip <path...> [-j n]:-> 使用多个文件或文件夹创建zip压缩包 (n个压缩线程，默认全部核心)
+    qs unzip <path...> [-j n]:-> 解压zip压缩包 (n个解压线程)
     qs unrar <path...>       :-> 解压rar压缩包
     qs md5   <path...>       :-> 计算文件的md5值
     qs sha1 <path...>        :-> 计算文件sha1值
@@ -81,16 +85,24 @@ def system_menu():
 def net_menu():
     """网络类菜单 | Network menu"""
     print(color_rep("""Net Tools help:
-    qs http [ip] [-bind url] :-> start a multithread ftp server
+    qs http [ip] [-bind url] :-> start a multithread http server
+                                -j <n>: worker threads (default 64), -nocompress: no gzip/br/zstd
+                                -upload <token>: enable uploads, -log <file>: JSON lines access log
+                                -panel: live throughput panel (metrics at /__qs_metrics)
     qs netinfo [<domains>..] :-> get url's info which in clipboard or params 
     qs dl [urls] [-help]     :-> download file from url(in clipboard)
+    qs put <file> <url> -token <token> [-j n] :-> upload file to qs http in parallel chunks ('-' reads stdin)
     qs wifi                  :-> connect wifi
     qs upload                :-> upload your pypi library
     qs upgrade               :-> update qs""")) \
         if user_lang != 'zh' else print(color_rep("""网络工具:
     qs http [ip] [-bind url] :-> 在当前路径下开启多线程http服务
+                                -j <n>: 工作线程数（默认64）, -nocompress: 不压缩
+                                -upload <令牌>: 开启上传, -log <文件>: JSON lines访问日志
+                                -panel: 实时吞吐面板（指标见 /__qs_metrics）
     qs netinfo [<domains>..] :-> 获取命令参数或剪切板中链接或ip的信息 
     qs dl [urls]             :-> 从命令参数或剪切板中链接下载文件
+    qs put <文件> <url> -token <令牌> [-j n] :-> 将文件并行分块上传到qs http服务 ('-' 读取标准输入)
     qs wifi                  :-> 连接wifi
     qs upload                :-> 上传你的pypi仓库
     qs upgrade               :-> 更新qs"""))
@@ -202,6 +214,7 @@ net_funcs = {
     'self': 'nettools',
     'http': 'http',
     'dl': 'download',
+    'put': 'put',
     'wifi': 'wifi',
     'upgrade': 'upgrade',
     'upload': 'upload_pypi',
@@ -32,14 +32,21 @@ def upload_pypi():
     os.system('twine upload dist%s*' % dir_char)
 
 
-def m3u8_dl(url):
+def m3u8_dl(url, engine: str = 'thread', limiter=None, variant='highest', live: bool = False, concurrency: int = 0):
     """
     下载m3u8
 
     Download *.m3u8
     """
     from .NetTools.M3u8DL import M3U8DL
-    M3U8DL(url, url.split('.')[-2].split('/')[-1]).download()
+    from . import qs_default_console, qs_error_string
+    try:
+        M3U8DL(url, url.split('.')[-2].split('/')[-1], engine=engine,
+               concurrency=concurrency or (256 if engine == 'async' else 16), limiter=limiter,
+               variant=variant, live=live).download()
+    except (ConnectionError, ValueError) as e:
+        qs_default_console.print(qs_error_string, e)
+        sys.exit(1)
 
 
 def download():
@@ -53,36 +60,133 @@ def download():
         qs_default_console.print(
             qs_error_string, 'Usage: qs dl [url...]\n'
             '  [--video] | [-v]  :-> download video (use youtube-dl)\n'
-            '  [--proxy] | [-px] :-> use default proxy set in ~/.qsrc'
+            '  [--proxy] | [-px] :-> use default proxy set in ~/.qsrc\n'
+            '  [-i <file>]       :-> batch download urls listed in file (one per line, not with --async)\n'
+            '  [--mirror <url>]  :-> add a mirror of the (single) url, can be repeated\n'
+            '  [--md5 | --sha1 | --sha256 | --sha512 <hex>] :-> verify the download while downloading\n'
+            '  [--checksum-file <file>] :-> verify downloads with digests listed in file\n'
+            '  [--async]         :-> use the asyncio engine (hundreds of concurrent requests)\n'
+            '  [--limit <rate>]  :-> cap total speed, like 10M (default: download_rate_limit in ~/.qsrc)\n'
+            '  [--host-limit <rate>] :-> cap speed per host (default: download_host_rate_limit in ~/.qsrc)\n'
+            '  [--variant highest | lowest | <bitrate>] :-> m3u8 variant to download (default: highest)\n'
+            '  [--live]          :-> keep polling a live m3u8 and download new segments until it ends or Ctrl+C\n'
+            '  [-j <n>]          :-> max concurrent m3u8 segment requests (default: 16, 256 with --async)'
             if user_lang != 'zh' else
             '使用: qs -dl [链接...]\n'
             '  [--video] | [-v]  :-> 使用youtube-dl下载视频\n'
-            '  [--proxy] | [-px] :-> 使用配置表中的默认代理下载')
+            '  [--proxy] | [-px] :-> 使用配置表中的默认代理下载\n'
+            '  [-i <file>]       :-> 批量下载文件中列出的链接（每行一个，不能与--async同时使用）\n'
+            '  [--mirror <url>]  :-> 为（单个）链接添加镜像，可重复使用\n'
+            '  [--md5 | --sha1 | --sha256 | --sha512 <hex>] :-> 边下载边校验\n'
+            '  [--checksum-file <file>] :-> 使用校验和文件中的摘要校验下载结果\n'
+            '  [--async]         :-> 使用asyncio引擎（支持数百个并发请求）\n'
+            '  [--limit <rate>]  :-> 限制总速度，如10M（默认使用配置表中的download_rate_limit）\n'
+            '  [--host-limit <rate>] :-> 限制单个主机的速度（默认使用配置表中的download_host_rate_limit）\n'
+            '  [--variant highest | lowest | <bitrate>] :-> 选择m3u8的码率（默认最高）\n'
+            '  [--live]          :-> 持续轮询直播m3u8并下载新分片，直到直播结束或按下Ctrl+C\n'
+            '  [-j <n>]          :-> m3u8分片的最大并发请求数（默认16，使用--async时为256）')
         return
     global _real_main
     ytb_flag = '--video' in sys.argv or '-v' in sys.argv
     use_proxy = '--proxy' in sys.argv or '-px' in sys.argv
-    if ytb_flag or use_proxy:
-        [sys.argv.remove(i) if i in sys.argv else None for i in ['--video', '-v', '--proxy', '-px']]
+    engine = 'async' if '--async' in sys.argv else 'thread'
+    live = '--live' in sys.argv
+    if ytb_flag or use_proxy or engine == 'async' or live:
+        [sys.argv.remove(i) if i in sys.argv else None for i in ['--video', '-v', '--proxy', '-px', '--async', '--live']]
+    concurrency = 0
+    if '-j' in sys.argv:
+        index = sys.argv.index('-j')
+        concurrency = int(sys.argv[index + 1])
+        sys.argv = sys.argv[:index] + sys.argv[index + 2:]
+    variant = 'highest'
+    if '--variant' in sys.argv:
+        index = sys.argv.index('--variant')
+        variant = sys.argv[index + 1]
+        sys.argv = sys.argv[:index] + sys.argv[index + 2:]
+    url_file = ''
+    if '-i' in sys.argv:
+        index = sys.argv.index('-i')
+        url_file = sys.argv[index + 1]
+        sys.argv = sys.argv[:index] + sys.argv[index + 2:]
+        if engine == 'async':  # * 批量下载的连接数预算只对线程引擎生效
+            from . import user_lang, qs_default_console, qs_error_string
+            qs_default_console.print(qs_error_string, '-i does not support --async, use the thread engine'
+                                     if user_lang != 'zh' else '-i 不支持 --async，请使用线程引擎')
+            sys.exit(1)
+    checksum, checksum_file = None, ''
+    for algorithm in ['md5', 'sha1', 'sha256', 'sha512']:
+        if '--' + algorithm in sys.argv:
+            index = sys.argv.index('--' + algorithm)
+            checksum = (algorithm, sys.argv[index + 1])
+            sys.argv = sys.argv[:index] + sys.argv[index + 2:]
+    if '--checksum-file' in sys.argv:
+        index = sys.argv.index('--checksum-file')
+        checksum_file = sys.argv[index + 1]
+        sys.argv = sys.argv[:index] + sys.argv[index + 2:]
+    rate, host_rate = '', ''
+    if '--limit' in sys.argv:
+        index = sys.argv.index('--limit')
+        rate = sys.argv[index + 1]
+        sys.argv = sys.argv[:index] + sys.argv[index + 2:]
+    if '--host-limit' in sys.argv:
+        index = sys.argv.index('--host-limit')
+        host_rate = sys.argv[index + 1]
+        sys.argv = sys.argv[:index] + sys.argv[index + 2:]
+    mirrors = []
+    while '--mirror' in sys.argv:
+        index = sys.argv.index('--mirror')
+        mirrors.append(sys.argv[index + 1])
+        sys.argv = sys.argv[:index] + sys.argv[index + 2:]
     urls = sys.argv[2:]
+    if url_file:
+        with open(url_file, 'r') as f:
+            urls += [i.strip() for i in f.read().split('\n') if i.strip() and not i.strip().startswith('#')]
     if not urls:
         import pyperclip
         urls = pyperclip.paste().split()
     if urls:
         if ytb_flag:
             from youtube_dl import _real_main
-        from .NetTools.NormalDL import normal_dl
-        from . import qs_config
+        from .NetTools.NormalDL import normal_dl, batch_dl, DownloadError
+        from .NetTools.RateLimit import get_rate_limiter
+        from . import qs_config, user_lang, qs_default_console, qs_error_string
+        limiter = get_rate_limiter(rate, host_rate)
+        total, failed = len(urls), []
+        if mirrors and not ytb_flag:
+            try:
+                normal_dl([urls[0]] + mirrors,
+                          set_proxy=qs_config['basic_settings']['default_proxy'] if use_proxy else '',
+                          checksum=checksum, checksum_file=checksum_file, engine=engine, limiter=limiter)
+            except DownloadError as e:
+                qs_default_console.print(qs_error_string, e)
+                failed.append(urls[0])
+            urls = urls[1:]
+        if url_file and not ytb_flag:
+            failed += batch_dl([url for url in urls if not url.endswith('.m3u8')],
+                               set_proxy=qs_config['basic_settings']['default_proxy'] if use_proxy else '',
+                               checksum_file=checksum_file, limiter=limiter)
+            urls = [url for url in urls if url.endswith('.m3u8')]
         for url in urls:
             if url.endswith('.m3u8'):
-                m3u8_dl(url)
-            else:
+                m3u8_dl(url, engine, limiter, variant, live, concurrency)
+                continue
+            try:
                 if use_proxy:
-                    normal_dl(url, set_proxy=qs_config['basic_settings']['default_proxy']) \
+                    normal_dl(url, set_proxy=qs_config['basic_settings']['default_proxy'], checksum=checksum,
+                              checksum_file=checksum_file, engine=engine, limiter=limiter) \
                         if not ytb_flag else _real_main([url, '--proxy', qs_config['basic_settings']['default_proxy'],
                                                          '--merge-output-format', 'mp4'])
                 else:
-                    normal_dl(url) if not ytb_flag else _real_main([url, '--merge-output-format', 'mp4'])
+                    normal_dl(url, checksum=checksum, checksum_file=checksum_file, engine=engine, limiter=limiter) \
+                        if not ytb_flag else _real_main([url, '--merge-output-format', 'mp4'])
+            except DownloadError as e:
+                qs_default_console.print(qs_error_string, e)
+                failed.append(url)
+        if failed:
+            if total > 1:
+                qs_default_console.print(qs_error_string, '%d downloads failed:' % len(failed) if user_lang != 'zh'
+                                         else '%d个下载失败:' % len(failed), '\n' + '\n'.join(failed))
+            sys.exit(1)
     else:
         from . import user_lang, qs_default_console, qs_error_string
         qs_default_console.log(qs_error_string, "No url found!" if user_lang != 'zh' else '无链接输入')
@@ -94,7 +198,29 @@ def http():
 
     Turn on the http service.
     """
-    url = ''
+    url, workers, token, access_log = '', 64, '', ''
+    compress = '-nocompress' not in sys.argv
+    if not compress:
+        sys.argv.remove('-nocompress')
+    panel = '-panel' in sys.argv
+    if panel:
+        sys.argv.remove('-panel')
+    if '-log' in sys.argv:
+        index = sys.argv.index('-log')
+        access_log = sys.argv[index + 1] if index + 1 < len(sys.argv) else ''
+        if not access_log or access_log.startswith('-'):
+            exit('Usage: qs http [ip:port] -log <access.jsonl>')
+        sys.argv = sys.argv[:index] + sys.argv[index + 2:]
+    if '-upload' in sys.argv:
+        index = sys.argv.index('-upload')
+        token = sys.argv[index + 1] if index + 1 < len(sys.argv) else ''
+        if not token or token.startswith('-'):
+            exit('Usage: qs http [ip:port] -upload <token>')
+        sys.argv = sys.argv[:index] + sys.argv[index + 2:]
+    if '-j' in sys.argv:
+        index = sys.argv.index('-j')
+        workers = int(sys.argv[index + 1])
+        sys.argv = sys.argv[:index] + sys.argv[index + 2:]
     if len(sys.argv) > 2:
         ip, port = sys.argv[2].split(':')
         port = int(port)
@@ -113,7 +239,51 @@ def http():
     if not ip:
         exit('get ip failed!')
     from .NetTools.HttpServer import HttpServers
-    HttpServers(ip, port, url).start()
+    HttpServers(ip, port, url, workers, compress, token, access_log, panel).start()
+
+
+def put():
+    """
+    将文件并行分块上传到开启了上传接口的qs http服务
+
+    Upload a file in parallel chunks to a qs http server with the upload endpoint enabled
+    """
+    import os
+    from . import user_lang, qs_default_console, qs_error_string
+    args, num, chunk_size, token = [], 8, 8 << 20, ''
+    i = 2
+    while i < len(sys.argv):
+        if sys.argv[i] in ('-j', '-token', '-chunk') and i + 1 < len(sys.argv):
+            if sys.argv[i] == '-j':
+                num = int(sys.argv[i + 1])
+            elif sys.argv[i] == '-token':
+                token = sys.argv[i + 1]
+            else:
+                from .NetTools.RateLimit import parse_rate
+                chunk_size = int(parse_rate(sys.argv[i + 1]))
+            i += 2
+        else:
+            args.append(sys.argv[i])
+            i += 1
+    if len(args) != 2 or not token:
+        return qs_default_console.print(qs_error_string,
+                                        'Usage: qs put <file | -> <url> -token <token> [-j n] [-chunk 8M]'
+                                        if user_lang != 'zh' else
+                                        '用法: qs put <文件 | -> <url> -token <令牌> [-j 并行数] [-chunk 8M]')
+    if args[0] == '-':  # * 从标准输入流式上传，如 qs mktar - dir | qs put - <url> -token <token>
+        from .NetTools.Upload import upload_stream
+        if args[1].endswith('/'):
+            return qs_default_console.print(qs_error_string, 'A stream needs the full target url' if user_lang != 'zh'
+                                            else '流式上传需要完整的目标url')
+        if not upload_stream(sys.stdin.buffer, args[1], token):
+            exit(1)
+        return
+    if not os.path.isfile(args[0]):
+        return qs_default_console.print(qs_error_string, 'No such file:' if user_lang != 'zh' else '文件不存在:',
+                                        args[0])
+    from .NetTools.Upload import upload
+    if not upload(args[0], args[1], token, num, chunk_size):
+        exit(1)
 
 
 def netinfo():
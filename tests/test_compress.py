@@ -0,0 +1,61 @@
+import io
+import os
+import tarfile
+import threading
+
+from QuickStart_Rhy.SystemTools.Compress import extract_tar
+
+
+def _add(tar, name, data=b'', **kw):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    for k, v in kw.items():
+        setattr(info, k, v)
+    tar.addfile(info, io.BytesIO(data) if data else None)
+
+
+def _archive(mode='w:gz'):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode=mode) as tar:
+        for i in range(64):  # * 让线程池里积压足够多的小文件写入
+            _add(tar, 'd/f%d' % i, b'x' * 1000 * (i + 1))
+        _add(tar, 'd/target', b'linked content')
+        _add(tar, 'd/hard', type=tarfile.LNKTYPE, linkname='d/target')
+        for i in range(32):
+            _add(tar, 'd/dup', b'version %d' % i)
+        _add(tar, 'd/hard_to_dup', type=tarfile.LNKTYPE, linkname='d/dup')
+    return buf.getvalue()
+
+
+def _check(dest):
+    assert open(os.path.join(dest, 'd', 'hard'), 'rb').read() == b'linked content'
+    assert os.path.samefile(os.path.join(dest, 'd', 'hard'), os.path.join(dest, 'd', 'target'))
+    assert open(os.path.join(dest, 'd', 'dup'), 'rb').read() == b'version 31'
+    assert open(os.path.join(dest, 'd', 'hard_to_dup'), 'rb').read() == b'version 31'
+    for i in range(64):
+        assert os.path.getsize(os.path.join(dest, 'd', 'f%d' % i)) == 1000 * (i + 1)
+
+
+def test_extract_tar_hard_link_and_duplicate_from_path(tmp_path):
+    path = tmp_path / 'x.tar'
+    path.write_bytes(_archive('w'))
+    for _ in range(5):
+        dest = tmp_path / 'out'
+        extract_tar(str(path), str(dest), threads=4)
+        _check(str(dest))
+
+
+def test_extract_tar_hard_link_and_duplicate_from_stream(tmp_path):
+    data = _archive()
+    r, w = os.pipe()  # * 不可seek的输入，与 qs untar - 相同
+
+    def feed():
+        with os.fdopen(w, 'wb') as out:
+            out.write(data)
+
+    writer = threading.Thread(target=feed)
+    writer.start()
+    with os.fdopen(r, 'rb') as stream:
+        extract_tar(stream, str(tmp_path), threads=4)
+    writer.join()
+    _check(str(tmp_path))
@@ -0,0 +1,134 @@
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+from QuickStart_Rhy.NetTools.HttpServer import (DirectoryListingCache, PooledHTTPServer, QSHTTPRequestHandler,
+                                                UploadStore)
+
+
+@pytest.fixture
+def served(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(QSHTTPRequestHandler, 'quiet', True)
+    monkeypatch.setattr(QSHTTPRequestHandler, 'listings', DirectoryListingCache())
+    monkeypatch.setattr(QSHTTPRequestHandler, 'uploads', UploadStore())
+    server = PooledHTTPServer(('127.0.0.1', 0), QSHTTPRequestHandler, workers=2)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=10)
+    yield conn
+    conn.close()
+    server.shutdown()
+    server.server_close()
+
+
+def _request(conn, method, path, body=None, headers=None):
+    conn.request(method, path, body, headers or {})
+    res = conn.getresponse()
+    return res.status, res.read()
+
+
+def test_idle_keep_alive_connections_do_not_starve_the_pool(tmp_path, monkeypatch):
+    (tmp_path / 'a.txt').write_bytes(b'hello')
+    monkeypatch.chdir(tmp_path)
+    server = PooledHTTPServer(('127.0.0.1', 0), QSHTTPRequestHandler, workers=2)
+    monkeypatch.setattr(QSHTTPRequestHandler, 'quiet', True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    port = server.server_address[1]
+    try:
+        idle = []
+        for _ in range(2):  # * 两个保持空闲的长连接占满全部工作线程
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            conn.request('GET', '/a.txt')
+            assert conn.getresponse().read() == b'hello'
+            idle.append(conn)
+        begin = time.monotonic()
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        conn.request('GET', '/a.txt')
+        assert conn.getresponse().read() == b'hello'
+        assert time.monotonic() - begin < 3
+        conn.close()
+        for conn in idle:
+            conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_compression_cache_drops_stale_variants_and_caps_its_size(tmp_path):
+    import os
+    from QuickStart_Rhy.NetTools.HttpServer import CompressionCache
+    cache = CompressionCache(str(tmp_path / 'cache'), max_total=3000)
+    source = tmp_path / 'a.txt'
+    source.write_bytes(os.urandom(1000))
+    first = cache.get(str(source), os.stat(source), 'gzip')
+    source.write_bytes(os.urandom(1200))
+    second = cache.get(str(source), os.stat(source), 'gzip')
+    assert not os.path.exists(first) and os.path.exists(second)
+    others = []
+    for i in range(4):
+        other = tmp_path / ('b%d.txt' % i)
+        other.write_bytes(os.urandom(1000))
+        others.append(cache.get(str(other), os.stat(other), 'gzip'))
+    assert sum(os.path.getsize(tmp_path / 'cache' / i) for i in os.listdir(tmp_path / 'cache')) <= 3000
+    assert not os.path.exists(second) and os.path.exists(others[-1])
+    reloaded = CompressionCache(str(tmp_path / 'cache'), max_total=1500)
+    remaining = os.listdir(tmp_path / 'cache')
+    assert len(remaining) == 1 and reloaded.total == os.path.getsize(tmp_path / 'cache' / remaining[0])
+
+
+def test_precompressed_siblings_only_serve_compressible_types(served, tmp_path):
+    import gzip
+    (tmp_path / 'a.tar').write_bytes(b'tar' * 1000)
+    (tmp_path / 'a.tar.gz').write_bytes(gzip.compress(b'tar' * 1000))
+    (tmp_path / 'a.txt').write_bytes(b'txt' * 1000)
+    (tmp_path / 'a.txt.gz').write_bytes(gzip.compress(b'txt' * 1000))
+    served.request('GET', '/a.tar', headers={'Accept-Encoding': 'gzip'})
+    res = served.getresponse()
+    assert res.getheader('Content-Encoding') is None and res.read() == b'tar' * 1000
+    served.request('GET', '/a.txt', headers={'Accept-Encoding': 'gzip'})
+    res = served.getresponse()
+    assert res.getheader('Content-Encoding') == 'gzip' and gzip.decompress(res.read()) == b'txt' * 1000
+
+
+def test_directory_listing_pages(served, tmp_path):
+    for i in range(25):
+        (tmp_path / ('f%02d' % i)).write_bytes(b'x' * i)
+    (tmp_path / 'sub').mkdir()
+    status, body = _request(served, 'GET', '/?format=json&page=2&size=10')
+    listing = json.loads(body)
+    assert status == 200 and (listing['page'], listing['pages'], listing['size'], listing['total']) == (2, 3, 10, 26)
+    assert [i['name'] for i in listing['entries']] == ['f%02d' % i for i in range(10, 20)]
+    assert listing['entries'][3]['size'] == 13
+    status, body = _request(served, 'GET', '/?page=3&size=10')
+    assert status == 200 and b'href="sub/"' in body and b'f19' not in body
+    assert b'?page=2&size=10' in body and b'?page=4' not in body
+    status, body = _request(served, 'GET', '/?page=9&size=10', headers={'Accept': 'application/json'})
+    assert status == 200 and json.loads(body)['entries'] == []
+    assert _request(served, 'GET', '/?page=x')[0] == 400
+
+
+def test_put_resumes_across_span_gaps(served, tmp_path, monkeypatch):
+    import os
+    monkeypatch.setattr(QSHTTPRequestHandler, 'upload_token', 'secret')
+    auth, data = {'Authorization': 'Bearer secret'}, os.urandom(300)
+
+    def put(start, end):
+        return _request(served, 'PUT', '/up/a.bin', data[start:end],
+                        dict(auth, **{'Content-Range': 'bytes %d-%d/300' % (start, end - 1)}))
+
+    status, body = put(200, 300)
+    assert status == 202 and json.loads(body)['received'] == [[200, 300]]
+    status, body = put(0, 50)
+    assert status == 202 and json.loads(body)['received'] == [[0, 50], [200, 300]]
+    monkeypatch.setattr(QSHTTPRequestHandler, 'uploads', UploadStore())  # * 服务重启后从 .qs_upload.json 恢复
+    status, body = _request(served, 'GET', '/up/a.bin?upload', headers=auth)
+    assert status == 200 and json.loads(body) == {'size': 300, 'received': [[0, 50], [200, 300]], 'complete': False}
+    status, body = put(40, 210)
+    assert status == 201 and json.loads(body)['complete']
+    assert (tmp_path / 'up' / 'a.bin').read_bytes() == data
+    assert sorted(os.listdir(tmp_path / 'up')) == ['a.bin']
+    assert _request(served, 'PUT', '/up/a.bin', b'x', {'Content-Range': 'bytes 0-0/300'})[0] == 401
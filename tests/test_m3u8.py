@@ -0,0 +1,130 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from QuickStart_Rhy.NetTools.M3u8DL import M3U8DL, AES128Decryptor, OrderedWriter, parse_media_playlist
+
+
+def test_ordered_writer_resume_through_spool(tmp_path):
+    path = tmp_path / 'video.ts'
+    path.write_bytes(b'segment0')
+    writer = OrderedWriter(str(path), max_buffer=0, start=1)  # * max_buffer=0：乱序分片全部转存到临时文件
+    assert writer.put(3, b'segment3') == 0
+    assert writer.put(2, b'segment2') == 0
+    assert writer.put(1, b'segment1') == 3
+    writer.put(4, b'segment4')
+    writer.close()
+    assert path.read_bytes() == b'segment0segment1segment2segment3segment4'
+
+
+def test_ordered_writer_resume_creates_missing_output(tmp_path):
+    path = tmp_path / 'video.ts'
+    writer = OrderedWriter(str(path), max_buffer=0, start=1)
+    writer.put(2, b'b')
+    writer.put(1, b'a')
+    writer.close()
+    assert path.read_bytes() == b'ab'
+
+
+def _encrypt(key, iv, data):
+    from cryptography.hazmat.primitives import padding
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    padder = padding.PKCS7(128).padder()
+    encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+    return encryptor.update(padder.update(data) + padder.finalize()) + encryptor.finalize()
+
+
+class _Segments(BaseHTTPRequestHandler):
+    missing = set()
+    key, iv = b'', b''  # * 非空时分片用AES-128加密，播放列表带显式IV
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == '/index.m3u8':
+            body = ('#EXTM3U\n#EXT-X-TARGETDURATION:1\n'
+                    + ('#EXT-X-KEY:METHOD=AES-128,URI="key.bin",IV=0x%s\n' % self.iv.hex() if self.key else '')
+                    + ''.join('#EXTINF:1,\n%d.ts\n' % i for i in range(6)) + '#EXT-X-ENDLIST\n').encode()
+        elif self.path == '/key.bin':
+            body = self.key
+        elif self.path[1:-3] not in self.missing:
+            body = b'segment' + self.path[1:-3].encode()
+            if self.key:
+                body = _encrypt(self.key, self.iv, body * 10)
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def playlist(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Segments)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield 'http://127.0.0.1:%d/index.m3u8' % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize('engine', ['thread', 'async'])
+def test_failed_segment_is_not_written_and_resumes(playlist, tmp_path, monkeypatch, engine):
+    monkeypatch.setattr(_Segments, 'missing', {'2'})
+    monkeypatch.setattr(M3U8DL, 'backoff', lambda self, attempt: 0)
+    with pytest.raises(ConnectionError):
+        M3U8DL(playlist, 'video', engine=engine, concurrency=2, retries=2).download()
+    assert (tmp_path / 'video.ts').read_bytes() == b'segment0segment1'
+    assert (tmp_path / 'video.ts.qs_m3u8').exists()
+    monkeypatch.setattr(_Segments, 'missing', set())
+    M3U8DL(playlist, 'video', engine=engine, concurrency=2).download()
+    assert (tmp_path / 'video.ts').read_bytes() == b''.join(b'segment%d' % i for i in range(6))
+    assert not (tmp_path / 'video.ts.qs_m3u8').exists()
+
+
+@pytest.mark.parametrize('engine', ['thread', 'async'])
+def test_write_error_does_not_hang(playlist, monkeypatch, engine):
+    def put(self, index, data, sequence=-1):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(OrderedWriter, 'put', put)
+    with pytest.raises(OSError, match='disk full'):
+        M3U8DL(playlist, 'video', engine=engine, concurrency=1).download()
+
+
+def test_unsupported_key_method_is_a_value_error():
+    content = '#EXTM3U\n#EXT-X-KEY:METHOD=SAMPLE-AES,URI="k"\n#EXTINF:1,\n0.ts\n'
+    with pytest.raises(ValueError, match='SAMPLE-AES'):
+        parse_media_playlist(content, 'http://127.0.0.1/index.m3u8')
+
+
+def test_key_iv_is_parsed_and_defaults_to_the_sequence_number():
+    content = ('#EXTM3U\n#EXT-X-MEDIA-SEQUENCE:7\n#EXT-X-KEY:METHOD=AES-128,URI="k1",IV=0x1F\n#EXTINF:1,\n0.ts\n'
+               '#EXT-X-KEY:METHOD=AES-128,URI="k2"\n#EXTINF:1,\n1.ts\n#EXT-X-KEY:METHOD=NONE\n#EXTINF:1,\n2.ts\n')
+    segments, _, _ = parse_media_playlist(content, 'http://127.0.0.1/a/index.m3u8')
+    assert [i[2] for i in segments] == [('http://127.0.0.1/a/k1', bytes(15) + b'\x1f'),
+                                        ('http://127.0.0.1/a/k2', (8).to_bytes(16, 'big')), None]
+
+
+def test_aes128_decryptor_streams_with_explicit_iv():
+    pytest.importorskip('cryptography')
+    key, iv, plain = bytes(range(16)), bytes(range(100, 116)), bytes(range(256)) * 3 + b'tail'
+    secret = _encrypt(key, iv, plain)
+    decryptor = AES128Decryptor(key, iv)
+    res = b''.join(decryptor.update(secret[i:i + 7]) for i in range(0, len(secret), 7)) + decryptor.finalize()
+    assert res == plain
+    decryptor = AES128Decryptor(key, (0).to_bytes(16, 'big'))
+    assert decryptor.update(secret) + decryptor.finalize() != plain
+
+
+@pytest.mark.parametrize('engine', ['thread', 'async'])
+def test_encrypted_playlist_with_explicit_iv(playlist, tmp_path, monkeypatch, engine):
+    pytest.importorskip('cryptography')
+    monkeypatch.setattr(_Segments, 'key', bytes(range(16)))
+    monkeypatch.setattr(_Segments, 'iv', bytes(range(100, 116)))
+    M3U8DL(playlist, 'video', engine=engine, concurrency=2).download()
+    assert (tmp_path / 'video.ts').read_bytes() == b''.join(b'segment%d' % i * 10 for i in range(6))
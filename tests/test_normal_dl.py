@@ -0,0 +1,128 @@
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from QuickStart_Rhy.NetTools.NormalDL import Downloader, DownloadError, _Segment
+from QuickStart_Rhy.NetTools.AsyncDL import AsyncDownloader
+
+SIZE = 6 << 20  # * 5MB以下的文件不走分段下载
+
+
+class _Files(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    files = {}  # * path -> [data, etag]
+    broken = set()  # * HEAD正常、GET返回500的路径
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        if not head and self.path in self.broken:
+            self.send_error(500)
+            return
+        data, etag = self.files[self.path]
+        start, end = 0, len(data)
+        m = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range')
+        # * RFC 7233：If-Range只用强比较，弱ETag永远不匹配
+        partial = m and (if_range is None or (if_range == etag and not etag.startswith('W/')))
+        if partial:
+            start, end = int(m.group(1)), int(m.group(2)) + 1
+        self.send_response(206 if partial else 200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(end - start))
+        if partial:
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end - 1, len(data)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(data[start:end])
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(_Files, 'files', {})
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Files)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield 'http://127.0.0.1:%d' % httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize('engine', [Downloader, AsyncDownloader])
+def test_weak_etag_is_not_sent_as_if_range(server, tmp_path, engine):
+    data = os.urandom(SIZE)
+    _Files.files['/weak.bin'] = [data, 'W/"abc"']
+    engine(server + '/weak.bin', 4).run()
+    assert (tmp_path / 'weak.bin').read_bytes() == data
+    assert not (tmp_path / 'weak.bin.qs_dl').exists()
+
+
+@pytest.mark.parametrize('stream', [True, False])
+def test_async_engine_with_writer_pool_and_checksum(server, tmp_path, stream):
+    import hashlib
+    data = os.urandom(SIZE)
+    _Files.files['/sum.bin'] = [data, '"sum"']
+    AsyncDownloader(server + '/sum.bin', 8, stream=stream, checksum=('sha256', hashlib.sha256(data).hexdigest())).run()
+    assert (tmp_path / 'sum.bin').read_bytes() == data
+
+
+def _scheduler(num, speed=None):
+    dl = Downloader.__new__(Downloader)
+    dl.num, dl.changed, dl.schedLock, dl.pending, dl.active = num, False, threading.Lock(), [], {}
+    dl.speed = speed or [0.0] * num
+    return dl
+
+
+def _spans(segments):
+    return [(seg.cur, seg.end) for seg in segments]
+
+
+def test_split_gives_every_worker_a_segment():
+    assert _spans(_scheduler(4)._split([_Segment(0, 10)])) == [(0, 3), (3, 6), (6, 8), (8, 10)]
+    assert _spans(_scheduler(4)._split([_Segment(0, 2), _Segment(10, 18)])) == [(0, 2), (10, 13), (13, 16), (16, 18)]
+
+
+def test_next_segment_prefers_pending_then_steals_by_throughput():
+    dl = _scheduler(3, [10.0, 1.0, 0.0])
+    dl.pending = [_Segment(5, 7), _Segment(10, 20)]
+    assert _spans([dl._next_segment(2)]) == [(10, 20)] and _spans(dl.pending) == [(5, 7)]
+    dl = _scheduler(3, [10.0, 1.0, 0.0])
+    dl.active = {0: _Segment(0, 10), 1: _Segment(20, 30)}
+    assert _spans([dl._next_segment(2)]) == [(25, 30)]  # * 预计最晚完成的是慢线程1，未测速时对半分
+    assert _spans([dl.active[1]]) == [(20, 25)]
+    dl = _scheduler(2, [1.0, 3.0])
+    dl.active = {0: _Segment(0, 100)}
+    assert _spans([dl._next_segment(1)]) == [(25, 100)]  # * 按吞吐量比例 3:1 拆分
+    dl.active = {0: _Segment(0, 1)}
+    assert dl._next_segment(1) is None
+    dl.active, dl.changed = {0: _Segment(0, 100)}, True
+    assert dl._next_segment(1) is None
+
+
+@pytest.mark.parametrize('engine', [Downloader, AsyncDownloader])
+def test_remote_change_is_detected_by_if_range(server, tmp_path, engine):
+    _Files.files['/changed.bin'] = [os.urandom(SIZE), '"v1"']
+    downloader = engine(server + '/changed.bin', 4)
+    _Files.files['/changed.bin'] = [os.urandom(SIZE), '"v2"']
+    with pytest.raises(DownloadError):
+        downloader.run()
+    assert not (tmp_path / 'changed.bin.qs_dl').exists()
+
+
+@pytest.mark.parametrize('engine', [Downloader, AsyncDownloader])
+def test_broken_mirror_fails_over(server, tmp_path, monkeypatch, engine):
+    data = os.urandom(SIZE)
+    _Files.files['/a.bin'] = _Files.files['/b.bin'] = [data, '"m"']
+    monkeypatch.setattr(_Files, 'broken', {'/b.bin'})
+    downloader = engine([server + '/a.bin', server + '/b.bin'], 4)
+    downloader.run()
+    assert (tmp_path / 'a.bin').read_bytes() == data
+    assert [mirror.dead for mirror in downloader.mirrors] == [False, True]
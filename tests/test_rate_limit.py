@@ -0,0 +1,52 @@
+import pytest
+
+from QuickStart_Rhy.NetTools import RateLimit
+from QuickStart_Rhy.NetTools.RateLimit import RateLimiter, TokenBucket, parse_rate
+
+
+@pytest.mark.parametrize('rate, expected', [
+    ('', 0), (2048, 2048), ('500', 500), ('500K', 500e3), ('1.5M', 1.5e6), ('2GB/s', 2e9), ('10kb', 10e3),
+    ('10KiB', 10240), ('1MiB/s', 1 << 20), ('1.5 GiB', 1.5 * (1 << 30)), ('100B/s', 100),
+])
+def test_parse_rate(rate, expected):
+    assert parse_rate(rate) == expected
+
+
+@pytest.mark.parametrize('rate', ['fast', '10X', 'iB', '10iB', 'M', '1.2.3K'])
+def test_parse_rate_rejects_garbage(rate):
+    with pytest.raises(ValueError):
+        parse_rate(rate)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(RateLimit.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_token_bucket_overdraws_then_refills(clock):
+    bucket = TokenBucket(1000)
+    assert bucket.capacity == 100
+    assert bucket.reserve(100) == 0
+    assert bucket.reserve(500) == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert bucket.reserve(0) == 0
+    clock[0] += 10  # * 空闲期间令牌不超过桶容量
+    assert bucket.reserve(100) == 0
+    assert bucket.reserve(100) == pytest.approx(0.1)
+
+
+def test_token_bucket_long_run_rate(clock):
+    bucket, sent = TokenBucket(1 << 20), 0
+    for _ in range(1000):
+        clock[0] += bucket.reserve(1 << 16)
+        sent += 1 << 16
+    assert sent / (clock[0] - 100) == pytest.approx(1 << 20, rel=0.01)
+
+
+def test_rate_limiter_takes_the_slower_bucket_per_host(clock):
+    limiter = RateLimiter(1000, host_rate=100, host_rates={'fast.example': 10000})
+    assert limiter.delay('http://slow.example/a', 110) == pytest.approx(1)
+    assert limiter.delay('http://fast.example/a', 100) == pytest.approx(0.11)
+    assert set(limiter.hosts) == {'slow.example', 'fast.example'}